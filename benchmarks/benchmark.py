@@ -0,0 +1,291 @@
+"""Offline benchmarks of the lookups and the pipelines.
+
+The recorded Overpass responses (the joblib cache of cached_requests/raw_cache,
+or JSON fixtures holding Overpass responses) are merged into an in-memory
+extract. A stub transport answers every query from that extract, so the
+timings exclude the network and the request counts are the ones a cold cache
+sends to the API. Each case reports its time, throughput, peak memory and
+requests.
+
+    python benchmarks/benchmark.py --sizes 10,1000,50000 --output bench.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "user_interface"))
+# config.yaml and the cache are read from the working directory.
+os.chdir(ROOT)
+
+import httpx  # noqa: E402
+import joblib  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from package import pipeline_multi, pipeline_uni  # noqa: E402
+from package import metrics  # noqa: E402
+from package.API import get_nearest_city  # noqa: E402
+from package.API.boundary_index import BoundaryIndex  # noqa: E402
+from package.API.get_nearest_street import get_nearest_street  # noqa: E402
+from package.API.get_ways_from_node import get_ways_from_node  # noqa: E402
+from package.API.place_index import PlaceIndex  # noqa: E402
+from package.supercharged_requests import projection, supercharged_requests, transport  # noqa: E402
+from package.supercharged_requests.local_backend import OSMExtract  # noqa: E402
+from package.utils import utils  # noqa: E402
+
+def load_recorded(filenames: List[str]) -> OSMExtract:
+    """Merge the elements of recorded responses into an indexed extract.
+
+    :param filenames: joblib caches (query -> response) or JSON files holding
+    a response or a list of responses. The compact responses of a cache keep
+    the tags the queries filter on, they replay like full ones.
+
+    return extract: extract answering the queries of the package
+    """
+    extract = OSMExtract()
+    nodes, ways, relations = dict(), dict(), dict()
+    for filename in filenames:
+        if filename.endswith(".json"):
+            with open(filename) as file:
+                responses = json.load(file)
+            responses = responses if isinstance(responses, list) else [responses]
+        else:
+            responses = [projection.expand(value) for value in joblib.load(filename).values()]
+        for response in responses:
+            for element in response.get("elements", ()):
+                if element["type"] == "node":
+                    node = nodes.setdefault(element["id"], [element["lat"], element["lon"], {}])
+                    node[2].update(element.get("tags", {}))
+                elif element["type"] == "way":
+                    ways[element["id"]] = element
+                    for id_node, vertex in zip(element["nodes"], element.get("geometry", ())):
+                        nodes.setdefault(id_node, [vertex["lat"], vertex["lon"], {}])
+                elif element["type"] == "relation":
+                    relations[element["id"]] = element
+    for id_node, (latitude, longitude, tags) in nodes.items():
+        extract.add_node(id_node, latitude, longitude, tags)
+    for id_way, way in ways.items():
+        extract.add_way(id_way, way["nodes"], way.get("tags", {}))
+    for id_relation, relation in relations.items():
+        extract.add_relation(id_relation, [(member["type"], member["ref"], member.get("role", ""))
+                                           for member in relation.get("members", ())],
+                             relation.get("tags", {}))
+    extract.build_index()
+    return extract
+
+
+class StubTransport:
+    """Transport answering the queries from an extract, counting the requests."""
+
+    def __init__(self, extract: OSMExtract):
+        """Create the stub, install it with install."""
+        self.extract = extract
+        self.requests = 0
+
+    def _response(self, url: str, params: Dict) -> httpx.Response:
+        self.requests += 1
+        return httpx.Response(200, json=self.extract.execute(params["data"]),
+                              request=httpx.Request("GET", url))
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        """Stub of transport.get."""
+        return self._response(url, kwargs["params"])
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        """Stub of transport.aget."""
+        return self._response(url, kwargs["params"])
+
+    def install(self) -> None:
+        """Send the requests of the package to the stub."""
+        transport.get = self.get
+        transport.aget = self.aget
+
+
+def reset_state(stub: StubTransport) -> None:
+    """Start a case cold: empty cache, street graphs and place indexes."""
+    supercharged_requests.backend = "overpass"
+    supercharged_requests.cache_dict = dict()
+    utils._street_graph.cache_clear()  # pylint: disable=protected-access
+    get_nearest_city.place_index = PlaceIndex(get_nearest_city.place_index.region_size)
+    get_nearest_city.boundary_index = BoundaryIndex(get_nearest_city.boundary_index.region_size)
+    stub.requests = 0
+
+
+def named_ways(extract: OSMExtract) -> List[List[Tuple[float, float]]]:
+    """Vertices of the named ways of the extract."""
+    return [coordinates for id_way, tags in extract.way_tags.items()
+            if "name" in tags and len(coordinates := extract.way_coordinates(id_way)) > 1]
+
+
+def anchor_points(ways: List[List[Tuple[float, float]]], count: int = 2000,
+                  seed: int = 0) -> Dict[int, List[Tuple[float, float]]]:
+    """Random points a few meters away from the named ways, grouped by nearest street.
+
+    The recorded responses only hold the intersections of the streets the
+    package looked up, so points whose nearest street has no section are
+    dropped.
+
+    return anchors: points by OSM id of their nearest street, the street
+    with the most sections first
+    """
+    generator = random.Random(seed)
+    anchors, sections = dict(), dict()
+    for _ in range(count):
+        way = generator.choice(ways)
+        index = generator.randrange(len(way) - 1)
+        ratio = generator.random()
+        (latitude_1, longitude_1), (latitude_2, longitude_2) = way[index], way[index + 1]
+        point = (round(latitude_1 + ratio * (latitude_2 - latitude_1) + generator.uniform(-4e-5, 4e-5), 7),
+                 round(longitude_1 + ratio * (longitude_2 - longitude_1) + generator.uniform(-4e-5, 4e-5), 7))
+        street = get_nearest_street(*point)
+        if street["id"] not in sections:
+            sections[street["id"]] = len(utils.get_street_graph(street))
+        if sections[street["id"]]:
+            anchors.setdefault(street["id"], []).append(point)
+    return dict(sorted(anchors.items(), key=lambda item: -sections[item[0]]))
+
+
+def sample_points(anchors: Dict[int, List[Tuple[float, float]]], count: int, seed: int = 0,
+                  pairs: bool = False) -> List:
+    """Points drawn from the anchors, a street at a time.
+
+    Moving the anchors could change their nearest street, so larger samples
+    repeat anchors. With pairs, return count pairs of points of the same street.
+    """
+    generator = random.Random(seed)
+    streets = list(anchors.values())
+    if pairs:
+        return [(generator.choice(street), generator.choice(street))
+                for street in (generator.choice(streets) for _ in range(count))]
+    return [generator.choice(generator.choice(streets)) for _ in range(count)]
+
+
+def street_with_points(anchors: Dict[int, List[Tuple[float, float]]], size: int):
+    """Street graph of the street with the most sections and points along it."""
+    id_way, points = next(iter(anchors.items()))
+    street = get_nearest_street(*points[0])
+    return utils.get_street_graph(street), sample_points({id_way: points}, size)
+
+
+def cases(anchors, size: int) -> Dict[str, Tuple[Callable, Callable]]:
+    """Setup and run functions of the cases at a size, the run gets the setup output.
+
+    :param anchors: output of anchor_points, the points are drawn from.
+    :param size: number of points, or of nodes for get_ways_from_node.
+    """
+    map_filename = os.path.join(tempfile.gettempdir(), "benchmark_map.html")
+
+    def ways_from_node_setup():
+        nodes = get_nearest_street(*next(iter(anchors.values()))[0])["nodes"]
+        return (nodes * (size // len(nodes) + 1))[:size]
+
+    def road_sections_setup():
+        way = get_nearest_street(*next(iter(anchors.values()))[0])
+        intersections = get_ways_from_node(way["nodes"])
+        return (intersections * (size // len(intersections) + 1))[:size], way["tags"]["name"]
+
+    def results_page_setup():
+        graph, points = street_with_points(anchors, size)
+        sections = graph.nearest_sections(points)
+        results = pd.DataFrame(
+            [[latitude, longitude, graph.road_name, section.start_name, section.end_name, 1, "Ville"]
+             for (latitude, longitude), section in zip(points, sections)],
+            columns=['latitude', 'longitude', 'rue', 'debut_troncon', 'fin_troncon', 'num_arbre', 'ville'])
+        return results, [[point, section, graph] for point, section in zip(points, sections)]
+
+    def results_page_run(setup):
+        results, list_data = setup
+        utils.visualisation_sections(list_data, map_filename)
+        utils.results_fragments(results, map_filename)
+
+    return {
+        "get_nearest_street": (lambda: sample_points(anchors, size),
+                               lambda points: [get_nearest_street(*point) for point in points]),
+        "get_ways_from_node": (ways_from_node_setup, lambda nodes: get_ways_from_node(nodes)),
+        "get_road_sections": (road_sections_setup, lambda setup: utils.get_road_sections(*setup)),
+        "distance_from_segment": (lambda: street_with_points(anchors, size),
+                                  lambda setup: [utils.find_optimal(utils.distance_from_segment(point, setup[0]))
+                                                 for point in setup[1]]),
+        "pipeline_uni": (lambda: sample_points(anchors, size),
+                         lambda points: pipeline_uni(points, map_filename=None)),
+        "pipeline_multi": (lambda: sample_points(anchors, max(1, size // 2), pairs=True),
+                           lambda pairs: pipeline_multi(pairs, map_filename=None)),
+        "results_page": (results_page_setup, results_page_run),
+    }
+
+
+def measure(stub: StubTransport, setup: Callable, run: Callable, memory: bool) -> Dict:
+    """Time a cold run, then measure the peak memory of a second cold run."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _measure(stub, setup, run, memory)
+
+
+def _measure(stub: StubTransport, setup: Callable, run: Callable, memory: bool) -> Dict:
+    reset_state(stub)
+    prepared = setup()
+    stub.requests = 0
+    hits = metrics.cache_lookups.value(result="hit")
+    start = time.perf_counter()
+    run(prepared)
+    elapsed = time.perf_counter() - start
+    result = {"seconds": elapsed, "requests": stub.requests,
+              "cache_hits": metrics.cache_lookups.value(result="hit") - hits}
+    if memory:
+        reset_state(stub)
+        prepared = setup()
+        tracemalloc.start()
+        run(prepared)
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def main(argv: List[str] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recorded", nargs="+",
+                        default=[os.path.join("cached_requests", "raw_cache")],
+                        help="recorded responses: joblib caches or JSON fixtures")
+    parser.add_argument("--sizes", default="10,1000,50000", help="comma separated numbers of points")
+    parser.add_argument("--cases", help="comma separated cases, all by default")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    logging.getLogger("package").setLevel(logging.WARNING)
+
+    extract = load_recorded(args.recorded)
+    # The pipelines save the cache, keep the recorded responses untouched.
+    supercharged_requests.cache_settings = dict(
+        supercharged_requests.cache_settings, legacy_path=os.path.join(tempfile.gettempdir(), "benchmark_cache"))
+    stub = StubTransport(extract)
+    stub.install()
+    reset_state(stub)
+    anchors = anchor_points(named_ways(extract))
+    selected = args.cases.split(",") if args.cases else None
+
+    results = list()
+    print(f"{'case':<22}{'points':>8}{'seconds':>10}{'points/s':>12}{'peak MB':>10}{'requests':>10}{'hits':>8}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        for name, (setup, run) in cases(anchors, size).items():
+            if selected and name not in selected:
+                continue
+            result = {"case": name, "size": size, **measure(stub, setup, run, not args.no_memory)}
+            results.append(result)
+            print(f"{name:<22}{size:>8}{result['seconds']:>10.3f}{size / result['seconds']:>12.0f}"
+                  f"{result.get('peak_mb', float('nan')):>10.1f}{result['requests']:>10}{result['cache_hits']:>8}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
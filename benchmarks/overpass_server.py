@@ -0,0 +1,249 @@
+"""Local stand-in for the Overpass API, with latency and fault injection.
+
+Queries are answered by the local backend interpreter from an OSM extract or
+from recorded responses (see benchmark.py). Like the public instances, every
+client gets a number of slots: a slot is held while a query runs and for a
+cool-down after it, a client without a free slot gets a 429. Random 429 and
+504 answers and the latency of the queries are set on the command line.
+
+    python benchmarks/overpass_server.py --port 8765 --latency 0.2 --jitter 0.3 --slots 2 --rate-504 0.05
+
+Then set overpass_url to http://127.0.0.1:8765/api/interpreter in config.yaml.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# benchmark moves to the root of the repository, paths given on the command line are from here.
+WORKING_DIRECTORY = os.getcwd()
+
+from benchmark import ROOT, load_recorded  # noqa: E402  also puts the package on the path
+
+from package.supercharged_requests.local_backend import OSMExtract, load_extract  # noqa: E402
+
+logger = logging.getLogger("overpass_server")
+
+
+class Slots:
+    """Query slots of every client, busy while a query runs and during the cool-down after it."""
+
+    def __init__(self, slots: int, cooldown: float):
+        """Create the slots, slots 0 means unlimited."""
+        self.slots = slots
+        self.cooldown = cooldown
+        self._busy: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _prune(self, client: str, now: float) -> List[float]:
+        busy = self._busy[client] = [until for until in self._busy[client] if until > now]
+        return busy
+
+    def acquire(self, client: str) -> bool:
+        """Take a slot of the client, False if all of them are busy."""
+        if not self.slots:
+            return True
+        with self._lock:
+            busy = self._prune(client, time.monotonic())
+            if len(busy) >= self.slots:
+                return False
+            busy.append(float("inf"))
+            return True
+
+    def release(self, client: str) -> None:
+        """Free the slot of a finished query after the cool-down."""
+        if not self.slots:
+            return
+        with self._lock:
+            busy = self._busy[client]
+            busy.remove(float("inf"))
+            busy.append(time.monotonic() + self.cooldown)
+
+    def available(self, client: str) -> int:
+        """Number of free slots of the client."""
+        with self._lock:
+            return self.slots - len(self._prune(client, time.monotonic()))
+
+    def next_free(self, client: str) -> Optional[float]:
+        """Seconds before a slot of the client is free, None if no query has finished."""
+        with self._lock:
+            finite = [until for until in self._prune(client, time.monotonic()) if until != float("inf")]
+        return max(0.0, min(finite) - time.monotonic()) if finite else None
+
+
+class OverpassServer(ThreadingHTTPServer):
+    """HTTP server answering /api/interpreter from an extract."""
+
+    daemon_threads = True
+
+    def __init__(self, address, extract: OSMExtract, latency: float = 0, jitter: float = 0,
+                 rate_429: float = 0, rate_504: float = 0, slots: int = 0, cooldown: float = 0,
+                 retry_after: bool = False, seed: int = 0):
+        """Create the server.
+
+        :param address: (host, port) to listen on.
+        :param extract: extract answering the queries.
+        :param latency: seconds added to every query.
+        :param jitter: upper bound of a random number of seconds added to the latency.
+        :param rate_429: probability of answering a query with a 429.
+        :param rate_504: probability of answering a query with a 504 after its latency.
+        :param slots: queries of a client at once, 0 for unlimited.
+        :param cooldown: seconds a slot stays busy after its query.
+        :param retry_after: send a Retry-After header with the slot 429.
+        :param seed: seed of the random latency and faults.
+        """
+        super().__init__(address, OverpassHandler)
+        self.extract = extract
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_504 = rate_504
+        self.slots = Slots(slots, cooldown)
+        self.retry_after = retry_after
+        self.statuses = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Random latency and fault of a query."""
+        with self._lock:
+            fault = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if fault < self.rate_429:
+            return delay, 429
+        if fault < self.rate_429 + self.rate_504:
+            return delay, 504
+        return delay, 200
+
+    def count(self, status: int) -> None:
+        """Count an answer by status code."""
+        with self._lock:
+            self.statuses[status] += 1
+
+
+class OverpassHandler(BaseHTTPRequestHandler):
+    """Overpass API endpoints: interpreter, status and counts of the answers."""
+
+    protocol_version = "HTTP/1.1"
+    server: OverpassServer
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Interpreter query in the data parameter, /api/status or /stats."""
+        url = urlparse(self.path)
+        if url.path.endswith("/status"):
+            self._status()
+        elif url.path == "/stats":
+            with self.server._lock:  # pylint: disable=protected-access
+                statuses = dict(self.server.statuses)
+            self._send(200, json.dumps(statuses).encode(), "application/json")
+        elif url.path.endswith("/interpreter"):
+            self._interpreter(parse_qs(url.query).get("data", [""])[0])
+        else:
+            self._send(404, b"Not found")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Interpreter query in the data field of the form."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        self._interpreter(parse_qs(body).get("data", [body])[0])
+
+    def _interpreter(self, query: str) -> None:
+        client = self.client_address[0]
+        delay, status = self.server.draw()
+        if status == 429:
+            self._send(429, b"rate_limited: server overloaded")
+            return
+        if not self.server.slots.acquire(client):
+            retry_after = self.server.slots.next_free(client) if self.server.retry_after else None
+            headers = {} if retry_after is None else {"Retry-After": str(round(retry_after + 0.5))}
+            self._send(429, b"rate_limited: no free slot for your client", headers=headers)
+            return
+        try:
+            time.sleep(delay)
+            if status == 504:
+                self._send(504, b"runtime error: Query timed out")
+                return
+            try:
+                data = self.server.extract.execute(query)
+            except Exception as err:  # pylint: disable=broad-except
+                self._send(400, f"parse error: {err}".encode())
+                return
+            self._send(200, json.dumps(data).encode(), "application/json")
+        finally:
+            self.server.slots.release(client)
+
+    def _status(self) -> None:
+        client = self.client_address[0]
+        slots = self.server.slots
+        lines = [f"Connected as: {client}", f"Current time: {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}",
+                 f"Rate limit: {slots.slots}"]
+        if slots.slots:
+            lines.append(f"{slots.available(client)} slots available now.")
+            next_free = slots.next_free(client)
+            if next_free is not None:
+                lines.append(f"Slot available after: in {round(next_free)} seconds.")
+        self._send(200, ("\n".join(lines) + "\n").encode())
+
+    def _send(self, status: int, body: bytes, content_type: str = "text/plain",
+              headers: Dict[str, str] = None) -> None:
+        self.server.count(status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(f"{self.client_address[0]} {format % args}")
+
+
+def main(argv: List[str] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--extract", help="OSM extract (.osm or .osm.pbf) answering the queries")
+    source.add_argument("--recorded", nargs="+", default=[os.path.join(ROOT, "cached_requests", "raw_cache")],
+                        help="recorded responses answering the queries: joblib caches or JSON fixtures")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every query")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many random seconds more")
+    parser.add_argument("--rate-429", type=float, default=0, help="probability of a random 429")
+    parser.add_argument("--rate-504", type=float, default=0, help="probability of a 504 after the latency")
+    parser.add_argument("--slots", type=int, default=0, help="queries of a client at once, 0 for unlimited")
+    parser.add_argument("--cooldown", type=float, default=0, help="seconds a slot stays busy after its query")
+    parser.add_argument("--retry-after", action="store_true", help="send Retry-After with the slot 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+
+    if args.extract:
+        extract = load_extract(os.path.join(WORKING_DIRECTORY, args.extract))
+    else:
+        extract = load_recorded([os.path.join(WORKING_DIRECTORY, path) for path in args.recorded])
+    server = OverpassServer((args.host, args.port), extract, latency=args.latency, jitter=args.jitter,
+                            rate_429=args.rate_429, rate_504=args.rate_504, slots=args.slots,
+                            cooldown=args.cooldown, retry_after=args.retry_after, seed=args.seed)
+    logger.info(f"Overpass stand-in on http://{args.host}:{args.port}/api/interpreter")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Answers by status: {dict(server.statuses)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Start-up time of the package, the command-line tools and the web app.
+
+Every scenario runs in fresh interpreters, the median wall time is reported
+along with the imports that took the longest. With --max-seconds, the exit
+status is 1 when a scenario is slower, so the check can run in CI.
+
+    python benchmarks/startup.py --runs 5 --max-seconds 1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "interpreter": "pass",
+    "import package": "import package",
+    "first cache lookup": "import package.supercharged_requests as s; s.cache().get('')",
+    "batch command": "import package.batch",
+    "prefetch command": "import package.prefetch",
+    "web app": "import app",
+}
+
+
+def run(code: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    """Run code in a fresh interpreter from the root of the repository."""
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, "user_interface"))
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def slowest_imports(code: str, count: int = 5) -> List[List]:
+    """Dependencies of code taking the longest to import, with their time in seconds.
+
+    The modules of the repository and of the interpreter start-up are left out.
+    """
+    imports = dict()
+    for line in run(code, importtime=True).stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        top = name.strip().split(".")[0]
+        if top not in ("package", "app", "site", "encodings"):
+            imports[top] = max(imports.get(top, 0), int(cumulative) / 1e6)
+    return sorted(([name, seconds] for name, seconds in imports.items()), key=lambda item: -item[1])[:count]
+
+
+def measure(code: str, runs: int) -> Dict:
+    """Median and minimum wall time of runs fresh interpreters running code."""
+    times = list()
+    for _ in range(runs):
+        start = time.perf_counter()
+        run(code)
+        times.append(time.perf_counter() - start)
+    return {"median": statistics.median(times), "min": min(times)}
+
+
+def main(argv: List[str] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="interpreters started per scenario")
+    parser.add_argument("--max-seconds", type=float, help="fail if a median is above this")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = dict()
+    print(f"{'scenario':<22}{'median s':>10}{'min s':>10}  slowest imports")
+    for name, code in SCENARIOS.items():
+        result = results[name] = {**measure(code, args.runs), "imports": slowest_imports(code)}
+        imports = ", ".join(f"{module} {seconds:.2f}" for module, seconds in result["imports"][:3])
+        print(f"{name:<22}{result['median']:>10.3f}{result['min']:>10.3f}  {imports}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.max_seconds is not None:
+        slow = [name for name, result in results.items() if result["median"] > args.max_seconds]
+        if slow:
+            print(f"Slower than {args.max_seconds}s: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Fixtures of the tests: the package on the path and an offline extract."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "user_interface"))
+
+# Rue Kleber crosses Rue de Belfort and Rue de Colmar, Impasse Verte only
+# crosses Rue de Belfort: it has no section between two intersections.
+EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="48.8940" lon="2.2470"/>
+  <node id="2" lat="48.8950" lon="2.2470"/>
+  <node id="3" lat="48.8960" lon="2.2470"/>
+  <node id="4" lat="48.8950" lon="2.2460"/>
+  <node id="5" lat="48.8950" lon="2.2480"/>
+  <node id="6" lat="48.8960" lon="2.2460"/>
+  <node id="7" lat="48.8960" lon="2.2480"/>
+  <node id="8" lat="48.8930" lon="2.2470"/>
+  <node id="14" lat="48.8955" lon="2.2490"/>
+  <node id="9" lat="48.8955" lon="2.2475">
+    <tag k="place" v="town"/>
+    <tag k="name" v="Courbevoie"/>
+  </node>
+  <way id="10">
+    <nd ref="8"/><nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="residential"/>
+    <tag k="name" v="Rue Kleber"/>
+  </way>
+  <way id="11">
+    <nd ref="4"/><nd ref="2"/><nd ref="5"/>
+    <tag k="highway" v="residential"/>
+    <tag k="name" v="Rue de Belfort"/>
+  </way>
+  <way id="12">
+    <nd ref="6"/><nd ref="3"/><nd ref="7"/>
+    <tag k="highway" v="residential"/>
+    <tag k="name" v="Rue de Colmar"/>
+  </way>
+  <way id="13">
+    <nd ref="5"/><nd ref="14"/>
+    <tag k="highway" v="residential"/>
+    <tag k="name" v="Impasse Verte"/>
+  </way>
+</osm>
+"""
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """Answer every query from EXTRACT, with empty street graphs and place indexes."""
+    from package.API import get_nearest_city
+    from package.API.boundary_index import BoundaryIndex
+    from package.API.place_index import PlaceIndex
+    from package.supercharged_requests import supercharged_requests
+    from package.utils import utils
+
+    filename = tmp_path / "extract.osm"
+    filename.write_text(EXTRACT)
+    monkeypatch.setattr(supercharged_requests, "backend", "local")
+    monkeypatch.setattr(supercharged_requests, "local_extract", str(filename))
+    monkeypatch.setattr(supercharged_requests, "cache_dict", dict())
+    monkeypatch.setattr(supercharged_requests, "cache_settings", dict(legacy_path=str(tmp_path / "raw_cache")))
+    monkeypatch.setattr(get_nearest_city, "place_index", PlaceIndex(get_nearest_city.place_index.region_size))
+    monkeypatch.setattr(get_nearest_city, "boundary_index",
+                        BoundaryIndex(get_nearest_city.boundary_index.region_size))
+    utils._street_graph.cache_clear()  # pylint: disable=protected-access
+    monkeypatch.chdir(tmp_path)
+    yield filename
+    utils._street_graph.cache_clear()  # pylint: disable=protected-access
@@ -0,0 +1,56 @@
+"""Batch processing of a CSV with a row that fails."""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from package import batch
+
+# The last point is kilometers away from every street of the extract.
+POINTS = "lat,lng\n48.8955,2.24705\n48.8953,2.2486\n48.95,2.30\n"
+
+
+def test_failed_rows_go_to_the_errors_file(offline, monkeypatch):
+    # The workers run in threads to share the offline backend of the test.
+    monkeypatch.setattr(batch, "ProcessPoolExecutor",
+                        lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+    (offline.parent / "points.csv").write_text(POINTS)
+
+    assert batch.run("points.csv", "out.csv", "uni", workers=1) == set()
+    results = pd.read_csv("out.csv", keep_default_na=False)
+    assert sorted(results.rue) == ["Impasse Verte", "Rue Kleber"]
+    errors = pd.read_csv("out.csv.errors.csv")
+    assert errors[["lat", "lng"]].values.tolist() == [[48.95, 2.30]]
+    assert errors.error[0].startswith("ValueError: No named way")
+
+    # The chunk is recorded, running again neither retries nor duplicates its rows.
+    assert batch.run("points.csv", "out.csv", "uni", workers=1) == set()
+    assert len(pd.read_csv("out.csv")) == 2
+    assert len(pd.read_csv("out.csv.errors.csv")) == 1
+
+
+def test_chunk_without_errors(offline):
+    index, results, errors = batch.process_chunk("uni", 0, [(48.8955, 2.24705)])
+    assert index == 0 and len(results) == 1 and errors is None
+
+
+# Two points of Rue Kleber between Rue de Belfort and Rue de Colmar.
+SECTION = "lat,lng\n48.8958,2.24705\n48.8955,2.24705\n"
+
+
+def test_failed_chunk_numbers_its_good_rows_together(offline):
+    _, results, errors = batch.process_chunk("uni", 0, [(48.8958, 2.24705), (48.95, 2.30), (48.8955, 2.24705)])
+    assert sorted(results.num_arbre) == [1, 2] and len(errors) == 1
+
+
+def test_points_are_numbered_within_their_chunk(offline, monkeypatch):
+    monkeypatch.setattr(batch, "ProcessPoolExecutor",
+                        lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+    (offline.parent / "points.csv").write_text(SECTION)
+
+    batch.run("points.csv", "whole.csv", "uni", chunk_size=2, workers=1)
+    assert sorted(pd.read_csv("whole.csv").num_arbre) == [1, 2]
+    batch.run("points.csv", "split.csv", "uni", chunk_size=1, workers=1)
+    assert sorted(pd.read_csv("split.csv").num_arbre) == [1, 1]
+    last = json.loads((offline.parent / "split.csv.checkpoint").read_text().splitlines()[-1])
+    assert last["size"] == (offline.parent / "split.csv").stat().st_size
@@ -0,0 +1,44 @@
+"""Boundaries assembled from their member ways and points located in them."""
+import numpy as np
+
+from package.API.boundary_index import BoundaryIndex, assemble_rings
+from package.utils.geometry import points_in_polygon
+
+SQUARE = [(0.0, 0.0), (0.0, 4.0), (4.0, 4.0), (4.0, 0.0), (0.0, 0.0)]
+HOLE = [(1.0, 1.0), (1.0, 3.0), (3.0, 3.0), (3.0, 1.0), (1.0, 1.0)]
+
+
+def edges(*rings):
+    return (np.array([vertex for ring in rings for vertex in ring[:-1]]),
+            np.array([vertex for ring in rings for vertex in ring[1:]]))
+
+
+def test_rings_from_split_and_reversed_ways():
+    # The square is split in four ways, two of them drawn backwards.
+    ring, = assemble_rings([SQUARE[:2], SQUARE[2:4][::-1], SQUARE[3:], SQUARE[1:3][::-1]])
+    assert ring[0] == ring[-1] and len(ring) == 5
+    assert set(ring) == set(SQUARE)
+
+
+def test_unclosed_chain_is_dropped():
+    assert assemble_rings([SQUARE[:2], SQUARE[1:3]]) == []
+    assert len(assemble_rings([SQUARE[:3], SQUARE[2:], HOLE])) == 2
+
+
+def test_points_in_a_polygon_with_a_hole():
+    points = np.array([(0.5, 0.5), (2.0, 2.0), (3.5, 2.0), (5.0, 2.0)])
+    assert points_in_polygon(points, *edges(SQUARE, HOLE)).tolist() == [True, False, True, False]
+    assert points_in_polygon(points, *edges(SQUARE)).tolist() == [True, True, True, False]
+
+
+def test_locate_in_the_relations_of_a_region():
+    def relation(id_relation, name, *ways):
+        return {'type': 'relation', 'id': id_relation, 'tags': {'name': name},
+                'members': [{'type': 'way', 'ref': index, 'role': 'outer',
+                             'geometry': [{'lat': lat, 'lon': lon} for lat, lon in way]}
+                            for index, way in enumerate(ways)]}
+
+    index = BoundaryIndex(region_size=10)
+    index.add_region((0, 0), [relation(1, 'Courbevoie', SQUARE[:3], SQUARE[2:][::-1], HOLE),
+                              relation(2, 'Puteaux', HOLE)])
+    assert index.locate([(0.5, 0.5), (2.0, 2.0), (5.0, 5.0)]) == ['Courbevoie', 'Puteaux', None]
@@ -0,0 +1,140 @@
+"""Recovery, expiry and eviction of the persistent cache stores."""
+import os
+
+from package.supercharged_requests import cache_store
+from package.supercharged_requests.cache_store import JournalStore, SqliteStore
+
+
+def journal_store(tmp_path):
+    return JournalStore(str(tmp_path / "cache"))
+
+
+def test_torn_record_is_dropped(tmp_path):
+    store = journal_store(tmp_path)
+    store["a"], store["b"] = 1, 2
+    store.close()
+    size = os.path.getsize(store.journal_filename)
+    with open(store.journal_filename, "r+b") as file:
+        file.truncate(size - 1)
+
+    store = journal_store(tmp_path)
+    assert dict(store.items()) == {"a": 1}
+    # The torn record is cut, the records set next follow the last good one.
+    assert store.size() == os.path.getsize(store.journal_filename) < size
+    store["c"] = 3
+    store.close()
+    assert dict(journal_store(tmp_path).items()) == {"a": 1, "c": 3}
+
+
+def test_record_with_a_bad_checksum_ends_the_journal(tmp_path):
+    store = journal_store(tmp_path)
+    store["a"], store["b"] = 1, 2
+    store.close()
+    with open(store.journal_filename, "r+b") as file:
+        file.seek(-1, os.SEEK_END)
+        last = file.read(1)
+        file.seek(-1, os.SEEK_END)
+        file.write(bytes([last[0] ^ 0xFF]))
+    assert dict(journal_store(tmp_path).items()) == {"a": 1}
+
+
+def test_compaction(tmp_path):
+    store = journal_store(tmp_path)
+    store["a"] = 1
+    store.compact(wait=True)
+    store["b"] = 2
+    store.close()
+    assert not os.path.exists(store.journal_filename + ".old")
+    assert cache_store._load_snapshot(store.filename) == {"a": 1}  # pylint: disable=protected-access
+    assert dict(journal_store(tmp_path).items()) == {"a": 1, "b": 2}
+
+
+def test_interrupted_compaction_is_finished(tmp_path):
+    # Killed after starting a new journal, before writing the snapshot.
+    store = journal_store(tmp_path)
+    store["a"] = 1
+    store.close()
+    os.replace(store.journal_filename, store.journal_filename + ".old")
+    other = JournalStore(str(tmp_path / "other"))
+    other["b"] = 2
+    other.close()
+    os.replace(other.journal_filename, store.journal_filename)
+
+    store = journal_store(tmp_path)
+    assert dict(store.items()) == {"a": 1, "b": 2}
+    assert not os.path.exists(store.journal_filename + ".old")
+    assert store.size() == os.path.getsize(store.filename)
+    assert cache_store._load_snapshot(store.filename) == {"a": 1, "b": 2}  # pylint: disable=protected-access
+
+
+def test_failed_compaction_loses_nothing(tmp_path, monkeypatch):
+    store = journal_store(tmp_path)
+    store["a"] = 1
+
+    def fail(entries):
+        raise OSError("disk full")
+    monkeypatch.setattr(store, "_write_snapshot", fail)
+    store.compact(wait=True)
+    store["b"] = 2
+    # The next compaction keeps the records of the failed one.
+    store.compact(wait=True)
+    store["c"] = 3
+    store.close()
+    assert dict(journal_store(tmp_path).items()) == {"a": 1, "b": 2, "c": 3}
+
+    monkeypatch.undo()
+    store = journal_store(tmp_path)
+    store.compact(wait=True)
+    store.close()
+    assert not os.path.exists(store.journal_filename + ".old")
+    assert cache_store._load_snapshot(store.filename) == {"a": 1, "b": 2, "c": 3}  # pylint: disable=protected-access
+
+
+class Clock:
+    """time.time of the cache store, advanced by the tests."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def sqlite_store(tmp_path, monkeypatch, **limits):
+    clock = Clock()
+    monkeypatch.setattr(cache_store.time, "time", clock)
+    return SqliteStore(str(tmp_path / "cache.sqlite"), **limits), clock
+
+
+def test_stale_entries_expire(tmp_path, monkeypatch):
+    store, clock = sqlite_store(tmp_path, monkeypatch, ttl=100)
+    store["a"] = 1
+    clock.now += 50
+    store["b"] = 2
+    assert store.get("a") == 1
+    clock.now += 60
+    assert store.get("a") is None and "a" not in store and store.get("b") == 2
+    clock.now += 60
+    assert store.evict() == 1 and len(store) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    store, clock = sqlite_store(tmp_path, monkeypatch, max_size=1)
+    for key in "abcd":
+        store[key] = "x" * 100
+        clock.now += store.touch_interval + 1
+    store.max_size = 3 * store.size() // 4
+    assert store.get("a") is not None
+    # b and c were read the longest ago, evicted down to 90% of max_size.
+    assert store.evict() == 2
+    assert sorted(store.keys()) == ["a", "d"]
+
+
+def test_eviction_every_evict_every_writes(tmp_path, monkeypatch):
+    store, _ = sqlite_store(tmp_path, monkeypatch, max_size=1)
+    evictions = []
+    monkeypatch.setattr(store, "evict", lambda: evictions.append(len(store)))
+    store.evict_every = 3
+    for index in range(7):
+        store[str(index)] = index
+    assert evictions == [3, 6]
@@ -0,0 +1,57 @@
+"""Results and expiry of the background jobs."""
+import os
+import time
+
+from package import jobs
+
+
+def write_fragments(name, directory):
+    with open(os.path.join(directory, "results.csv"), "w") as file:
+        file.write("rue\n" + name + "\n")
+    return {"table": f"<table>{name}</table>"}
+
+
+def wait(job):
+    for _ in range(200):
+        if job.finished is not None:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"job {job.id} still {job.status}")
+
+
+def test_result_is_kept_on_disk(tmp_path):
+    queue = jobs.JobQueue(str(tmp_path), workers=1)
+    job = queue.submit(write_fragments, "Rue Kleber")
+    wait(job)
+    assert job.status == jobs.DONE
+    assert os.path.dirname(job.result_path) == job.directory
+    assert job.result() == {"table": "<table>Rue Kleber</table>"}
+
+
+def test_failed_job_has_no_result(tmp_path):
+    queue = jobs.JobQueue(str(tmp_path), workers=1)
+    job = queue.submit(write_fragments, None)
+    wait(job)
+    assert job.status == jobs.FAILED and job.result_path is None and "NoneType" in job.error
+
+
+def test_expired_jobs_are_dropped_without_new_submissions(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs.JobQueue, "expiry_interval", 0.01)
+    queue = jobs.JobQueue(str(tmp_path), workers=1, retention=0.05)
+    job = queue.submit(write_fragments, "Rue Kleber")
+    wait(job)
+    # The idle worker drops the job and its directory.
+    for _ in range(200):
+        if not os.path.exists(job.directory):
+            break
+        time.sleep(0.01)
+    assert not os.path.exists(job.directory) and queue.get(job.id) is None
+
+
+def test_lookup_drops_expired_jobs(tmp_path):
+    queue = jobs.JobQueue(str(tmp_path), workers=1, retention=3600)
+    job = queue.submit(write_fragments, "Rue Kleber")
+    wait(job)
+    assert queue.get(job.id) is job
+    job.finished -= 7200
+    assert queue.get(job.id) is None and not os.path.exists(job.directory)
@@ -0,0 +1,91 @@
+"""The Overpass QL subset answered by the local backend."""
+import pytest
+
+from conftest import EXTRACT
+from package.API import get_ways_from_node
+from package.API.queries import query_nodes_ways, query_street, query_tile_ways
+from package.supercharged_requests.local_backend import load_extract
+
+# Rue Coupee leaves the extract: node 99 and way 98 were clipped out.
+CLIPPED = EXTRACT.replace("</osm>", """  <way id="15">
+    <nd ref="3"/><nd ref="99"/>
+    <tag k="name" v="Rue Coupee"/>
+  </way>
+  <relation id="30">
+    <member type="way" ref="15" role="outer"/>
+    <member type="way" ref="98" role="outer"/>
+    <member type="node" ref="97" role="admin_centre"/>
+    <tag k="boundary" v="administrative"/>
+    <tag k="admin_level" v="8"/>
+    <tag k="name" v="Courbevoie"/>
+  </relation>
+</osm>
+""")
+
+
+@pytest.fixture
+def extract(tmp_path):
+    filename = tmp_path / "clipped.osm"
+    filename.write_text(CLIPPED)
+    return load_extract(str(filename))
+
+
+def elements(extract, query):
+    return [(element["type"], element["id"]) for element in extract.execute(query)["elements"]]
+
+
+def test_around(extract):
+    assert elements(extract, query_street(20, 48.8955, 2.24705)) == [("way", 10)]
+    assert elements(extract, query_street(60, 48.8955, 2.24705)) == [
+        ("way", 10), ("way", 11), ("way", 12), ("way", 15)]
+
+
+def test_bbox(extract):
+    assert elements(extract, query_tile_ways(48.8945, 2.2465, 48.8952, 2.2475)) == [("way", 10), ("way", 11)]
+    assert elements(extract, '[out:json];node["place"](48.89,2.24,48.90,2.25);out;') == [("node", 9)]
+    assert elements(extract, '[out:json];node["place"](48.80,2.24,48.85,2.25);out;') == []
+
+
+def test_ways_of_nodes(extract):
+    assert elements(extract, query_nodes_ways([2, 5])) == [("node", 2), ("node", 5), ("way", 10), ("way", 11),
+                                                           ("way", 13)]
+
+
+def test_recurse_down(extract):
+    assert elements(extract, "[out:json];way(10);(._;>;);out;") == [
+        ("node", 1), ("node", 2), ("node", 3), ("node", 8), ("way", 10)]
+
+
+def test_out_geom(extract):
+    kleber, = extract.execute("[out:json];way(10);out body geom;")["elements"]
+    assert kleber["nodes"] == [8, 1, 2, 3]
+    assert [(vertex["lat"], vertex["lon"]) for vertex in kleber["geometry"]] == [
+        (48.893, 2.247), (48.894, 2.247), (48.895, 2.247), (48.896, 2.247)]
+    assert kleber["tags"]["name"] == "Rue Kleber"
+
+
+def test_clipped_way_keeps_its_nodes_inside(extract):
+    way, = extract.execute("[out:json];way(15);out body geom;")["elements"]
+    assert way["nodes"] == [3] and len(way["geometry"]) == 1
+    assert elements(extract, "[out:json];way(15);>;out;") == [("node", 3)]
+
+
+def test_clipped_relation_members(extract):
+    assert elements(extract, "[out:json];relation(30);>;out;") == [("node", 3), ("way", 15)]
+    relation, = extract.execute("[out:json];relation(30);out body geom;")["elements"]
+    assert [member["ref"] for member in relation["members"]] == [15, 98, 97]
+    assert [("geometry" in member) for member in relation["members"]] == [True, False, False]
+    assert elements(extract, "[out:json];relation(30);way(r);out;") == [("way", 15)]
+
+
+def test_unsupported_filter(extract):
+    with pytest.raises(ValueError):
+        extract.execute("[out:json];way(poly:\"48.8 2.2 48.9 2.3\");out;")
+
+
+def test_node_missing_from_the_response(monkeypatch):
+    response = {"elements": [{"type": "node", "id": 2, "lat": 48.895, "lon": 2.247},
+                             {"type": "way", "id": 10, "nodes": [2, 99], "tags": {"name": "Rue Kleber"}}]}
+    monkeypatch.setattr(get_ways_from_node.requests, "supercharged_requests", lambda params: response)
+    assert get_ways_from_node.get_ways_from_node_batched([2, 99]) == [(["Rue Kleber"], (48.895, 2.247)),
+                                                                     (["Rue Kleber"], None)]
@@ -0,0 +1,21 @@
+"""Metrics and their text exposition."""
+import pytest
+
+from package import metrics
+
+
+def test_metric_without_samples_cannot_be_created():
+    class Incomplete(metrics.Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Misses samples.")
+
+
+def test_counter_rendering():
+    counter = metrics.Counter("queries_total", "Queries.", ["status"])
+    counter.inc(status=200)
+    counter.inc(2, status=200)
+    assert counter.value(status=200) == 3
+    assert counter.render().splitlines() == ["# HELP queries_total Queries.", "# TYPE queries_total counter",
+                                             'queries_total{status="200"} 3']
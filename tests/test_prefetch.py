@@ -0,0 +1,46 @@
+"""Bulk responses cut into the entries read by the lookups."""
+import pytest
+
+from package import prefetch
+from package.API import get_ways_from_node
+from package.API.queries import query_area_streets
+from package.supercharged_requests import supercharged_requests, tile_cache
+from package.supercharged_requests.local_backend import load_extract
+
+
+@pytest.fixture
+def prefetched(offline, monkeypatch):
+    """Cache filled from the bulk response of a block, then any request sent fails."""
+    extract = load_extract(str(offline))
+    block = prefetch.area_tiles(48.8950, 2.2465, 48.8958, 2.2480, margin=100)
+    data = extract.execute(query_area_streets(*prefetch.block_bbox(block)))
+    monkeypatch.setattr(supercharged_requests, "backend", "overpass")
+    monkeypatch.setattr(tile_cache, "enabled", True)
+    entries = prefetch.split_response(data, block)
+    for overpass_query, response in entries.items():
+        supercharged_requests.store(overpass_query, response)
+
+    def download(overpass_query):
+        raise AssertionError(f"not prefetched: {overpass_query}")
+    monkeypatch.setattr(supercharged_requests, "download", download)
+    return extract, entries
+
+
+def names(response):
+    return sorted(element['tags']['name'] for element in response['elements'] if element['type'] == 'way')
+
+
+def test_tiles_answer_the_ways_around(prefetched):
+    extract, entries = prefetched
+    assert any(query in entries for query in tile_cache.tile_queries(48.8955, 2.24705, 60))
+    for rad in (20, 60):
+        expected = extract.execute(f"[out:json];way(around:{rad},48.8955,2.24705)[name];out body geom;")
+        assert names(supercharged_requests.ways_around(48.8955, 2.24705, rad)) == names(expected)
+
+
+def test_batches_answer_the_ways_of_the_nodes(prefetched):
+    # The nodes of Rue Kleber, as read by its street graph.
+    located = get_ways_from_node.get_ways_from_node_batched([8, 1, 2, 3])
+    assert [(sorted(ways), coordinates) for ways, coordinates in located] == [
+        (['Rue Kleber'], (48.893, 2.247)), (['Rue Kleber'], (48.894, 2.247)),
+        (['Rue Kleber', 'Rue de Belfort'], (48.895, 2.247)), (['Rue Kleber', 'Rue de Colmar'], (48.896, 2.247))]
@@ -0,0 +1,75 @@
+"""Compact projection of the cached responses."""
+import os
+import pickle
+import sys
+
+import joblib
+
+from package.API.queries import query_boundaries, query_city, query_street
+from package.supercharged_requests import projection
+
+RESPONSE = {
+    "version": 0.6,
+    "elements": [
+        {"type": "node", "id": 9, "lat": 48.8955, "lon": 2.2475,
+         "tags": {"place": "town", "name": "Courbevoie", "population": "82000"}},
+        {"type": "node", "id": 2, "lat": 48.895, "lon": 2.247},
+        {"type": "way", "id": 10, "nodes": [1, 2, 3],
+         "geometry": [{"lat": 48.894, "lon": 2.247}, {"lat": 48.895, "lon": 2.247}, {"lat": 48.896, "lon": 2.247}],
+         "tags": {"name": "Rue Kleber", "highway": "residential"}},
+        {"type": "way", "id": 11, "nodes": [4, 2, 5], "tags": {"name": "Rue de Belfort"}},
+        {"type": "relation", "id": 20,
+         "members": [{"type": "way", "ref": 30, "role": "outer",
+                      "geometry": [{"lat": 48.89, "lon": 2.24}, {"lat": 48.90, "lon": 2.24},
+                                   {"lat": 48.90, "lon": 2.26}, {"lat": 48.89, "lon": 2.24}]},
+                     {"type": "node", "ref": 9, "role": "admin_centre"}],
+         "tags": {"boundary": "administrative", "admin_level": "8", "name": "Courbevoie",
+                  "wikidata": "Q193370"}},
+    ],
+}
+
+
+def kept(response):
+    """Response with only the fields kept by the projection."""
+    elements = list()
+    for element in response["elements"]:
+        element = {key: value for key, value in element.items() if key != "tags"}
+        tags = {key: value for key, value in next(
+            original for original in RESPONSE["elements"] if original["id"] == element["id"]
+        ).get("tags", {}).items() if key in projection.KEPT_TAGS}
+        elements.append({**element, **({"tags": tags} if tags else {})})
+    return {"elements": elements}
+
+
+def test_round_trip():
+    data = projection.expand(projection.compact(RESPONSE))
+    assert data == kept(RESPONSE)
+    nodes = [element for element in data["elements"] if element["type"] == "node"]
+    assert nodes[0]["tags"] == {"name": "Courbevoie", "place": "town"}
+    assert data["elements"][-1]["members"][1] == {"type": "node", "ref": 9, "role": "admin_centre"}
+
+
+def test_round_trip_through_pickle(monkeypatch):
+    for level in (0, 6):
+        monkeypatch.setattr(projection, "compress_level", level)
+        value = pickle.loads(pickle.dumps(projection.compact(RESPONSE)))
+        assert projection.expand(value) == kept(RESPONSE)
+
+
+def test_full_responses_are_returned_as_they_are():
+    assert projection.expand(RESPONSE) is RESPONSE
+
+
+def test_compact_cache_replays_place_and_boundary_queries(tmp_path):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    from benchmark import load_recorded  # pylint: disable=import-outside-toplevel
+
+    filename = str(tmp_path / "raw_cache")
+    joblib.dump({"query": projection.compact(RESPONSE)}, filename)
+    extract = load_recorded([filename])
+    cities = extract.execute(query_city(48.8, 2.2, 49.0, 2.3))["elements"]
+    assert [element["tags"]["name"] for element in cities] == ["Courbevoie"]
+    boundaries = extract.execute(query_boundaries(48.8, 2.2, 49.0, 2.3))["elements"]
+    assert [element["id"] for element in boundaries] == [20]
+    streets = extract.execute(query_street(50, 48.895, 2.247))["elements"]
+    assert sorted(element["tags"]["name"] for element in streets) == ["Rue Kleber", "Rue de Belfort"]
@@ -0,0 +1,143 @@
+"""States of the circuit breaker and the retries around it."""
+import asyncio
+
+import httpx
+import pytest
+
+from package.supercharged_requests import retry
+from package.supercharged_requests.retry import (CircuitBreaker, CircuitOpenError, OverpassError,
+                                                 RetryPolicy)
+
+REQUEST = httpx.Request("GET", "http://127.0.0.1/api/interpreter")
+
+
+class Clock:
+    """Monotonic clock moved by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    """Breaker opening after 2 failures for 10 s, requests tried once and never delayed."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    monkeypatch.setattr(retry, "breaker", breaker)
+    monkeypatch.setattr(retry, "policy", RetryPolicy(max_attempts=1, base_delay=0, max_delay=0))
+    return breaker
+
+
+def open_breaker(breaker, clock):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 10
+    assert breaker.state == "half_open"
+
+
+def test_opens_after_the_threshold(breaker):
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.allow("query")
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow("query")
+    assert list(breaker.dropped_queries) == ["query"]
+
+
+def test_success_resets_the_failures(breaker):
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_a_single_trial_through(breaker, clock):
+    open_breaker(breaker, clock)
+    breaker.allow("trial")
+    with pytest.raises(CircuitOpenError):
+        breaker.allow("query")
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow("query")
+
+
+def test_failed_trial_opens_again(breaker, clock):
+    open_breaker(breaker, clock)
+    breaker.allow("trial")
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 10
+    breaker.allow("trial")
+
+
+def test_trial_raising_frees_the_next_trial(breaker, clock):
+    open_breaker(breaker, clock)
+
+    def send():
+        raise RuntimeError("stub")
+
+    with pytest.raises(RuntimeError):
+        retry.send_with_retry(send, "trial")
+    assert breaker.state == "half_open" and not breaker._trial  # pylint: disable=protected-access
+    assert retry.send_with_retry(lambda: httpx.Response(200, request=REQUEST), "query").status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_only_the_trial_frees_the_trial(breaker, clock):
+    # A request let through while closed is cancelled once the trial is running.
+    assert breaker.allow("query") is False
+    open_breaker(breaker, clock)
+    assert breaker.allow("trial") is True
+    breaker.release(False)
+    with pytest.raises(CircuitOpenError):
+        breaker.allow("query")
+    breaker.release(True)
+    assert breaker.allow("query") is True
+
+
+def test_cancelled_async_trial_frees_the_next_trial(breaker, clock):
+    open_breaker(breaker, clock)
+
+    async def send():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(retry.async_send_with_retry(send, "trial"))
+    breaker.allow("query")
+
+
+def test_refused_query_does_not_count_as_a_failure(breaker, clock):
+    for _ in range(3):
+        with pytest.raises(OverpassError):
+            retry.send_with_retry(lambda: httpx.Response(400, request=REQUEST), "malformed")
+    assert breaker.state == "closed" and breaker.failures == 0
+
+    open_breaker(breaker, clock)
+    with pytest.raises(OverpassError):
+        retry.send_with_retry(lambda: httpx.Response(400, request=REQUEST), "malformed")
+    assert breaker.state == "half_open"
+    breaker.allow("query")
+
+
+def test_transport_errors_open_the_breaker(breaker):
+    def send():
+        raise httpx.ConnectError("refused", request=REQUEST)
+
+    for _ in range(2):
+        with pytest.raises(OverpassError):
+            retry.send_with_retry(send, "query")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        retry.send_with_retry(send, "query")
@@ -0,0 +1,62 @@
+"""Concurrent calls coalesced by SingleFlight."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from package.supercharged_requests.single_flight import SingleFlight
+
+
+def run_together(flight, function, callers=4):
+    """Call flight.do from several threads while the leader is held in function."""
+    started, release = threading.Event(), threading.Event()
+
+    def leader():
+        started.set()
+        release.wait(1)
+        return function()
+
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(flight.do, "query", leader)]
+        started.wait(1)
+        futures += [pool.submit(flight.do, "query", function) for _ in range(callers - 1)]
+        while flight.stats()["coalesced"] < callers - 1:
+            threading.Event().wait(0.001)
+        release.set()
+    return futures
+
+
+def test_concurrent_callers_share_one_call():
+    flight, fetched = SingleFlight(), []
+    futures = run_together(flight, lambda: fetched.append(1) or {"elements": []})
+    results = [future.result() for future in futures]
+    assert fetched == [1] and all(result is results[0] for result in results)
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_callers_see_the_exception_of_the_leader():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("API down")
+    for future in run_together(flight, fail):
+        with pytest.raises(RuntimeError, match="API down"):
+            future.result()
+    # The failed call is not kept, the next caller runs a new one.
+    assert flight.do("query", lambda: 1) == 1 and flight.stats()["calls"] == 2
+
+
+def test_async_callers_share_one_call():
+    flight, fetched = SingleFlight(), []
+
+    async def fetch():
+        fetched.append(1)
+        await asyncio.sleep(0.01)
+        return {"elements": []}
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("query", fetch) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert fetched == [1] and all(result is results[0] for result in results)
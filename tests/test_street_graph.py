@@ -0,0 +1,67 @@
+"""Sections of the street graph, dead ends included."""
+import numpy as np
+
+from package.pipeline_multi import pipeline_multi
+from package.pipeline_uni import pipeline_uni
+from package.utils.geometry import nearest_segments
+from package.utils.street_graph import StreetGraph
+
+KLEBER = ([(['Rue Kleber'], (48.8930, 2.2470)), (['Rue Kleber'], (48.8940, 2.2470)),
+           (['Rue Kleber', 'Rue de Belfort'], (48.8950, 2.2470)),
+           (['Rue Kleber', 'Rue de Colmar'], (48.8960, 2.2470))])
+
+
+def test_sections_between_intersections():
+    graph = StreetGraph('Rue Kleber', [8, 1, 2, 3], KLEBER)
+    assert [section.names for section in graph.sections] == [('Rue de Belfort', 'Rue de Colmar')]
+    assert graph.nearest_sections([(48.8955, 2.24705)]) == graph.sections
+
+
+def test_order_and_merge_of_sections():
+    graph = StreetGraph('Rue Kleber', [8, 1, 2, 3], [(['Rue Kleber', 'Rue de Lille'], (48.8930, 2.2470))] + KLEBER[1:])
+    first, second = graph.sections
+    assert graph.order_in_section(second, [(48.8958, 2.2471), (48.8952, 2.2469), (48.8955, 2.2470)]) == {
+        (48.8952, 2.2469): 1, (48.8955, 2.2470): 2, (48.8958, 2.2471): 3}
+    assert graph.merge(second, first) == ['Rue de Lille', 'Rue de Colmar', (48.8930, 2.2470), (48.8960, 2.2470)]
+    assert graph.merge(second, second) == list(second)
+
+
+def test_dead_end_street():
+    graph = StreetGraph('Impasse Verte', [5, 14], [(['Impasse Verte', 'Rue de Belfort'], (48.8950, 2.2480)),
+                                                   (['Impasse Verte'], (48.8955, 2.2490))])
+    assert [section.names for section in graph.sections] == [('Rue de Belfort', '')]
+    assert graph.nearest_sections([(48.8953, 2.2486)]) == graph.sections
+
+
+def test_street_cut_at_its_only_intersection():
+    graph = StreetGraph('Rue Kleber', [8, 1, 2], KLEBER[:3])
+    assert [section.names for section in graph.sections] == [('', 'Rue de Belfort')]
+    graph = StreetGraph('Rue Kleber', [1, 2, 3], [KLEBER[1], (['Rue Kleber', 'Rue de Belfort'], (48.8950, 2.2470)),
+                                                  (['Rue Kleber'], (48.8960, 2.2470))])
+    assert [section.names for section in graph.sections] == [('', 'Rue de Belfort'), ('Rue de Belfort', '')]
+    assert graph.nearest_sections([(48.8958, 2.2471)]) == [graph.sections[1]]
+
+
+def test_street_without_crossing():
+    graph = StreetGraph('Rue Kleber', [8, 1], KLEBER[:2])
+    assert [section.names for section in graph.sections] == [('', '')]
+    assert len(StreetGraph('Rue Kleber', [], [])) == 0
+    assert StreetGraph('Rue Kleber', [], []).nearest_sections([(48.8935, 2.247)]) == [None]
+
+
+def test_nearest_segments_without_segments():
+    indices, distances = nearest_segments([(48.8935, 2.247)], np.empty((0, 2)), np.empty((0, 2)))
+    assert indices.tolist() == [-1]
+    assert np.isinf(distances).all()
+
+
+def test_pipeline_uni_with_a_dead_end(offline):
+    results = pipeline_uni([(48.8955, 2.24705), (48.8953, 2.2486)], map_filename=None)
+    rows = results[['rue', 'debut_troncon', 'fin_troncon', 'ville']].values.tolist()
+    assert sorted(rows) == [['Impasse Verte', 'Rue de Belfort', '', 'Courbevoie'],
+                            ['Rue Kleber', 'Rue de Belfort', 'Rue de Colmar', 'Courbevoie']]
+
+
+def test_pipeline_multi_with_a_dead_end(offline):
+    results = pipeline_multi([((48.8953, 2.2486), (48.8954, 2.2488))], map_filename=None)
+    assert results[['debut_troncon', 'fin_troncon', 'ville']].values.tolist() == [['Rue de Belfort', '', 'Courbevoie']]
@@ -0,0 +1,25 @@
+"""Around lookups answered from the cached tiles."""
+import pytest
+
+from package.supercharged_requests import supercharged_requests, tile_cache
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Queries sent by the lookups, answered with no elements."""
+    sent = []
+    monkeypatch.setattr(supercharged_requests, "backend", "overpass")
+    monkeypatch.setattr(tile_cache, "enabled", True)
+    monkeypatch.setattr(supercharged_requests, "fetch", lambda query: sent.append(query) or {'elements': []})
+    return sent
+
+
+def test_small_circles_read_the_tiles(sent):
+    supercharged_requests.ways_around(48.8955, 2.24705, 100)
+    assert sent == tile_cache.tile_queries(48.8955, 2.24705, 100)
+
+
+def test_large_circles_send_a_single_query(sent):
+    assert len(tile_cache.tile_queries(48.8955, 2.24705, 1600)) > tile_cache.max_tiles
+    supercharged_requests.ways_around(48.8955, 2.24705, 1600)
+    assert len(sent) == 1 and "around:1600" in sent[0]
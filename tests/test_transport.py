@@ -0,0 +1,44 @@
+"""Concurrency limit shared by the sync and async requests."""
+import asyncio
+import threading
+
+from package.supercharged_requests.transport import ConcurrencyLimiter
+
+
+def test_async_waiters_wait_for_a_thread():
+    limiter = ConcurrencyLimiter(1)
+    released = threading.Event()
+
+    def hold():
+        with limiter:
+            released.wait()
+
+    async def main():
+        thread = threading.Thread(target=hold)
+        thread.start()
+        waiter = asyncio.ensure_future(limiter.__aenter__())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        released.set()
+        await asyncio.wait_for(waiter, 1)
+        await limiter.__aexit__(None, None, None)
+        thread.join()
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    limiter = ConcurrencyLimiter(1)
+
+    async def main():
+        limiter._semaphore.acquire()  # pylint: disable=protected-access
+        waiter = asyncio.ensure_future(limiter.__aenter__())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        limiter._semaphore.release()  # pylint: disable=protected-access
+        await asyncio.sleep(0.05)
+        async with limiter:
+            pass
+
+    asyncio.run(asyncio.wait_for(main(), 1))
@@ -1,11 +1,15 @@
-from flask import Flask, redirect, render_template, request, url_for, flash,render_template_string
+import os
+from flask import Flask, redirect, render_template, request, url_for, flash, jsonify, send_from_directory, abort, stream_template
 from werkzeug.utils import secure_filename
 import pandas as pd
-from package import pipeline_multi, pipeline_uni
-from package.utils.utils import generate_results
+from package import jobs, metrics, pipeline_multi, pipeline_uni
+from package.utils.utils import results_fragments
 import webbrowser
 
 app = Flask(__name__)
+# Parse and compile the results page once, at startup.
+app.jinja_env.get_template('results.html')
+job_queue = jobs.from_config()
 
 ALLOWED_EXTENSIONS = {'csv', 'txt'}
 app.config['UPLOAD_FOLDER'] = './'
@@ -31,6 +35,58 @@ def solution_multi():
 def results():
     return render_template('results.html')
 
+def run_pipeline(pipeline, coords, directory):
+    """Run a pipeline, write its map and CSV in the job directory and return the fragments of its results page."""
+    map_filename = os.path.join(directory, 'map.html')
+    results = pipeline(coords, map_filename)
+    results.to_csv(os.path.join(directory, 'results.csv'), index=False)
+    return results_fragments(results, map_filename)
+
+def submit_job(pipeline, coords):
+    """Queue the pipeline and answer at once with the job id."""
+    try:
+        job = job_queue.submit(run_pipeline, pipeline, coords)
+    except jobs.QueueFull:
+        return 'Too many jobs in progress, retry later', 503, {'Retry-After': '30'}
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify(job.to_dict()), 202, {'Location': url_for('job_status', job_id=job.id)}
+    return redirect(url_for('job_page', job_id=job.id), code=303)
+
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+@app.route('/metrics')
+def metrics_page():
+    return metrics.registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/jobs/<job_id>')
+def job_page(job_id):
+    job = get_job(job_id)
+    if job.status == jobs.DONE:
+        return redirect(url_for('job_result', job_id=job_id))
+    return render_template('job.html', job=job)
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    return jsonify(get_job(job_id).to_dict())
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = get_job(job_id)
+    if job.status != jobs.DONE:
+        return jsonify(job.to_dict()), 202
+    return stream_template('results.html', **job.result())
+
+@app.route('/jobs/<job_id>/results.csv')
+def job_csv(job_id):
+    job = get_job(job_id)
+    if job.status != jobs.DONE:
+        return jsonify(job.to_dict()), 202
+    return send_from_directory(os.path.abspath(job.directory), 'results.csv', as_attachment=True)
+
 @app.route('/uni_form', methods=['POST'])
 def uni_form():
     data = request.form.to_dict(flat=False)
@@ -44,9 +100,7 @@ def uni_form():
             continue
     if len(coord_input_uni) == 0:
         return render_template('solution_uni.html')
-    results = pipeline_uni(coord_input_uni)
-    html_file = generate_results(results, './user_interface/templates/layout.html','./map.html','./user_interface/templates/results.html')
-    return render_template_string(html_file)
+    return submit_job(pipeline_uni, coord_input_uni)
 
 @app.route('/uni_csv', methods=['POST','GET'])
 def uni_csv():
@@ -67,9 +121,8 @@ def uni_csv():
             flash('file successfully upload')
             if len(coord_csv_uni) == 0:
                 return render_template('solution_uni.html')
-            results = pipeline_uni(coord_csv_uni)
-            html_file = generate_results(results, './user_interface/templates/layout.html','./map.html','./user_interface/templates/results.html')
-        return render_template_string(html_file)
+            return submit_job(pipeline_uni, coord_csv_uni)
+        return redirect(request.url)
 
     
     return '''
@@ -98,9 +151,7 @@ def multi_form():#faire la récupération
             continue
     if len(coord_input_multi) == 0:
             return render_template('solution_multi.html')
-    results = pipeline_multi(coord_input_multi)
-    html_file = generate_results(results, './user_interface/templates/layout.html','./map.html','./user_interface/templates/results.html')
-    return render_template_string(html_file)
+    return submit_job(pipeline_multi, coord_input_multi)
 
 
 @app.route('/multi_csv', methods=['POST','GET'])
@@ -121,9 +172,7 @@ def multi_csv():
             coord_csv_multi = list(zip(zip(csv_file.lat1, csv_file.lng1),zip(csv_file.lat2, csv_file.lng2)))
             if len(coord_csv_multi) == 0:
                 return render_template('solution_multi.html')
-            results = pipeline_multi(coord_csv_multi)
-            html_file = generate_results(results, './user_interface/templates/layout.html','./map.html','./user_interface/templates/results.html')
-            return render_template_string(html_file)
+            return submit_job(pipeline_multi, coord_csv_multi)
     return '''
     <!doctype html>
     <title>Confirm upload</title>
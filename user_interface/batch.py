@@ -0,0 +1,10 @@
+"""Process a large CSV file from the command line.
+
+    python user_interface/batch.py uni points.csv -o results.csv
+"""
+import sys
+
+from package.batch import main
+
+if __name__ == "__main__":
+    sys.exit(main())
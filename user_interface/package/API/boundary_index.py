@@ -0,0 +1,124 @@
+"""In-memory index of the administrative boundaries (communes)."""
+import logging
+import threading
+from collections import defaultdict
+from math import floor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.geometry import points_in_polygon
+
+logger = logging.getLogger(__name__)
+
+
+def assemble_rings(polylines: List[List[Tuple[float, float]]]) -> List[List[Tuple[float, float]]]:
+    """Join the member ways of a boundary into closed rings.
+
+    Ways are chained by their shared end nodes, whatever their direction.
+    Chains that can't be closed (members missing from the response) are dropped.
+
+    :param polylines: member ways given as (latitude, longitude) vertices.
+
+    return rings: closed rings, the first vertex repeated at the end
+    """
+    by_end = defaultdict(set)
+    for index, polyline in enumerate(polylines):
+        by_end[polyline[0]].add(index)
+        by_end[polyline[-1]].add(index)
+    unused = set(range(len(polylines)))
+    rings = list()
+    while unused:
+        index = unused.pop()
+        ring = list(polylines[index])
+        for end in (ring[0], ring[-1]):
+            by_end[end].discard(index)
+        while ring[0] != ring[-1] and by_end[ring[-1]]:
+            index = by_end[ring[-1]].pop()
+            unused.discard(index)
+            polyline = polylines[index]
+            if polyline[0] != ring[-1]:
+                polyline = polyline[::-1]
+            by_end[polyline[-1]].discard(index)
+            ring.extend(polyline[1:])
+        if len(ring) > 3 and ring[0] == ring[-1]:
+            rings.append(ring)
+        else:
+            logger.debug("Dropped an unclosed boundary ring")
+    return rings
+
+
+class BoundaryIndex:
+    """Point in polygon lookups over the boundaries of the regions loaded so far.
+
+    Regions are square tiles of region_size degrees, filled once from a
+    single bbox query of the boundary relations. Each boundary keeps the
+    edges of its rings and its bounding box, points are first filtered by
+    bounding box then tested by one vectorized even-odd test per boundary.
+    """
+
+    def __init__(self, region_size: float = 0.1):
+        """Create an empty index."""
+        self.region_size = region_size
+        self.regions = set()
+        self.names: List[str] = list()
+        self.ids = set()
+        self._edges: List[Tuple[np.ndarray, np.ndarray]] = list()
+        self._bboxes = np.empty((0, 4))
+        self._lock = threading.Lock()
+
+    def region(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        """Region containing the point."""
+        return floor(latitude / self.region_size), floor(longitude / self.region_size)
+
+    def bbox(self, region: Tuple[int, int]) -> Tuple[float, float, float, float]:
+        """South, west, north, east bounds of a region."""
+        return (region[0] * self.region_size, region[1] * self.region_size,
+                (region[0] + 1) * self.region_size, (region[1] + 1) * self.region_size)
+
+    def add_region(self, region: Tuple[int, int], elements: List[Dict]) -> None:
+        """Add the boundary relations of a region given as Overpass elements with geometry."""
+        with self._lock:
+            bboxes = list()
+            for element in elements:
+                if element['type'] != 'relation' or 'name' not in element.get('tags', {}) \
+                        or element['id'] in self.ids:
+                    continue
+                rings = assemble_rings([
+                    [(vertex['lat'], vertex['lon']) for vertex in member['geometry']]
+                    for member in element.get('members', ())
+                    if member['type'] == 'way' and member.get('geometry')])
+                if not rings:
+                    continue
+                starts = np.array([vertex for ring in rings for vertex in ring[:-1]])
+                ends = np.array([vertex for ring in rings for vertex in ring[1:]])
+                self.ids.add(element['id'])
+                self.names.append(element['tags']['name'])
+                self._edges.append((starts, ends))
+                bboxes.append((*starts.min(axis=0), *starts.max(axis=0)))
+            if bboxes:
+                self._bboxes = np.vstack((self._bboxes, bboxes))
+            self.regions.add(region)
+
+    def locate(self, points: Sequence[Tuple[float, float]]) -> List[Optional[str]]:
+        """Boundary containing each point.
+
+        :param points: (latitude, longitude) of the points.
+
+        return names: name of the boundary of each point, None outside every
+        loaded boundary
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        bboxes, edges = self._bboxes, self._edges[:len(self._bboxes)]
+        owners = np.full(len(points), -1)
+        in_bboxes = ((points[:, None, 0] >= bboxes[None, :, 0]) & (points[:, None, 0] <= bboxes[None, :, 2])
+                     & (points[:, None, 1] >= bboxes[None, :, 1]) & (points[:, None, 1] <= bboxes[None, :, 3]))
+        for boundary in np.flatnonzero(in_bboxes.any(axis=0)):
+            candidates = np.flatnonzero(in_bboxes[:, boundary] & (owners < 0))
+            if len(candidates):
+                inside = points_in_polygon(points[candidates], *edges[boundary])
+                owners[candidates[inside]] = boundary
+        return [self.names[owner] if owner >= 0 else None for owner in owners]
+
+
+__all__ = ["BoundaryIndex", "assemble_rings"]
@@ -1,57 +1,110 @@
 """Get nearest city."""
 import logging
+from typing import List, Tuple
 
-from .. import config
+from .. import config, metrics
 from ..supercharged_requests import requests
-from .queries import query_city
+from .boundary_index import BoundaryIndex
+from .place_index import PlaceIndex
+from .queries import query_boundaries, query_city
 
 logger = logging.getLogger(__name__)
 
+place_index = PlaceIndex(region_size=config.data.get("Nearest_city").get(
+    "Place_index").get("region_size", 0.5))
+boundary_index = BoundaryIndex(region_size=config.data.get("Nearest_city").get(
+    "Boundaries", {}).get("region_size", 0.1))
+
+
+def load_region(region) -> None:
+    """Fill the place index with the place nodes of a region, once."""
+    if region in place_index.regions:
+        return
+    logging.info(
+        "Using openstreetmap API to get the places of the region. This can take a while.. ☕")
+    response = requests.supercharged_requests(
+        params={'data': query_city(*place_index.bbox(region))})
+    place_index.add_region(region, response.get('elements'))
+
+
+def load_boundaries(region) -> None:
+    """Fill the boundary index with the administrative boundaries of a region, once."""
+    if region in boundary_index.regions:
+        return
+    admin_level = config.data.get("Nearest_city").get(
+        "Boundaries", {}).get("admin_level", 8)
+    logging.info(
+        "Using openstreetmap API to get the boundaries of the region. This can take a while.. ☕")
+    response = requests.supercharged_requests(
+        params={'data': query_boundaries(*boundary_index.bbox(region), admin_level)})
+    boundary_index.add_region(region, response.get('elements'))
+
+
+def get_nearest_place(
+        latitude: float,
+        longitude: float,
+) -> str:
+    """Find the nearest town, city or village node for a given point using the place index.
+
+    The regions around the point are loaded ring by ring until the nearest
+    place is closer than the border of the loaded area.
+
+    :param latitude: latitude of your point.
+    :param longitude: longitude of your point.
+
+    return name: name of the nearest place
+    """
+    max_rings = config.data.get("Nearest_city").get(
+        "Place_index").get("max_rings", 2)
+
+    row, col = place_index.region(latitude, longitude)
+    for rings in range(max_rings + 1):
+        for region_row in range(row - rings, row + rings + 1):
+            for region_col in range(col - rings, col + rings + 1):
+                load_region((region_row, region_col))
+        nearest = place_index.nearest(latitude, longitude)
+        if nearest and nearest[1] <= place_index.covered_distance(latitude, longitude, rings):
+            return nearest[0]
+    if nearest is None:
+        raise ValueError(f"No town, city or village around ({latitude}, {longitude})")
+    return nearest[0]
+
+
+@metrics.timed("cities")
+def get_cities(
+        list_coordinates: List[Tuple[float, float]],
+) -> List[str]:
+    """Find the city of every point.
+
+    With the boundary resolver, the city is the administrative boundary
+    containing the point, found by point in polygon tests against the
+    boundaries of the regions of the points, loaded once per region. Points
+    outside every boundary, and every point with the place resolver, get
+    the nearest town, city or village node.
+
+    :param list_coordinates: (latitude, longitude) of the points.
+
+    return names: name of the city of each point
+    """
+    resolver = config.data.get("Nearest_city").get("resolver", "boundary")
+    names = [None] * len(list_coordinates)
+    if resolver == "boundary" and list_coordinates:
+        for region in {boundary_index.region(*coordinates) for coordinates in list_coordinates}:
+            load_boundaries(region)
+        names = boundary_index.locate(list_coordinates)
+    return [name if name is not None else get_nearest_place(*coordinates)
+            for name, coordinates in zip(names, list_coordinates)]
+
 
 def get_nearest_city(
         latitude: float,
         longitude: float,
 ) -> str:
-    """Find the nearest city for a given point using binary search.
+    """Find the city for a given point, see get_cities.
 
     :param latitude: latitude of your point.
     :param longitude: longitude of your point.
 
-    return data[0]['tags']['name']: name of the nearest city
+    return name: name of the city
     """
-    radplus = config.data.get("Nearest_city").get(
-        "Binary_search").get("initial_upper_bound_radius", 10000)
-    radmoins = config.data.get("Nearest_city").get(
-        "Binary_search").get("lower_bound_radius", 0)
-    max_iter_before_increased_radius = config.data.get("Nearest_city").get(
-        "Binary_search").get("iter_before_increased_radius", 10)
-
-    rad = (radplus + radmoins) / 2
-    overpass_query = query_city(
-        rad=rad, latitude=latitude, longitude=longitude)
-    logging.info(
-        "Using openstreetmap API to get nearest city. This can take a while.. ☕")
-    response = requests.supercharged_requests(params={'data': overpass_query})
-    data = response.get('elements')
-    logging.info("Got the response")
-
-    n_iter = 0
-    while len(data) != 1:
-        if n_iter == max_iter_before_increased_radius:
-            n_iter = 0
-            radplus += 1000
-        else:
-            if data:
-                n_iter = 0
-                radplus = rad
-            else:
-                n_iter += 1
-                radmoins = rad
-
-        rad = (radplus + radmoins) / 2
-        overpass_query = query_city(
-            rad=rad, latitude=latitude, longitude=longitude)
-        response = requests.supercharged_requests(
-            params={'data': overpass_query})
-        data = response.get('elements')
-    return data[0]['tags']['name']
+    return get_cities([(latitude, longitude)])[0]
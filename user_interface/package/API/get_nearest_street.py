@@ -2,63 +2,54 @@
 import logging
 from typing import Dict
 
-from .. import config
+from numpy import argmin
+
+from .. import config, metrics
 from ..supercharged_requests import requests
-from .queries import query_street
+from ..utils.geometry import polyline_distances
 
 logger = logging.getLogger(__name__)
 
 
+@metrics.timed("nearest_street")
 def get_nearest_street(
         latitude: float,
         longitude: float
 ) -> Dict:
-    """Find the nearest street for a given point using binary search.
+    """Find the nearest street for a given point.
+
+    The named ways around the point are fetched with their geometry in a
+    single query and the nearest one is chosen by point-to-polyline distance.
+    The radius is only doubled when no named way at all is found.
 
     :param latitude: latitude of your point.
     :param longitude: longitude of your point.
 
-    return ways[0]: name of the nearest street
+    return way: nearest way with its nodes, tags and geometry
     """
     # Get hyperparameters from yaml.
-    radplus = config.data.get("Nearest_street").get(
-        "Binary_search").get("initial_upper_bound_radius", 100)
-    radmoins = config.data.get("Nearest_street").get(
-        "Binary_search").get("lower_bound_radius", 0)
-    max_iter_before_increased_radius = config.data.get("Nearest_street").get(
-        "Binary_search").get("iter_before_increased_radius", 10)
+    rad = config.data.get("Nearest_street").get(
+        "Search").get("initial_radius", 100)
+    max_rad = config.data.get("Nearest_street").get(
+        "Search").get("max_radius", 1600)
 
-    rad = (radplus + radmoins) / 2
-    overpass_query = query_street(
-        rad=rad, latitude=latitude, longitude=longitude)
     logging.info(
         "Using openstreetmap API to get nearest street. This can take a while.. ☕")
-
-    data = requests.supercharged_requests(params={'data': overpass_query})
-    logging.info("Got the response")
+    data = requests.ways_around(latitude=latitude, longitude=longitude, rad=rad)
     ways = [x for x in data['elements'] if x['type'] == 'way']
-
-    n_iter = 0
-    while len(ways) != 1:
-        # Increase radius after 10 unsucessful iterartions.
-        if n_iter == max_iter_before_increased_radius:
-            n_iter = 0
-            radplus += 1000
-
-        else:
-            # Binary search algorithm.
-            if ways:
-                n_iter = 0
-                radplus = rad
-            else:
-                n_iter += 1
-                radmoins = rad
-
-        rad = (radplus + radmoins) / 2
-        overpass_query = query_street(
-            rad=rad, latitude=latitude, longitude=longitude)
-        data = requests.supercharged_requests(
-            params={'data': overpass_query})
+    steps = 0
+    while not ways and rad < max_rad:
+        rad = min(2 * rad, max_rad)
+        steps += 1
+        data = requests.ways_around(latitude=latitude, longitude=longitude, rad=rad)
         ways = [x for x in data['elements'] if x['type'] == 'way']
-
-    return ways[0]
+    metrics.street_search_steps.observe(steps)
+    logging.info("Got the response")
+    if not ways:
+        raise ValueError(
+            f"No named way within {max_rad} m of ({latitude}, {longitude})")
+
+    distances = polyline_distances(
+        (latitude, longitude),
+        [[(vertex['lat'], vertex['lon']) for vertex in way['geometry']] for way in ways])
+    return ways[int(argmin(distances))]
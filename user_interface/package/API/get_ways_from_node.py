@@ -1,9 +1,11 @@
 """Get ways from node."""
 import asyncio
+from collections import defaultdict
 from typing import List, Tuple
 
-from ..supercharged_requests import requests
-from .queries import query_nodes, query_ways
+from .. import config
+from ..supercharged_requests import event_loop, requests
+from .queries import query_nodes_ways
 
 
 async def get_ways_from_node_async(
@@ -21,6 +23,31 @@ async def get_ways_from_node_async(
     return await asyncio.gather(*task_list)
 
 
+def get_ways_from_node_batched(
+        list_node: List[int]
+) -> List[Tuple]:
+    """Batched implementation, one query per batch_size distinct nodes.
+
+    Each query returns the nodes and the named ways having them as members,
+    so coordinates and crossing ways come back together. A node missing from
+    the response, outside a clipped extract, gets None coordinates.
+    """
+    batch_size = config.data.get("Ways_from_node").get("batch_size", 500)
+    unique_nodes = list(dict.fromkeys(list_node))
+    coordinates = dict()
+    names = defaultdict(set)
+    for start in range(0, len(unique_nodes), batch_size):
+        data = requests.supercharged_requests(
+            params={'data': query_nodes_ways(unique_nodes[start:start + batch_size])})
+        for element in data['elements']:
+            if element['type'] == 'node':
+                coordinates[element['id']] = (element['lat'], element['lon'])
+            elif element['type'] == 'way':
+                for id_node in element['nodes']:
+                    names[id_node].add(element['tags']['name'])
+    return [(list(names[id_node]), coordinates.get(id_node)) for id_node in list_node]
+
+
 def get_ways_from_node(
     list_node: List[int]
 ) -> List[Tuple]:
@@ -28,10 +55,12 @@ def get_ways_from_node(
 
     :param list_node: list of the nodes in your street.
 
-    return list_ways: list of ways that have common nodes with your street
+    return list_ways: names of the ways and coordinates of every node, None
+    for a node the API did not return
     """
-
-    list_ways = asyncio.run(
+    if config.data.get("Ways_from_node").get("batched", True):
+        return get_ways_from_node_batched(list_node=list_node)
+    list_ways = event_loop.run(
         get_ways_from_node_async(
             list_node=list_node))
     return list_ways
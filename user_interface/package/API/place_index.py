@@ -0,0 +1,85 @@
+"""In-memory index of the place nodes (town, city, village)."""
+import logging
+import threading
+from math import cos, floor, radians
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils.geometry import EARTH_RADIUS
+
+logger = logging.getLogger(__name__)
+
+
+def _unit_vectors(coordinates: np.ndarray) -> np.ndarray:
+    """Map (latitude, longitude) rows to points of the unit sphere."""
+    latitudes, longitudes = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+    return np.column_stack((np.cos(latitudes) * np.cos(longitudes),
+                            np.cos(latitudes) * np.sin(longitudes),
+                            np.sin(latitudes)))
+
+
+class PlaceIndex:
+    """Nearest place lookups over the regions loaded so far.
+
+    Regions are square tiles of region_size degrees. Each region is filled
+    once from a single bbox query, nearest neighbours are then found by one
+    vectorized scan of the unit vectors of the loaded places.
+    """
+
+    def __init__(self, region_size: float = 0.5):
+        """Create an empty index."""
+        self.region_size = region_size
+        self.regions = set()
+        self.names: List[str] = list()
+        self.ids = set()
+        self._coordinates: List[Tuple[float, float]] = list()
+        self._vectors = np.empty((0, 3))
+        self._lock = threading.Lock()
+
+    def region(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        """Region containing the point."""
+        return floor(latitude / self.region_size), floor(longitude / self.region_size)
+
+    def bbox(self, region: Tuple[int, int]) -> Tuple[float, float, float, float]:
+        """South, west, north, east bounds of a region."""
+        return (region[0] * self.region_size, region[1] * self.region_size,
+                (region[0] + 1) * self.region_size, (region[1] + 1) * self.region_size)
+
+    def add_region(self, region: Tuple[int, int], elements: List[Dict]) -> None:
+        """Add the place nodes of a region given as Overpass elements."""
+        with self._lock:
+            for element in elements:
+                if element['type'] == 'node' and 'name' in element.get('tags', {}) \
+                        and element['id'] not in self.ids:
+                    self.ids.add(element['id'])
+                    self.names.append(element['tags']['name'])
+                    self._coordinates.append((element['lat'], element['lon']))
+            self._vectors = _unit_vectors(np.array(self._coordinates).reshape(-1, 2))
+            self.regions.add(region)
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Tuple[str, float]]:
+        """Nearest loaded place.
+
+        return name, distance: name of the place and great circle distance
+        in meters, None if no place is loaded
+        """
+        vectors = self._vectors
+        if not len(vectors):
+            return None
+        scores = vectors @ _unit_vectors(np.array([[latitude, longitude]]))[0]
+        index = int(np.argmax(scores))
+        return self.names[index], EARTH_RADIUS * float(np.arccos(np.clip(scores[index], -1.0, 1.0)))
+
+    def covered_distance(self, latitude: float, longitude: float, rings: int) -> float:
+        """Distance from the point to the border of the loaded square of regions."""
+        row, col = self.region(latitude, longitude)
+        south, west, _, _ = self.bbox((row - rings, col - rings))
+        _, _, north, east = self.bbox((row + rings, col + rings))
+        meters_per_degree = radians(1) * EARTH_RADIUS
+        return min(latitude - south, north - latitude,
+                   (longitude - west) * cos(radians(latitude)),
+                   (east - longitude) * cos(radians(latitude))) * meters_per_degree
+
+
+__all__ = ["PlaceIndex"]
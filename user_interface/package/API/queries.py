@@ -1,21 +1,46 @@
 """Queries used with API."""
+from typing import List
 
 
 def query_city(
-        rad: float,
-        latitude: float,
-        longitude: float,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
 ) -> str:
-    """Create an overpass query to find the nearest city from the point.
+    """Create an overpass query to get the cities of a bounding box.
 
-    :param rad: Initial search radius.
-    :param latitude: Latitude of the point.
-    :param longitude: Longitude of the point.
+    :param south: Southern latitude of the box.
+    :param west: Western longitude of the box.
+    :param north: Northern latitude of the box.
+    :param east: Eastern longitude of the box.
+
+    return overpass_query : build the query to get the town, city and village
+    nodes of the box
+    """
+    overpass_query = f"""[out:json][timeout:800];node["place"~"^(town|city|village)$"]({south},{west},{north},{east});out body;"""
+    return overpass_query
+
+
+def query_boundaries(
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        admin_level: int = 8,
+) -> str:
+    """Create an overpass query to get the administrative boundaries of a bounding box.
 
-    return overpass_query : build the query to find the nearest city from your
-    point
+    :param south: Southern latitude of the box.
+    :param west: Western longitude of the box.
+    :param north: Northern latitude of the box.
+    :param east: Eastern longitude of the box.
+    :param admin_level: OSM admin_level of the boundaries, 8 for communes.
+
+    return overpass_query : build the query to get the boundary relations
+    crossing the box with the geometry of their member ways
     """
-    overpass_query = f"""[out:json][timeout:800];(node["place"="town"](around:{rad},{latitude},{longitude});node["place"="city"](around:{rad},{latitude},{longitude});node["place"="village"](around:{rad},{latitude},{longitude}););out body;>;out skel qt;"""
+    overpass_query = f"""[out:json][timeout:800];relation["boundary"="administrative"]["admin_level"="{admin_level}"]({south},{west},{north},{east});out body geom;"""
     return overpass_query
 
 
@@ -24,28 +49,19 @@ def query_street(
         latitude: float,
         longitude: float,
 ) -> str:
-    """Create an overpass query to find the nearest street from the point.
+    """Create an overpass query to get the named ways around the point.
 
-    :param rad: Initial search radius.
+    :param rad: Search radius.
     :param latitude: Latitude of the point.
     :param longitude: Longitude of the point.
 
-    return overpass_query : build the query to find the nearest street
-    from your point
+    return overpass_query : build the query to get the named ways, with their
+    nodes and geometry, around your point
     """
-    overpass_query = f"[out:json][timeout:800];way(around:{rad},{latitude},{longitude})[name];(._;>;);out;"
+    overpass_query = f"[out:json][timeout:800];way(around:{rad},{latitude},{longitude})[name];out body geom;"
     return overpass_query
 
 
-def query_ways(
-        latitude: float,
-        longitude: float,
-) -> str:
-    """."""
-    overpass_query_get_ways = f"[out:json][timeout:800];way(around:2,{latitude},{longitude})[name];(._;>;);out;"
-    return overpass_query_get_ways
-
-
 def query_nodes(
         id_node: int,
 ) -> str:
@@ -60,4 +76,78 @@ def query_nodes(
     return overpass_query_get_node
 
 
-__all__ = ["query_city", "query_street", "query_ways", "query_nodes"]
+def query_nodes_ways(
+        list_node: List[int],
+) -> str:
+    """Create the query to get nodes and the named ways going through them.
+
+    :param list_node: Ids of the nodes.
+
+    return overpass_query_get_nodes_ways : build the query to get the nodes
+    and, in the same response, the named ways having one of them as member
+    """
+    ids = ",".join(str(id_node) for id_node in list_node)
+    overpass_query_get_nodes_ways = f"[out:json][timeout:800];node(id:{ids});out;way(bn)[name];out;"
+    return overpass_query_get_nodes_ways
+
+
+def query_tile_ways(
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+) -> str:
+    """Create an overpass query to get the named ways crossing a tile.
+
+    :param south: Southern latitude of the tile.
+    :param west: Western longitude of the tile.
+    :param north: Northern latitude of the tile.
+    :param east: Eastern longitude of the tile.
+
+    return overpass_query : build the query to get the named ways, with their
+    nodes and geometry, crossing the tile
+    """
+    overpass_query = f"[out:json][timeout:800];way[name]({south},{west},{north},{east});out body geom;"
+    return overpass_query
+
+
+def query_boundary_by_name(
+        name: str,
+        admin_level: int = 8,
+) -> str:
+    """Create an overpass query to get the administrative boundaries of a name.
+
+    :param name: name of the boundary, e.g. a commune.
+    :param admin_level: OSM admin_level of the boundaries, 8 for communes.
+
+    return overpass_query : build the query to get the boundary relations of
+    that name with the geometry of their member ways
+    """
+    name = name.replace('"', '\\"')
+    overpass_query = f"""[out:json][timeout:800];relation["boundary"="administrative"]["admin_level"="{admin_level}"]["name"="{name}"];out body geom;"""
+    return overpass_query
+
+
+def query_area_streets(
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+) -> str:
+    """Create an overpass query to get the streets of a bounding box at once.
+
+    :param south: Southern latitude of the box.
+    :param west: Western longitude of the box.
+    :param north: Northern latitude of the box.
+    :param east: Eastern longitude of the box.
+
+    return overpass_query : build the query to get the named ways crossing the
+    box with their geometry, then their nodes, then every named way going
+    through one of these nodes with its geometry
+    """
+    overpass_query = f"[out:json][timeout:800];way[name]({south},{west},{north},{east});out body geom;node(w);out;way(bn)[name];out body geom;"
+    return overpass_query
+
+
+__all__ = ["query_city", "query_boundaries", "query_boundary_by_name", "query_area_streets", "query_street", "query_nodes", "query_nodes_ways",
+           "query_tile_ways"]
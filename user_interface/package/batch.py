@@ -0,0 +1,286 @@
+"""Streaming, resumable batch processing of large CSV files.
+
+The input is read in chunks of rows, each chunk goes through pipeline_uni or
+pipeline_multi in a pool of worker processes sharing the SQLite cache, and
+the result rows are written as soon as a chunk completes. A checkpoint file
+records the chunks written, so an interrupted run resumes where it stopped.
+A chunk that fails is processed again row by row: its good rows are written
+and the rows that still fail go to an errors file with their error, so
+running again does not retry them.
+
+The points of a chunk are located together, so num_arbre, the order of a
+point in its section, only counts the points of the same chunk: a section
+whose points span several chunks is numbered from 1 in each of them.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Set, Tuple
+
+import pandas as pd
+
+from . import config
+from .pipeline_multi import pipeline_multi
+from .pipeline_uni import pipeline_uni
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = {"uni": ["lat", "lng"], "multi": ["lat1", "lng1", "lat2", "lng2"]}
+
+
+def read_chunks(filename: str, mode: str, chunk_size: int) -> Iterator[Tuple[int, List]]:
+    """Read the coordinates of the input by chunks of chunk_size rows.
+
+    Rows with a missing coordinate are skipped.
+
+    :param filename: path of the input CSV.
+    :param mode: "uni" (lat, lng columns) or "multi" (lat1, lng1, lat2, lng2).
+    :param chunk_size: number of rows of a chunk.
+
+    return index, coords: index of the chunk and the input of the pipeline
+    """
+    reader = pd.read_csv(filename, usecols=COLUMNS[mode], chunksize=chunk_size)
+    for index, chunk in enumerate(reader):
+        chunk = chunk.dropna()
+        if mode == "uni":
+            coords = list(zip(chunk.lat, chunk.lng))
+        else:
+            coords = list(zip(zip(chunk.lat1, chunk.lng1), zip(chunk.lat2, chunk.lng2)))
+        yield index, coords
+
+
+def _pipeline(mode: str, coords: List) -> pd.DataFrame:
+    if mode == "uni":
+        return pipeline_uni(coords, map_filename=None)
+    return pipeline_multi(coords, map_filename=None)
+
+
+def process_chunk(mode: str, index: int, coords: List) -> Tuple[int, pd.DataFrame, pd.DataFrame]:
+    """Run the pipeline on a chunk, in a worker process.
+
+    If the chunk fails, its rows are processed one by one to find the rows
+    that fail, then the good rows are processed again together so that they
+    are numbered as in a chunk without errors.
+
+    return index, results, errors: index of the chunk, its result rows and
+    the input rows that failed with their error
+    """
+    if not coords:
+        return index, None, None
+    try:
+        return index, _pipeline(mode, coords), None
+    except Exception as err:  # pylint: disable=broad-except
+        logger.warning(f"Chunk {index} failed ({err}), processing its rows one by one")
+    good, errors = list(), list()
+    for row in coords:
+        try:
+            _pipeline(mode, [row])
+            good.append(row)
+        except Exception as err:  # pylint: disable=broad-except
+            flat = list(row) if mode == "uni" else [*row[0], *row[1]]
+            errors.append(flat + [f"{type(err).__name__}: {err}"])
+    # The lookups of the good rows are cached by now.
+    return (index, _pipeline(mode, good) if good else None,
+            pd.DataFrame(errors, columns=COLUMNS[mode] + ["error"]))
+
+
+class Checkpoint:
+    """Append-only record of the chunks written to the output.
+
+    The first line describes the run, every other line is a chunk written and
+    the sizes of the output and of the errors file once written, so rows
+    written after the last recorded chunk (by a run killed in between) are
+    dropped on resume.
+    """
+
+    def __init__(self, filename: str, run: Dict):
+        """Open the checkpoint of a run, starting a new one if missing.
+
+        :param filename: path of the checkpoint file.
+        :param run: description of the run, a checkpoint of another run is refused.
+        """
+        self.filename = filename
+        self.done: Set[int] = set()
+        self.output_size = 0
+        self.errors_size = 0
+        if os.path.exists(filename):
+            with open(filename) as file:
+                lines = [json.loads(line) for line in file if line.strip()]
+            if lines and lines[0] != run:
+                raise ValueError(
+                    f"Checkpoint {filename} belongs to another run {lines[0]}, "
+                    "use --restart to discard it")
+            for line in lines[1:]:
+                self.done.add(line["chunk"])
+                self.output_size = line["size"]
+                self.errors_size = line.get("errors", 0)
+            if lines:
+                return
+        with open(filename, "w") as file:
+            file.write(json.dumps(run) + "\n")
+
+    def record(self, index: int, output_size: int, errors_size: int) -> None:
+        """Record a chunk once its rows and errors are on disk."""
+        self.done.add(index)
+        self.output_size = output_size
+        self.errors_size = errors_size
+        with open(self.filename, "a") as file:
+            file.write(json.dumps({"chunk": index, "size": output_size, "errors": errors_size}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class CsvWriter:
+    """Append the result rows to a CSV file."""
+
+    def __init__(self, filename: str, size: int):
+        """Open the output, truncated to the size recorded by the checkpoint."""
+        self.filename = filename
+        if size and os.path.exists(filename):
+            with open(filename, "r+b") as file:
+                file.truncate(size)
+        else:
+            open(filename, "w").close()
+
+    def write(self, index: int, results: pd.DataFrame) -> int:
+        """Append the rows of a chunk and return the size of the output."""
+        with open(self.filename, "a", newline="") as file:
+            results.to_csv(file, header=file.tell() == 0, index=False)
+            file.flush()
+            os.fsync(file.fileno())
+        # The position of a text file is opaque, the checkpoint needs a size in bytes.
+        return os.path.getsize(self.filename)
+
+
+class ParquetWriter:
+    """Write the result rows as a directory of Parquet files, one per chunk."""
+
+    def __init__(self, filename: str, size: int):
+        """Create the output directory, emptied when no chunk was recorded."""
+        self.filename = filename
+        os.makedirs(filename, exist_ok=True)
+        if not size:
+            for part in os.listdir(filename):
+                os.remove(os.path.join(filename, part))
+
+    def write(self, index: int, results: pd.DataFrame) -> int:
+        """Write the rows of a chunk and return the number of chunks written."""
+        part = os.path.join(self.filename, f"part-{index:06d}.parquet")
+        results.to_parquet(part + ".tmp", index=False)
+        os.replace(part + ".tmp", part)
+        return len(os.listdir(self.filename))
+
+
+def run(input_file: str, output_file: str, mode: str = "uni", chunk_size: int = None,
+        workers: int = None, checkpoint_file: str = None, restart: bool = False,
+        errors_file: str = None) -> Set[int]:
+    """Process a CSV by chunks in a process pool, resuming from the checkpoint.
+
+    :param input_file: path of the input CSV.
+    :param output_file: path of the output, .parquet for Parquet, else CSV.
+    :param mode: "uni" for pipeline_uni, "multi" for pipeline_multi.
+    :param chunk_size: number of rows of a chunk.
+    :param workers: number of worker processes.
+    :param checkpoint_file: path of the checkpoint, next to the output by default.
+    :param restart: discard the checkpoint and the output of a previous run.
+    :param errors_file: CSV of the rows that failed, next to the output by default.
+
+    return failed: indexes of the chunks that could not be processed at all,
+    processed again on the next run
+    """
+    settings = config.data.get("Batch", {})
+    chunk_size = chunk_size or settings.get("chunk_size", 1000)
+    workers = workers or settings.get("workers", os.cpu_count())
+    checkpoint_file = checkpoint_file or output_file + ".checkpoint"
+    errors_file = errors_file or output_file + ".errors.csv"
+    if workers > 1 and config.data.get("Cache", {}).get("store", "sqlite") != "sqlite":
+        logger.warning("Only the sqlite cache store can be shared by the worker processes")
+
+    if restart and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    run_description = {"input": os.path.abspath(input_file), "mode": mode,
+                       "chunk_size": chunk_size}
+    checkpoint = Checkpoint(checkpoint_file, run_description)
+    if checkpoint.done:
+        logger.info(f"Resuming, {len(checkpoint.done)} chunks already written")
+    writer_class = ParquetWriter if output_file.endswith(".parquet") else CsvWriter
+    writer = writer_class(output_file, checkpoint.output_size)
+    errors = CsvWriter(errors_file, checkpoint.errors_size)
+
+    failed = set()
+    chunks = ((index, coords) for index, coords in read_chunks(input_file, mode, chunk_size)
+              if index not in checkpoint.done)
+    # Spawned workers open their own cache connection instead of inheriting ours.
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = {}
+        for index, coords in chunks:
+            pending[pool.submit(process_chunk, mode, index, coords)] = index
+            # Only read ahead what the workers can take.
+            if len(pending) >= 2 * workers:
+                _collect(pending, writer, errors, checkpoint, failed)
+        while pending:
+            _collect(pending, writer, errors, checkpoint, failed)
+    if checkpoint.errors_size:
+        logger.warning(f"Some rows failed, see {errors_file}")
+    elif os.path.exists(errors_file):
+        os.remove(errors_file)
+    if failed:
+        logger.error(f"{len(failed)} chunks failed, run again to retry them: {sorted(failed)}")
+    return failed
+
+
+def _collect(pending: Dict, writer, errors: CsvWriter, checkpoint: Checkpoint, failed: Set[int]) -> None:
+    """Wait for chunks to complete, write their results and errors and record them."""
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        index = pending.pop(future)
+        try:
+            _, results, rows_failed = future.result()
+        except Exception as err:
+            logger.error(f"Chunk {index} failed: {err}")
+            failed.add(index)
+            continue
+        size, errors_size = checkpoint.output_size, checkpoint.errors_size
+        if results is not None and len(results):
+            size = writer.write(index, results)
+        if rows_failed is not None and len(rows_failed):
+            errors_size = errors.write(index, rows_failed)
+            logger.warning(f"Chunk {index}: {len(rows_failed)} rows failed")
+        checkpoint.record(index, size, errors_size)
+        logger.info(f"Chunk {index} written")
+
+
+def main(argv: List[str] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["uni", "multi"],
+                        help="uni: lat, lng columns; multi: lat1, lng1, lat2, lng2 columns")
+    parser.add_argument("input", help="input CSV file")
+    parser.add_argument("-o", "--output", required=True,
+                        help="output file, written as Parquet if it ends with .parquet")
+    parser.add_argument("--chunk-size", type=int,
+                        help="rows per chunk, num_arbre numbers the points of a section within their chunk")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--checkpoint", help="checkpoint file, OUTPUT.checkpoint by default")
+    parser.add_argument("--errors", help="CSV of the rows that failed, OUTPUT.errors.csv by default")
+    parser.add_argument("--restart", action="store_true",
+                        help="discard the checkpoint and start from the first row")
+    args = parser.parse_args(argv)
+    try:
+        failed = run(args.input, args.output, args.mode, args.chunk_size, args.workers,
+                     args.checkpoint, args.restart, args.errors)
+    except ValueError as err:
+        logger.error(err)
+        return 2
+    return 1 if failed else 0
+
+
+__all__ = ["run", "main", "read_chunks", "process_chunk", "Checkpoint"]
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,18 @@
-"""Load yaml config file."""
+"""Load yaml config file.
+
+The file is the one named by the EBEC_CONFIG environment variable, else
+config.yaml in the working directory, else the config.yaml at the root of
+the repository, so that the package can be used from any directory.
+Relative paths written in the config are taken from the directory of the file.
+"""
+import os
 from contextlib import contextmanager
 
 import yaml
 
+REPOSITORY_CONFIG = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, "config.yaml")
+
 
 @contextmanager
 def opened_w_error(filename, mode="r"):
@@ -18,10 +28,27 @@ def opened_w_error(filename, mode="r"):
             file.close()
 
 
-with opened_w_error("config.yaml") as (config_file, err):
+def find_config() -> str:
+    """Path of the config file, see the module docstring."""
+    for filename in (os.environ.get("EBEC_CONFIG"), "config.yaml", REPOSITORY_CONFIG):
+        if filename and os.path.exists(filename):
+            return os.path.normpath(os.path.abspath(filename))
+    return "config.yaml"
+
+
+filename = find_config()
+directory = os.path.dirname(os.path.abspath(filename))
+
+
+def resolve(path: str) -> str:
+    """Path of a file named in the config, relative paths are from the directory of the config."""
+    return os.path.join(directory, path)
+
+
+with opened_w_error(filename) as (config_file, err):
     if err:
         print("Error while reading config file")
     else:
         data = yaml.load(config_file, Loader=yaml.FullLoader)
 
-__all__ = ["data"]
+__all__ = ["data", "filename", "resolve"]
@@ -0,0 +1,159 @@
+"""Background jobs with a bounded queue and one output directory per job."""
+import logging
+import os
+import pickle
+import queue
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted to a full queue."""
+
+
+class Job:
+    """A function run in the background, writing its outputs to its own directory.
+
+    The value returned by the function is written to the directory as the
+    result of the job, only its path is kept in memory.
+    """
+
+    def __init__(self, function: Callable, args: tuple, directory: str):
+        """Create a queued job."""
+        self.id = os.path.basename(directory)
+        self.directory = directory
+        self.function = function
+        self.args = args
+        self.status = QUEUED
+        self.result_path = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def path(self, filename: str) -> str:
+        """Path of an output file of the job."""
+        return os.path.join(self.directory, filename)
+
+    def result(self) -> Any:
+        """Value returned by the function, read from the directory of the job."""
+        with open(self.result_path, "rb") as file:
+            return pickle.load(file)
+
+    def to_dict(self) -> Dict:
+        """Status of the job, as sent to the clients."""
+        return {"id": self.id, "status": self.status, "error": self.error,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished}
+
+
+class JobQueue:
+    """Run jobs on a pool of worker threads fed by a bounded queue.
+
+    Every job gets a directory named after its id under root, passed to its
+    function as the directory argument, so concurrent jobs never share an
+    output file. Finished jobs and their directories are dropped after
+    retention seconds, checked by the workers and on every lookup.
+    """
+
+    # Seconds an idle worker waits for a job before dropping the expired ones.
+    expiry_interval = 60.0
+
+    def __init__(self, root: str, workers: int = 2, max_queued: int = 100, retention: float = 86400):
+        """Start the worker threads.
+
+        :param root: directory of the job directories.
+        :param workers: number of jobs run at once.
+        :param max_queued: number of jobs waiting for a worker before submit is refused.
+        :param retention: seconds a finished job is kept.
+        """
+        self.root = root
+        self.retention = retention
+        self._jobs: Dict[str, Job] = dict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queued)
+        os.makedirs(root, exist_ok=True)
+        for index in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True).start()
+
+    def submit(self, function: Callable, *args) -> Job:
+        """Queue function(*args, directory=...) and return its job at once.
+
+        Raises QueueFull if max_queued jobs are already waiting.
+        """
+        self._drop_expired()
+        job = Job(function, args, os.path.join(self.root, uuid.uuid4().hex))
+        os.makedirs(job.directory)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            shutil.rmtree(job.directory, ignore_errors=True)
+            raise QueueFull(f"{self._queue.maxsize} jobs already queued")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Job of an id, None if unknown or expired."""
+        self._drop_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _work(self) -> None:
+        while True:
+            try:
+                job = self._queue.get(timeout=self.expiry_interval)
+            except queue.Empty:
+                self._drop_expired()
+                continue
+            job.status, job.started = RUNNING, time.time()
+            try:
+                result = job.function(*job.args, directory=job.directory)
+                result_path = job.path("result.pickle")
+                with open(result_path, "wb") as file:
+                    pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+                job.result_path = result_path
+            except Exception as err:  # pylint: disable=broad-except
+                logger.exception(f"Job {job.id} failed")
+                job.error = str(err)
+                job.status = FAILED
+            else:
+                job.status = DONE
+            finally:
+                job.finished = time.time()
+                # Drop the references to the inputs of the job.
+                job.function, job.args = None, ()
+                self._queue.task_done()
+            self._drop_expired()
+
+    def _drop_expired(self) -> None:
+        limit = time.time() - self.retention
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished is not None and job.finished < limit]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+
+def from_config() -> JobQueue:
+    """Job queue set up from the Jobs section of the config."""
+    settings = config.data.get("Jobs", {})
+    return JobQueue(root=config.resolve(settings.get("directory", "jobs")),
+                    workers=settings.get("workers", 2),
+                    max_queued=settings.get("max_queued", 100),
+                    retention=settings.get("retention", 86400))
+
+
+__all__ = ["Job", "JobQueue", "QueueFull", "from_config", "QUEUED", "RUNNING", "DONE", "FAILED"]
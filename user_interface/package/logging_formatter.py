@@ -21,8 +21,13 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + record_format + reset,
     }
 
+    def __init__(self):
+        """Build the formatter of each level once."""
+        super().__init__()
+        self.formatters = {level: logging.Formatter(log_fmt)
+                           for level, log_fmt in self.FORMATS.items()}
+        self.default_formatter = logging.Formatter(None)
+
     def format(self, record: logging.LogRecord) -> str:
         """Format the provided record."""
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        return self.formatters.get(record.levelno, self.default_formatter).format(record)
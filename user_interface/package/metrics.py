@@ -0,0 +1,202 @@
+"""Process metrics exposed in the Prometheus text format.
+
+Counters and histograms are updated by the requests, the API lookups and the
+pipeline stages; gauges read their value when the metrics are collected.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """Metric with a name, a help text and optional label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Create the metric, register it with registry.register."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """Lines of the samples of the metric."""
+
+    def render(self) -> str:
+        """Text exposition of the metric."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonic count, per label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Create a counter at zero."""
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = dict()
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Add amount to the count of the label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Current count of the label values."""
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(Metric):
+    """Value read from a function when the metrics are collected."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float],
+                 kind: str = "gauge"):
+        """Create a gauge reading function(), kind is "counter" for a count kept elsewhere."""
+        super().__init__(name, documentation)
+        self.function = function
+        self.kind = kind
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {_number(self.function())}"
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets, per label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Create an empty histogram."""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], List] = dict()
+
+    def observe(self, value: float, **labels) -> None:
+        """Add an observation to the distribution of the label values."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, [[0] * len(self.buckets), 0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key][1] = total + value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, bucket)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    """Metrics of the process, rendered together."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self._metrics: Dict[str, Metric] = dict()
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, a metric of the same name is replaced."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Text exposition of all the metrics."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+overpass_requests = registry.register(Counter(
+    "overpass_requests_total", "Requests sent to the Overpass API by status code.", ["status"]))
+overpass_request_seconds = registry.register(Histogram(
+    "overpass_request_seconds", "Duration of the requests sent to the Overpass API."))
+overpass_retries = registry.register(Counter(
+    "overpass_retries_total", "Requests to the Overpass API sent again after a failure."))
+overpass_dropped = registry.register(Counter(
+    "overpass_dropped_queries_total", "Queries given up after all the attempts."))
+cache_lookups = registry.register(Counter(
+    "cache_lookups_total", "Cache lookups of the queries by result (hit or miss).", ["result"]))
+street_search_steps = registry.register(Histogram(
+    "nearest_street_search_steps", "Radius doublings of a nearest street search.",
+    buckets=(0, 1, 2, 3, 4, 5)))
+stage_seconds = registry.register(Histogram(
+    "pipeline_stage_seconds", "Duration of the stages of the pipelines.", ["stage"]))
+
+
+def timed(stage: str) -> Callable:
+    """Decorator observing the duration of each call in pipeline_stage_seconds."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage_seconds.time(stage=stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+__all__ = ["Counter", "Gauge", "Histogram", "Registry", "registry", "timed",
+           "overpass_requests", "overpass_request_seconds", "overpass_retries", "overpass_dropped",
+           "cache_lookups", "street_search_steps", "stage_seconds"]
@@ -1,12 +1,12 @@
+import asyncio
 import logging
-import pandas as pd
 import unicodedata
-from .supercharged_requests import save
-from .utils.utils import (conversion_list_dict, distance_from_segment,
-                          find_optimal, generate_results, get_order_in_segment,
-                          get_road_sections, get_ways, visualisation_sections)
+from . import metrics
+from .supercharged_requests import event_loop, save
+from .utils.utils import (find_optimal_batch, get_street_graph,
+                          visualisation_sections)
 
-from  .API.get_nearest_city import (get_nearest_city)
+from  .API.get_nearest_city import (get_cities)
 from  .API.get_nearest_street import (get_nearest_street)
 
 log_level = logging.INFO
@@ -15,38 +15,71 @@ logging.getLogger("package").setLevel(log_level)
 coords = [(48.89535, 2.24697), (48.89529, 2.24705),
           (48.89518, 2.2472), (48.89394122, 2.247959188)]
 
-def pipeline_uni(coords):
+async def group_by_street(coords):
+    """Resolve the nearest street of every point concurrently and group the points by street.
 
+    return streets: keys are way ids, values are the way and its points
+    """
+    ways = await asyncio.gather(
+        *(event_loop.run_blocking(get_nearest_street, *coord) for coord in coords))
+    streets = {}
+    for coord, way in zip(coords, ways):
+        streets.setdefault(way['id'], {'way': way, 'coords': []})['coords'].append(coord)
+    return streets
+
+
+def assign_street(way, coords):
+    """Build the street graph once and assign all the points of the street in one pass.
+
+    A street crossing fewer than two named ways has dead-end sections, see
+    StreetGraph; only a street without nodes leaves its points unassigned.
+
+    return graph, troncons: graph of the street and the section of every
+    point, None if it has none
+    """
+    graph = get_street_graph(way)
+    return graph, find_optimal_batch(coords, graph)
+
+
+async def pipeline_uni_async(coords, map_filename='map.html'):
+    """Locate the points, streets and cities being resolved concurrently.
+
+    All the lookups run on the shared event loop and executor, the requests
+    they send share the concurrency limit of the transport. No map is drawn
+    when map_filename is None.
+    """
     result = {}
-    roads_dict = {}
-    ways_dict = {}
-    for coord in coords:
-        ways, name = get_ways(*coord)
-        roads = get_road_sections(intersection_list=ways, road_name=name)
-        ways_dict[coord] = ways
-        roads_dict.update(conversion_list_dict(roads))
-        dict_distances = distance_from_segment(coord, roads_dict)
-        troncon = find_optimal(dict_distances)
-        if troncon in result:
-            result[troncon].append(coord)
-        else:
-            result[troncon] = []
-            result[troncon].append(coord)
+    graphs = {}
+    street = {}
+    unassigned = []
+    groups = list((await group_by_street(coords)).values())
+    assigned = await asyncio.gather(
+        *(event_loop.run_blocking(assign_street, group['way'], group['coords']) for group in groups))
+    for group, (graph, troncons) in zip(groups, assigned):
+        for coord, troncon in zip(group['coords'], troncons):
+            if troncon is None:
+                unassigned.append((coord, group['way']['tags']['name']))
+                continue
+            graphs[troncon] = graph
+            street[troncon] = ''.join((c for c in unicodedata.normalize('NFD', group['way']['tags']['name']) if unicodedata.category(c) != 'Mn')) # Remove accent
+            if troncon in result:
+                result[troncon].append(coord)
+            else:
+                result[troncon] = []
+                result[troncon].append(coord)
 
+    cities = await event_loop.run_blocking(
+        get_cities, [result[troncon][0] for troncon in result] + [coord for coord, _ in unassigned])
+    unassigned_cities = cities[len(result):]
     city = {}
-    street = {}
     Resultat_inter = {}
-    for troncon in result:
+    for troncon, nearest_city in zip(result, cities):
         coords = result[troncon]
         if len(coords) == 1:
             test = {coords[0]: 1}
         else:
-            noeuds_troncon = roads_dict[troncon]
-            section = [troncon[0], troncon[1],
-                       noeuds_troncon[0], noeuds_troncon[1]]
-            test = get_order_in_segment(coords, section)
-        city[troncon] = ''.join((c for c in unicodedata.normalize('NFD', get_nearest_city(coords[0][0], coords[0][1])) if unicodedata.category(c) != 'Mn')) # Remove accent
-        street[troncon] = ''.join((c for c in unicodedata.normalize('NFD', get_nearest_street(coords[0][0], coords[0][1])['tags']['name']) if unicodedata.category(c) != 'Mn')) # Remove accent 
+            test = graphs[troncon].order_in_section(troncon, coords)
+        city[troncon] = ''.join((c for c in unicodedata.normalize('NFD', nearest_city) if unicodedata.category(c) != 'Mn')) # Remove accent
         Resultat_inter[troncon] = test
 
     Liste_resultat = []
@@ -57,12 +90,22 @@ def pipeline_uni(coords):
             Liste_resultat.append([coord[0], coord[1], street[troncon], ''.join((c for c in unicodedata.normalize('NFD', troncon[0]) if unicodedata.category(c) != 'Mn')),
                                    ''.join((c for c in unicodedata.normalize('NFD', troncon[1]) if unicodedata.category(c) != 'Mn')), Resultat_inter[troncon][coord], city[troncon]])
 
-            list_data.append(
-                [coord, (*troncon, *roads_dict[troncon]), ways_dict[coord]])
+            list_data.append([coord, troncon, graphs[troncon]])
+    for (coord, name), nearest_city in zip(unassigned, unassigned_cities):
+        Liste_resultat.append([coord[0], coord[1], ''.join((c for c in unicodedata.normalize('NFD', name) if unicodedata.category(c) != 'Mn')), '', '', 1,
+                               ''.join((c for c in unicodedata.normalize('NFD', nearest_city) if unicodedata.category(c) != 'Mn'))])
+    import pandas as pd  # pylint: disable=import-outside-toplevel
     df = pd.DataFrame(Liste_resultat)
     df.columns = ['latitude', 'longitude', 'rue',
                   'debut_troncon', 'fin_troncon', 'num_arbre', 'ville']
-    visualisation_sections(list_data, 'map.html')
-    save()
-    
+    if map_filename is not None:
+        await event_loop.run_blocking(visualisation_sections, list_data, map_filename)
+    await event_loop.run_blocking(save)
+
     return df
+
+
+@metrics.timed("pipeline_uni")
+def pipeline_uni(coords, map_filename='map.html'):
+    """Sync wrapper of pipeline_uni_async running on the shared event loop."""
+    return event_loop.run(pipeline_uni_async(coords, map_filename))
@@ -0,0 +1,207 @@
+"""Warm the cache for a whole survey area with a few bulk queries.
+
+The named ways of the area come with their nodes and the named ways going
+through these nodes, one query per block of block_size degrees. Each
+response is cut into the entries later read by the lookups: the tiles of
+get_nearest_street, the node batches (or single nodes) of
+get_ways_from_node, and the boundary and place regions of get_cities.
+"""
+import argparse
+import logging
+import sys
+from collections import Counter, defaultdict
+from math import cos, radians
+from typing import Dict, Iterator, List, Tuple
+
+from . import config
+from .API import get_nearest_city
+from .API.queries import (query_area_streets, query_boundary_by_name,
+                          query_nodes, query_nodes_ways)
+from .supercharged_requests import save, supercharged_requests, tile_cache
+from .utils.geometry import EARTH_RADIUS, polyline_hits_bbox
+
+logger = logging.getLogger(__name__)
+
+
+def area_tiles(south: float, west: float, north: float, east: float,
+               margin: float) -> Tuple[int, int, int, int]:
+    """First and last rows and columns of the tiles covering the box and a margin around it.
+
+    :param margin: meters added on every side, so that the circles searched
+    around the points of the box are covered.
+    """
+    delta_lat = margin / (radians(1) * EARTH_RADIUS)
+    delta_lon = delta_lat / max(cos(radians(max(abs(south), abs(north)))), 1e-6)
+    row_min, col_min = tile_cache.tile_of(south - delta_lat, west - delta_lon)
+    row_max, col_max = tile_cache.tile_of(north + delta_lat, east + delta_lon)
+    return row_min, col_min, row_max, col_max
+
+
+def blocks(tiles: Tuple[int, int, int, int], size: int) -> Iterator[Tuple[int, int, int, int]]:
+    """Split a range of tiles in blocks of at most size × size tiles."""
+    row_min, col_min, row_max, col_max = tiles
+    for row in range(row_min, row_max + 1, size):
+        for col in range(col_min, col_max + 1, size):
+            yield row, col, min(row + size - 1, row_max), min(col + size - 1, col_max)
+
+
+def block_bbox(block: Tuple[int, int, int, int]) -> Tuple[float, float, float, float]:
+    """South, west, north, east bounds of a block of tiles."""
+    south, west, _, _ = tile_cache.tile_bbox(block[:2])
+    _, _, north, east = tile_cache.tile_bbox(block[2:])
+    return south, west, north, east
+
+
+def split_response(data: Dict, block: Tuple[int, int, int, int]) -> Dict[str, Dict]:
+    """Cut the response of query_area_streets into cache entries.
+
+    :param data: response of query_area_streets for the bbox of the block.
+    :param block: tiles of the query.
+
+    return entries: response of each query of the lookups, by query
+    """
+    header = {key: value for key, value in data.items() if key != 'elements'}
+    nodes = {element['id']: element for element in data['elements'] if element['type'] == 'node'}
+    ways = {element['id']: element for element in data['elements'] if element['type'] == 'way'}
+    row_min, col_min, row_max, col_max = block
+
+    # A named way crossing a tile of the block is in the response, the named
+    # ways only found through a node may cross some of them.
+    tiles = defaultdict(list)
+    streets = list()
+    for way in ways.values():
+        geometry = [(vertex['lat'], vertex['lon']) for vertex in way['geometry']]
+        (first_row, first_col) = tile_cache.tile_of(min(lat for lat, _ in geometry), min(lon for _, lon in geometry))
+        (last_row, last_col) = tile_cache.tile_of(max(lat for lat, _ in geometry), max(lon for _, lon in geometry))
+        crossed = [(row, col) for row in range(max(first_row, row_min), min(last_row, row_max) + 1)
+                   for col in range(max(first_col, col_min), min(last_col, col_max) + 1)
+                   if polyline_hits_bbox(geometry, tile_cache.tile_bbox((row, col)))]
+        for tile in crossed:
+            tiles[tile].append(way)
+        if crossed:
+            streets.append(way)
+
+    entries = dict()
+    if tile_cache.enabled:
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                elements = sorted(tiles[(row, col)], key=lambda way: way['id'])
+                entries[tile_cache.tile_query((row, col))] = {**header, 'elements': elements}
+
+    ways_of_node = defaultdict(list)
+    for way in ways.values():
+        for id_node in way['nodes']:
+            ways_of_node[id_node].append(way)
+    settings = config.data.get("Ways_from_node")
+    batch_size = settings.get("batch_size", 500)
+    for street in streets:
+        unique_nodes = list(dict.fromkeys(street['nodes']))
+        if any(id_node not in nodes for id_node in unique_nodes):
+            continue
+        if not settings.get("batched", True):
+            for id_node in unique_nodes:
+                entries[query_nodes(id_node)] = {**header, 'elements': [nodes[id_node]]}
+            continue
+        for start in range(0, len(unique_nodes), batch_size):
+            batch = unique_nodes[start:start + batch_size]
+            crossing = {way['id']: way for id_node in batch for way in ways_of_node[id_node]}
+            elements = [nodes[id_node] for id_node in sorted(batch)]
+            elements += [{key: value for key, value in crossing[id_way].items() if key not in ('geometry', 'bounds')}
+                         for id_way in sorted(crossing)]
+            entries[query_nodes_ways(batch)] = {**header, 'elements': elements}
+    return entries
+
+
+def prefetch_area(south: float, west: float, north: float, east: float) -> Dict[str, int]:
+    """Fill the cache with everything the lookups of the points of a box read.
+
+    :param south: Southern latitude of the box.
+    :param west: Western longitude of the box.
+    :param north: Northern latitude of the box.
+    :param east: Eastern longitude of the box.
+
+    return counts: bulk queries sent and cache entries written
+    """
+    counts = Counter()
+    if supercharged_requests.backend == "local":
+        logger.info("The local backend answers every query offline, nothing to prefetch")
+        return counts
+    if not tile_cache.enabled:
+        logger.warning("Without the semantic cache, nearest street queries are keyed by point "
+                       "and are not prefetched")
+    margin = config.data.get("Nearest_street").get("Search").get("initial_radius", 100)
+    block_size = config.data.get("Prefetch", {}).get("block_size", 0.05)
+    tiles = area_tiles(south, west, north, east, margin)
+    for block in blocks(tiles, max(1, round(block_size / tile_cache.tile_size))):
+        logger.info(f"Prefetching the streets of {block_bbox(block)}")
+        entries = split_response(supercharged_requests.download(query_area_streets(*block_bbox(block))), block)
+        for overpass_query, data in entries.items():
+            supercharged_requests.store(overpass_query, data)
+        counts["queries"] += 1
+        counts["entries"] += len(entries)
+
+    # Only the first ring of place regions is loaded, get_nearest_place
+    # loads the next ones if a point is far from every place.
+    for index, load in ((get_nearest_city.boundary_index, get_nearest_city.load_boundaries),
+                        (get_nearest_city.place_index, get_nearest_city.load_region)):
+        row_min, col_min = index.region(south, west)
+        row_max, col_max = index.region(north, east)
+        for region in ((row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)):
+            load(region)
+            counts["regions"] += 1
+    save()
+    logger.info(f"Prefetched {counts['entries']} entries with {counts['queries']} bulk queries "
+                f"and {counts['regions']} boundary and place regions")
+    return counts
+
+
+def prefetch_commune(name: str, admin_level: int = None) -> Dict[str, int]:
+    """Fill the cache for the area of a commune, see prefetch_area.
+
+    :param name: name of the administrative boundary.
+    :param admin_level: OSM admin_level of the boundary, the one of the
+    Boundaries config (8, communes) by default.
+
+    return counts: bulk queries sent and cache entries written
+    """
+    if admin_level is None:
+        admin_level = config.data.get("Nearest_city").get("Boundaries", {}).get("admin_level", 8)
+    data = supercharged_requests.fetch(query_boundary_by_name(name, admin_level))
+    relations = [element for element in data['elements'] if element['type'] == 'relation']
+    if not relations:
+        raise ValueError(f"No administrative boundary of level {admin_level} named {name}")
+    counts = Counter()
+    for relation in relations:
+        vertices = [(vertex['lat'], vertex['lon']) for member in relation.get('members', ())
+                    for vertex in member.get('geometry', ())]
+        if not vertices:
+            continue
+        counts.update(prefetch_area(min(lat for lat, _ in vertices), min(lon for _, lon in vertices),
+                                    max(lat for lat, _ in vertices), max(lon for _, lon in vertices)))
+    return counts
+
+
+def main(argv: List[str] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    area = parser.add_mutually_exclusive_group(required=True)
+    area.add_argument("--bbox", nargs=4, type=float, metavar=("SOUTH", "WEST", "NORTH", "EAST"),
+                      help="bounds of the area")
+    area.add_argument("--commune", help="name of the administrative boundary of the area")
+    parser.add_argument("--admin-level", type=int, help="admin_level of the boundary, 8 by default")
+    args = parser.parse_args(argv)
+    try:
+        if args.commune:
+            prefetch_commune(args.commune, args.admin_level)
+        else:
+            prefetch_area(*args.bbox)
+    except ValueError as err:
+        logger.error(err)
+        return 2
+    return 0
+
+
+__all__ = ["prefetch_area", "prefetch_commune", "split_response", "main"]
+
+if __name__ == "__main__":
+    sys.exit(main())
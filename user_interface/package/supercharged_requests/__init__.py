@@ -1,5 +1,7 @@
 """Supercharged requests to handle errors from the API."""
-from .supercharged_requests import load, requests, save
+from . import event_loop, retry, transport
+from .retry import CircuitOpenError, OverpassError
+from .supercharged_requests import cache, flights, load, requests, save
 
-load()
-__all__ = ["requests", "save"]
+# The cache is opened by the first lookup, see cache().
+__all__ = ["requests", "save", "cache", "flights", "event_loop", "transport", "retry", "OverpassError", "CircuitOpenError"]
@@ -0,0 +1,386 @@
+"""Persistent stores of the cached Overpass responses."""
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+)"""
+
+
+class SqliteStore:
+    """Dict-like cache kept in an SQLite database in WAL mode.
+
+    Every entry is written as soon as it is set, so several processes can
+    share the same file. Entries older than ttl seconds are stale and the
+    least recently used ones are evicted once the values exceed max_size
+    bytes. A ttl or max_size of 0 disables the corresponding limit. Up to
+    mmap_size bytes of the file are memory-mapped, so lookups read the pages
+    they need instead of loading the cache.
+    """
+
+    # Access times are only refreshed on reads after that many seconds, so
+    # that hot keys don't turn every read into a write.
+    touch_interval = 60.0
+    # The total size is checked every evict_every writes.
+    evict_every = 100
+
+    def __init__(self, filename: str, ttl: float = 0, max_size: int = 0, mmap_size: int = 0):
+        """Open (and create if needed) the store."""
+        self.filename = filename
+        self.ttl = ttl
+        self.max_size = max_size
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(_SCHEMA)
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the current thread, reopened after a fork."""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.connection = sqlite3.connect(
+                self.filename, timeout=30, isolation_level=None, check_same_thread=False)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.execute("PRAGMA synchronous=NORMAL")
+            local.connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            local.pid = os.getpid()
+        return local.connection
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Value of a fresh entry, default if missing or stale."""
+        row = self._connection().execute(
+            "SELECT value, created, accessed FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        value, created, accessed = row
+        now = time.time()
+        if self.ttl and now - created > self.ttl:
+            self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+            return default
+        if now - accessed > self.touch_interval:
+            self._connection().execute(
+                "UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(value)
+
+    def __contains__(self, key: str) -> bool:
+        """Whether a fresh entry exists."""
+        return self.get(key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        """Value of a fresh entry."""
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        """Insert or replace an entry."""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+            (key, blob, now, now, len(blob)))
+        with self._writes_lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if self.max_size and evict:
+            self.evict()
+
+    def __delitem__(self, key: str) -> None:
+        """Remove an entry."""
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        """Number of entries, stale ones included."""
+        return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def keys(self) -> Iterator[str]:
+        """Keys of all the entries."""
+        return (key for key, in self._connection().execute("SELECT key FROM cache"))
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Keys and values of all the entries."""
+        return ((key, pickle.loads(value)) for key, value in
+                self._connection().execute("SELECT key, value FROM cache"))
+
+    def size(self) -> int:
+        """Total size of the stored values in bytes."""
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop stale entries, then least recently used ones down to 90% of max_size.
+
+        return removed: number of removed entries
+        """
+        connection = self._connection()
+        removed = 0
+        if self.ttl:
+            removed += connection.execute(
+                "DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        if self.max_size:
+            excess = self.size() - int(0.9 * self.max_size)
+            if excess > 0:
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    for key, size in connection.execute(
+                            "SELECT key, size FROM cache ORDER BY accessed").fetchall():
+                        if excess <= 0:
+                            break
+                        connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                        excess -= size
+                        removed += 1
+                finally:
+                    connection.execute("COMMIT")
+        if removed:
+            logger.info(f"Cache: evicted {removed} entries")
+        return removed
+
+    def close(self) -> None:
+        """Close the connection of the current thread."""
+        if getattr(self._local, "pid", None) == os.getpid():
+            self._local.connection.close()
+        self._local = threading.local()
+
+
+# Header of a journal record: length and CRC32 of the pickled (key, value) payload.
+_RECORD = struct.Struct("<II")
+
+
+def _load_snapshot(filename: str) -> Dict:
+    """Entries of a joblib snapshot, empty if there is none."""
+    if not os.path.exists(filename):
+        return dict()
+    import joblib  # pylint: disable=import-outside-toplevel
+    return joblib.load(filename)
+
+
+def _read_journal(filename: str, entries: Dict) -> int:
+    """Replay the complete records of a journal into entries.
+
+    return offset: end of the last complete record, anything after it is a
+    record torn by a crash
+    """
+    try:
+        with open(filename, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return 0
+    offset = 0
+    while offset + _RECORD.size <= len(data):
+        length, checksum = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        key, value = pickle.loads(payload)
+        entries[key] = value
+        offset = start + length
+    if offset < len(data):
+        logger.warning(f"Cache journal {filename}: dropped an incomplete record at byte {offset}")
+    return offset
+
+
+def load_entries(filename: str) -> Dict:
+    """Entries of a journal store (or of a legacy joblib cache), the files are left untouched."""
+    entries = _load_snapshot(filename)
+    for journal in (filename + ".journal.old", filename + ".journal"):
+        _read_journal(journal, entries)
+    return entries
+
+
+class JournalStore:
+    """Dict-like cache kept in memory, persisted as a snapshot and an append-only journal.
+
+    The snapshot is a joblib dump of the entries, as the legacy cache. Every
+    entry set is appended to filename.journal as a checksummed record and
+    flushed at once, so a crash loses at most the record being written and
+    save() only syncs the records added since the last call. When the
+    journal outgrows compact_ratio of the snapshot, a background thread
+    folds it into a new snapshot. Loading replays the snapshot then the
+    journal. Only one process at a time may write the store.
+    """
+
+    # The journal is not compacted below that many bytes.
+    min_compact_size = 1024 * 1024
+
+    def __init__(self, filename: str, compact_ratio: float = 0.5):
+        """Load (and create if needed) the store."""
+        self.filename = filename
+        self.compact_ratio = compact_ratio
+        self.journal_filename = filename + ".journal"
+        self._folded_filename = filename + ".journal.old"
+        self._lock = threading.Lock()
+        self._compaction = None
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._entries = _load_snapshot(filename)
+        interrupted = os.path.exists(self._folded_filename)
+        _read_journal(self._folded_filename, self._entries)
+        offset = _read_journal(self.journal_filename, self._entries)
+        self._journal = open(self.journal_filename, "ab")
+        self._truncate(offset)
+        if interrupted:
+            # A compaction was interrupted, the entries loaded hold both journals.
+            logger.info(f"Cache: finishing the compaction of {filename}")
+            self._write_snapshot(dict(self._entries))
+            self._truncate(0)
+            os.remove(self._folded_filename)
+
+    def _truncate(self, offset: int) -> None:
+        """Cut the journal at offset, the position read by size and save follows."""
+        self._journal.truncate(offset)
+        self._journal.seek(0, os.SEEK_END)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Value of an entry, default if missing."""
+        return self._entries.get(key, default)
+
+    def __contains__(self, key: str) -> bool:
+        """Whether an entry exists."""
+        return key in self._entries
+
+    def __getitem__(self, key: str) -> Any:
+        """Value of an entry."""
+        return self._entries[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        """Insert or replace an entry and append it to the journal."""
+        payload = pickle.dumps((key, value), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = value
+            self._journal.write(_RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._journal.flush()
+
+    def __len__(self) -> int:
+        """Number of entries."""
+        return len(self._entries)
+
+    def keys(self) -> Iterator[str]:
+        """Keys of all the entries."""
+        return iter(list(self._entries))
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Keys and values of all the entries."""
+        return iter(list(self._entries.items()))
+
+    def size(self) -> int:
+        """Size of the snapshot and the journal in bytes."""
+        with self._lock:
+            journal_size = self._journal.tell()
+        return journal_size + (os.path.getsize(self.filename) if os.path.exists(self.filename) else 0)
+
+    def save(self) -> None:
+        """Sync the journal to disk, then compact it in the background if it grew too large."""
+        with self._lock:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            journal_size = self._journal.tell()
+        snapshot_size = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        if journal_size > max(self.min_compact_size, self.compact_ratio * snapshot_size):
+            self.compact()
+
+    def compact(self, wait: bool = False) -> None:
+        """Fold the journal into a new snapshot, in a background thread unless wait.
+
+        The journal is renamed and a new one started at once, so entries can
+        be set during the compaction; the folded journal is removed once the
+        new snapshot has replaced the old one. The folded journal of a
+        compaction that failed is kept, and the journal is appended to it by
+        the next compaction.
+        """
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            if os.path.exists(self._folded_filename):
+                with open(self._folded_filename, "ab") as folded, open(self.journal_filename, "rb") as journal:
+                    shutil.copyfileobj(journal, folded)
+                    folded.flush()
+                    os.fsync(folded.fileno())
+                os.remove(self.journal_filename)
+            else:
+                os.replace(self.journal_filename, self._folded_filename)
+            self._journal = open(self.journal_filename, "ab")
+            entries = dict(self._entries)
+
+        def fold():
+            try:
+                self._write_snapshot(entries)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Cache: compaction of {self.filename} failed, the journal is kept")
+                return
+            os.remove(self._folded_filename)
+            logger.info(f"Cache: compacted {len(entries)} entries into {self.filename}")
+
+        # Not a daemon, so that exiting waits for the snapshot to be written.
+        self._compaction = threading.Thread(target=fold, name="cache-compaction")
+        self._compaction.start()
+        if wait:
+            self._compaction.join()
+
+    def _write_snapshot(self, entries: Dict) -> None:
+        """Replace the snapshot atomically."""
+        import joblib  # pylint: disable=import-outside-toplevel
+        temporary = self.filename + ".tmp"
+        joblib.dump(entries, temporary)
+        with open(temporary, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(temporary, self.filename)
+
+    def close(self) -> None:
+        """Wait for a running compaction, then sync and close the journal."""
+        if self._compaction is not None:
+            self._compaction.join()
+        with self._lock:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+
+
+def import_entries(store: SqliteStore, entries: Any) -> int:
+    """Copy the entries of a dict (like the legacy joblib cache) into a store.
+
+    return count: number of imported entries
+    """
+    now = time.time()
+    rows = list()
+    for key, value in entries.items():
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        rows.append((key, blob, now, now, len(blob)))
+    connection = store._connection()  # pylint: disable=protected-access
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.executemany(
+            "INSERT OR REPLACE INTO cache (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)", rows)
+    finally:
+        connection.execute("COMMIT")
+    if store.max_size:
+        store.evict()
+    return len(rows)
+
+
+__all__ = ["SqliteStore", "JournalStore", "import_entries", "load_entries"]
@@ -0,0 +1,73 @@
+"""Long-lived event loop shared by every async path of the package.
+
+The loop runs in a daemon thread, so sync callers (Flask views, scripts) can
+submit coroutines with run() without creating and tearing down a loop for
+each call, and async clients keep their connections between calls.
+"""
+import asyncio
+import atexit
+import contextlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine
+
+from .. import config
+from . import transport
+
+_lock = threading.Lock()
+_loop = None
+_thread = None
+
+# Blocking lookups run by the async pipelines.
+executor = ThreadPoolExecutor(
+    max_workers=config.data.get("Pipeline", {}).get("max_workers", 16),
+    thread_name_prefix="pipeline")
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Start the loop thread on first use and return its loop."""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_loop.run_forever, name="event-loop", daemon=True)
+            _thread.start()
+        return _loop
+
+
+def run(coroutine: Coroutine) -> Any:
+    """Run a coroutine on the shared loop and wait for its result.
+
+    Must not be called from the loop thread itself, await the coroutine there.
+    """
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        coroutine.close()
+        raise RuntimeError("run() called from the event loop thread, await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+async def run_blocking(function: Callable, *args, **kwargs) -> Any:
+    """Run a blocking function in the pipeline executor."""
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(function, *args, **kwargs))
+
+
+def close() -> None:
+    """Close the async client of the loop and stop the loop, called at exit."""
+    global _loop
+    with _lock:
+        loop, _loop = _loop, None
+    if loop is None or loop.is_closed():
+        return
+    with contextlib.suppress(Exception):
+        asyncio.run_coroutine_threadsafe(transport.aclose_async_client(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    executor.shutdown(wait=False)
+
+
+atexit.register(close)
+
+__all__ = ["get_loop", "run", "run_blocking", "executor", "close"]
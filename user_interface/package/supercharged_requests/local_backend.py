@@ -0,0 +1,528 @@
+"""Answer Overpass queries from a local OpenStreetMap extract.
+
+The extract (``.osm`` or ``.osm.pbf``) is loaded once into memory and indexed
+on a regular lat/lon grid. Queries are interpreted with the subset of Overpass
+QL built in ``API/queries.py`` so callers get the same JSON as from the API.
+"""
+import logging
+import re
+import threading
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from math import cos, floor, radians
+from typing import Dict, Iterable, List, Tuple
+
+from ..utils.geometry import (EARTH_RADIUS, point_distance,
+                              point_polyline_distance, polyline_hits_bbox)
+
+logger = logging.getLogger(__name__)
+
+CELL_SIZE = 0.01  # degrees
+
+_extracts = dict()
+_extracts_lock = threading.Lock()
+
+
+class OSMExtract:
+    """In-memory nodes, ways and relations of an extract with a grid index."""
+
+    def __init__(self, cell_size: float = CELL_SIZE):
+        """Create an empty extract."""
+        self.cell_size = cell_size
+        self.nodes: Dict[int, Tuple[float, float]] = dict()
+        self.node_tags: Dict[int, Dict] = dict()
+        self.ways: Dict[int, List[int]] = dict()
+        self.way_tags: Dict[int, Dict] = dict()
+        self.relations: Dict[int, List[Tuple[str, int, str]]] = dict()
+        self.relation_tags: Dict[int, Dict] = dict()
+        self._node_cells = defaultdict(list)
+        self._way_cells = defaultdict(set)
+        self._relation_cells = defaultdict(set)
+        self._ways_by_node = defaultdict(list)
+
+    def add_node(self, id_node: int, latitude: float, longitude: float, tags: Dict) -> None:
+        """Add a node to the extract."""
+        self.nodes[id_node] = (latitude, longitude)
+        if tags:
+            self.node_tags[id_node] = tags
+
+    def add_way(self, id_way: int, nodes: List[int], tags: Dict) -> None:
+        """Add a way to the extract, untagged ways are only kept as members."""
+        self.ways[id_way] = nodes
+        self.way_tags[id_way] = tags
+
+    def add_relation(self, id_relation: int, members: List[Tuple[str, int, str]], tags: Dict) -> None:
+        """Add a relation given as (type, ref, role) members."""
+        self.relations[id_relation] = members
+        self.relation_tags[id_relation] = tags
+
+    def build_index(self) -> None:
+        """Drop unused nodes and index tagged nodes and tagged ways on the grid.
+
+        The ways of a clipped extract are cut to their nodes inside the extract,
+        ways without any are dropped.
+        """
+        members = {ref for members in self.relations.values()
+                   for kind, ref, _ in members if kind == "way"}
+        for id_way in list(self.ways):
+            self.ways[id_way] = [id_node for id_node in self.ways[id_way] if id_node in self.nodes]
+            if not self.ways[id_way] or (not self.way_tags[id_way] and id_way not in members):
+                del self.ways[id_way], self.way_tags[id_way]
+        used = {id_node for nodes in self.ways.values() for id_node in nodes}
+        used.update(self.node_tags)
+        self.nodes = {id_node: coordinates for id_node,
+                      coordinates in self.nodes.items() if id_node in used}
+
+        for id_node in self.node_tags:
+            if id_node in self.nodes:
+                self._node_cells[self._cell(*self.nodes[id_node])].append(id_node)
+        for id_way, nodes in self.ways.items():
+            for id_node in nodes:
+                self._ways_by_node[id_node].append(id_way)
+            if not self.way_tags[id_way]:
+                continue
+            for cell in self._polyline_cells(self.way_coordinates(id_way)):
+                self._way_cells[cell].add(id_way)
+        for id_relation, members in self.relations.items():
+            for kind, ref, _ in members:
+                if kind == "way" and ref in self.ways:
+                    cells = self._polyline_cells(self.way_coordinates(ref))
+                elif kind == "node" and ref in self.nodes:
+                    cells = [self._cell(*self.nodes[ref])]
+                else:
+                    continue
+                for cell in cells:
+                    self._relation_cells[cell].add(id_relation)
+        logger.info(
+            f"Local extract indexed: {len(self.nodes)} nodes, {len(self.ways)} ways, {len(self.relations)} relations")
+
+    def way_coordinates(self, id_way: int) -> List[Tuple[float, float]]:
+        """Coordinates of the nodes of a way, missing nodes are skipped."""
+        return [self.nodes[id_node] for id_node in self.ways[id_way] if id_node in self.nodes]
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return floor(latitude / self.cell_size), floor(longitude / self.cell_size)
+
+    def _cells_in_bbox(self, south: float, west: float, north: float, east: float) -> Iterable[Tuple[int, int]]:
+        (row_min, col_min), (row_max, col_max) = self._cell(
+            south, west), self._cell(north, east)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                yield row, col
+
+    def _polyline_cells(self, coordinates: List[Tuple[float, float]]) -> Iterable[Tuple[int, int]]:
+        for start, end in zip(coordinates, coordinates[1:] or coordinates):
+            yield from self._cells_in_bbox(min(start[0], end[0]), min(start[1], end[1]),
+                                           max(start[0], end[0]), max(start[1], end[1]))
+
+    def nodes_in_bbox(self, south: float, west: float, north: float, east: float) -> Iterable[int]:
+        """Tagged nodes inside a bounding box."""
+        for cell in self._cells_in_bbox(south, west, north, east):
+            for id_node in self._node_cells.get(cell, ()):
+                latitude, longitude = self.nodes[id_node]
+                if south <= latitude <= north and west <= longitude <= east:
+                    yield id_node
+
+    def ways_in_bbox(self, south: float, west: float, north: float, east: float) -> Iterable[int]:
+        """Tagged ways with at least one segment cell overlapping a bounding box."""
+        seen = set()
+        for cell in self._cells_in_bbox(south, west, north, east):
+            for id_way in self._way_cells.get(cell, ()):
+                if id_way not in seen:
+                    seen.add(id_way)
+                    yield id_way
+
+    def relations_in_bbox(self, south: float, west: float, north: float, east: float) -> Iterable[int]:
+        """Relations with at least one member cell overlapping a bounding box."""
+        seen = set()
+        for cell in self._cells_in_bbox(south, west, north, east):
+            for id_relation in self._relation_cells.get(cell, ()):
+                if id_relation not in seen:
+                    seen.add(id_relation)
+                    yield id_relation
+
+    def ways_of_node(self, id_node: int) -> List[int]:
+        """Ways having the node as a member."""
+        return self._ways_by_node.get(id_node, [])
+
+    def execute(self, overpass_query: str) -> Dict:
+        """Run an Overpass QL query against the extract.
+
+        :param overpass_query: query as built in API/queries.py.
+
+        return data: Overpass JSON response
+        """
+        statements, _ = _parse_statements(overpass_query, _skip_settings(overpass_query))
+        output = list()
+        _Interpreter(self, output).run(statements, dict())
+        return {"version": 0.6, "generator": "local extract", "elements": output}
+
+
+def _skip_settings(text: str) -> int:
+    """Return the position after the [out:json][timeout:..]; header."""
+    match = re.match(r"\s*(\[[^\]]*\]\s*)+;", text)
+    return match.end() if match else 0
+
+
+_QUERY = re.compile(r"\s*(node|way|relation|rel|nwr)\b")
+
+
+def _parse_statements(text: str, pos: int) -> Tuple[List, int]:
+    """Parse statements until the end of text or a closing parenthesis."""
+    statements = list()
+    while True:
+        while pos < len(text) and text[pos] in " \t\n;":
+            pos += 1
+        if pos >= len(text) or text[pos] == ")":
+            return statements, pos
+        if text[pos] == "(":
+            inner, pos = _parse_statements(text, pos + 1)
+            statements.append(("union", inner))
+            pos += 1
+        elif text.startswith("._", pos):
+            statements.append(("input",))
+            pos += 2
+        elif text.startswith(">>", pos) or text.startswith("<<", pos):
+            raise ValueError(f"Unsupported recursion in query: {text}")
+        elif text[pos] in "><":
+            statements.append(("down",) if text[pos] == ">" else ("up",))
+            pos += 1
+        elif text.startswith("out", pos):
+            end = text.find(";", pos)
+            end = len(text) if end == -1 else end
+            statements.append(("out", set(text[pos + 3:end].split())))
+            pos = end
+        else:
+            match = _QUERY.match(text, pos)
+            if not match:
+                raise ValueError(f"Unsupported statement in query: {text[pos:]}")
+            kind = {"rel": "relation"}.get(match.group(1), match.group(1))
+            pos = match.end()
+            filters = list()
+            while pos < len(text) and text[pos] in "([":
+                closing = ")" if text[pos] == "(" else "]"
+                end = _find_closing(text, pos, closing)
+                filters.append((text[pos], text[pos + 1:end].strip()))
+                pos = end + 1
+            statements.append(("query", kind, filters))
+
+
+def _find_closing(text: str, pos: int, closing: str) -> int:
+    """Position of the closing bracket, skipping quoted strings."""
+    quoted = False
+    for index in range(pos + 1, len(text)):
+        if text[index] == '"' and text[index - 1] != "\\":
+            quoted = not quoted
+        elif text[index] == closing and not quoted:
+            return index
+    raise ValueError(f"Unbalanced query: {text}")
+
+
+_TAG_FILTER = re.compile(
+    r'^(!)?\s*("(?:[^"\\]|\\.)*"|[\w:]+)\s*(?:(!?[=~])\s*("(?:[^"\\]|\\.)*"|.+?))?\s*(,\s*i)?$')
+
+
+def _unquote(value: str) -> str:
+    return value[1:-1].replace('\\"', '"') if value.startswith('"') else value
+
+
+def _tag_predicate(expression: str):
+    """Build a predicate on a tag dict from a [key..value] filter."""
+    match = _TAG_FILTER.match(expression)
+    if not match:
+        raise ValueError(f"Unsupported tag filter [{expression}]")
+    negated, key, operator, value, case_insensitive = match.groups()
+    key = _unquote(key)
+    if operator is None:
+        return (lambda tags: key not in tags) if negated else (lambda tags: key in tags)
+    value = _unquote(value)
+    if operator.endswith("="):
+        matches = (lambda tags: tags.get(key) == value)
+    else:
+        pattern = re.compile(value, re.IGNORECASE if case_insensitive else 0)
+        matches = (lambda tags: key in tags and pattern.search(tags[key]) is not None)
+    if operator.startswith("!"):
+        return lambda tags: not matches(tags)
+    return matches
+
+
+class _Interpreter:
+    """Evaluate parsed statements on an extract."""
+
+    def __init__(self, extract: OSMExtract, output: List):
+        self.extract = extract
+        self.output = output
+
+    def run(self, statements: List, current: Dict) -> Dict:
+        """Run statements, every statement reads and writes the default set."""
+        for statement in statements:
+            current = self._step(statement, current)
+        return current
+
+    def _step(self, statement: Tuple, current: Dict) -> Dict:
+        kind = statement[0]
+        if kind == "union":
+            result = dict()
+            for inner in statement[1]:
+                current = self._step(inner, current)
+                result.update(current)
+            return result
+        if kind == "input":
+            return current
+        if kind == "down":
+            return self._recurse_down(current)
+        if kind == "up":
+            return self._recurse_up(current)
+        if kind == "out":
+            self._out(current, statement[1])
+            return current
+        return self._query(statement[1], statement[2], current)
+
+    def _recurse_down(self, current: Dict) -> Dict:
+        result = dict()
+        for kind, id_element in current:
+            if kind == "way":
+                result.update((("node", id_node), None)
+                              for id_node in self.extract.ways.get(id_element, ()))
+            elif kind == "relation":
+                # Like Overpass, members outside the extract are only listed by the relation.
+                for member_kind, ref, _ in self.extract.relations.get(id_element, ()):
+                    if ref not in self._store(member_kind):
+                        continue
+                    result[(member_kind, ref)] = None
+                    if member_kind == "way":
+                        result.update((("node", id_node), None)
+                                      for id_node in self.extract.ways.get(ref, ()))
+        return result
+
+    def _recurse_up(self, current: Dict) -> Dict:
+        result = dict()
+        for kind, id_element in current:
+            if kind == "node":
+                result.update((("way", id_way), None)
+                              for id_way in self.extract.ways_of_node(id_element))
+        return result
+
+    def _query(self, kind: str, filters: List, current: Dict) -> Dict:
+        kinds = ("node", "way", "relation") if kind == "nwr" else (kind,)
+        candidates = None
+        predicates = list()
+        for bracket, expression in filters:
+            if bracket == "[":
+                predicate = _tag_predicate(expression)
+                predicates.append(lambda element, predicate=predicate: predicate(self._tags(element)))
+                continue
+            found, predicate = self._spatial_filter(kinds, expression, current)
+            if candidates is not None:
+                found = set(found)
+                found = [element for element in candidates if element in found]
+            candidates = found
+            if predicate is not None:
+                predicates.append(predicate)
+        if candidates is None:
+            candidates = [(kind, id_element) for kind in kinds
+                          for id_element in self._all(kind)]
+        return {element: None for element in candidates
+                if all(predicate(element) for predicate in predicates)}
+
+    def _all(self, kind: str) -> Iterable[int]:
+        if kind == "node":
+            return self.extract.node_tags
+        if kind == "way":
+            return (id_way for id_way, tags in self.extract.way_tags.items() if tags)
+        return self.extract.relations
+
+    def _tags(self, element: Tuple[str, int]) -> Dict:
+        kind, id_element = element
+        if kind == "node":
+            return self.extract.node_tags.get(id_element, {})
+        if kind == "way":
+            return self.extract.way_tags.get(id_element, {})
+        return self.extract.relation_tags.get(id_element, {})
+
+    def _spatial_filter(self, kinds: Tuple, expression: str, current: Dict):
+        """Candidates and exact predicate of a (...) filter."""
+        extract = self.extract
+        if expression.startswith("around:"):
+            radius, latitude, longitude = (float(value)
+                                           for value in expression[7:].split(","))
+            delta_lat = radius / EARTH_RADIUS * 57.29577951308232
+            delta_lon = delta_lat / max(cos(radians(latitude)), 1e-6)
+            bbox = (latitude - delta_lat, longitude - delta_lon,
+                    latitude + delta_lat, longitude + delta_lon)
+            point = (latitude, longitude)
+
+            def predicate(element):
+                return self._distance(element, point) <= radius
+            return self._in_bbox(kinds, bbox), predicate
+        if expression.startswith("id:") or expression.isdigit():
+            ids = [int(value) for value in expression.split(":")[-1].split(",")]
+            return [(kind, id_element) for kind in kinds for id_element in ids
+                    if id_element in self._store(kind)], None
+        if expression in ("bn", "bn._"):
+            return [("way", id_way) for kind, id_node in current if kind == "node"
+                    for id_way in extract.ways_of_node(id_node)], None
+        if expression in ("w", "w._"):
+            return [("node", id_node) for kind, id_way in current if kind == "way"
+                    for id_node in extract.ways.get(id_way, ())], None
+        if expression in ("r", "r._"):
+            return [(member_kind, ref) for kind, id_relation in current if kind == "relation"
+                    for member_kind, ref, _ in extract.relations.get(id_relation, ())
+                    if member_kind in kinds and ref in self._store(member_kind)], None
+        values = expression.split(",")
+        if len(values) == 4:
+            bbox = tuple(float(value) for value in values)
+
+            def predicate(element):
+                return self._hits_bbox(element, bbox)
+            return self._in_bbox(kinds, bbox), predicate
+        raise ValueError(f"Unsupported filter ({expression})")
+
+    def _store(self, kind: str) -> Dict:
+        return {"node": self.extract.nodes, "way": self.extract.ways,
+                "relation": self.extract.relations}[kind]
+
+    def _in_bbox(self, kinds: Tuple, bbox: Tuple) -> List:
+        candidates = list()
+        if "node" in kinds:
+            candidates.extend(("node", id_node)
+                              for id_node in self.extract.nodes_in_bbox(*bbox))
+        if "way" in kinds:
+            candidates.extend(("way", id_way)
+                              for id_way in self.extract.ways_in_bbox(*bbox))
+        if "relation" in kinds:
+            candidates.extend(("relation", id_relation)
+                              for id_relation in self.extract.relations_in_bbox(*bbox))
+        return candidates
+
+    def _hits_bbox(self, element: Tuple[str, int], bbox: Tuple) -> bool:
+        """Whether a node, a way or a member of a relation is inside the bbox."""
+        kind, id_element = element
+        extract = self.extract
+        if kind == "way":
+            return polyline_hits_bbox(extract.way_coordinates(id_element), bbox)
+        if kind == "relation":
+            return any(self._hits_bbox((member_kind, ref), bbox)
+                       for member_kind, ref, _ in extract.relations[id_element]
+                       if member_kind != "relation" and ref in self._store(member_kind))
+        south, west, north, east = bbox
+        latitude, longitude = extract.nodes[id_element]
+        return south <= latitude <= north and west <= longitude <= east
+
+    def _distance(self, element: Tuple[str, int], point: Tuple[float, float]) -> float:
+        kind, id_element = element
+        if kind == "node":
+            return point_distance(point, self.extract.nodes[id_element])
+        return point_polyline_distance(point, self.extract.way_coordinates(id_element))
+
+    def _out(self, current: Dict, modifiers: set) -> None:
+        order = {"node": 0, "way": 1, "relation": 2}
+        for kind, id_element in sorted(current, key=lambda element: (order[element[0]], element[1])):
+            if id_element in self._store(kind):
+                self.output.append(self._element(kind, id_element, modifiers))
+
+    def _element(self, kind: str, id_element: int, modifiers: set) -> Dict:
+        extract = self.extract
+        element = {"type": kind, "id": id_element}
+        if kind == "node":
+            element["lat"], element["lon"] = extract.nodes[id_element]
+        elif kind == "way":
+            element["nodes"] = list(extract.ways[id_element])
+            if "geom" in modifiers:
+                coordinates = extract.way_coordinates(id_element)
+                element["geometry"] = [{"lat": latitude, "lon": longitude}
+                                       for latitude, longitude in coordinates]
+        else:
+            element["members"] = list()
+            for member_kind, ref, role in extract.relations[id_element]:
+                member = {"type": member_kind, "ref": ref, "role": role}
+                if "geom" in modifiers and member_kind == "way" and ref in extract.ways:
+                    member["geometry"] = [{"lat": latitude, "lon": longitude}
+                                          for latitude, longitude in extract.way_coordinates(ref)]
+                elif "geom" in modifiers and member_kind == "node" and ref in extract.nodes:
+                    member["lat"], member["lon"] = extract.nodes[ref]
+                element["members"].append(member)
+        if "skel" not in modifiers and "ids" not in modifiers:
+            tags = self._tags((kind, id_element))
+            if tags:
+                element["tags"] = tags
+        return element
+
+
+def _read_osm_xml(filename: str, extract: OSMExtract) -> None:
+    """Stream an .osm XML file into the extract."""
+    tags, refs, members = dict(), list(), list()
+    for _, elem in ET.iterparse(filename, events=("end",)):
+        if elem.tag == "tag":
+            tags[elem.get("k")] = elem.get("v")
+        elif elem.tag == "nd":
+            refs.append(int(elem.get("ref")))
+        elif elem.tag == "member":
+            members.append((elem.get("type"), int(elem.get("ref")), elem.get("role", "")))
+        elif elem.tag in ("node", "way", "relation"):
+            id_element = int(elem.get("id"))
+            if elem.tag == "node":
+                extract.add_node(id_element, float(elem.get("lat")), float(elem.get("lon")), tags)
+            elif elem.tag == "way":
+                extract.add_way(id_element, refs, tags)
+            else:
+                extract.add_relation(id_element, members, tags)
+            tags, refs, members = dict(), list(), list()
+            elem.clear()
+
+
+_PBF_MEMBER_TYPES = {"n": "node", "w": "way", "r": "relation"}
+
+
+def _read_osm_pbf(filename: str, extract: OSMExtract) -> None:
+    """Read an .osm.pbf file into the extract, needs the osmium package."""
+    try:
+        import osmium  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ImportError(
+            "Reading .osm.pbf extracts requires the 'osmium' package") from err
+
+    class Handler(osmium.SimpleHandler):
+        """Copy pbf elements into the extract."""
+
+        def node(self, node):  # pylint: disable=no-self-use
+            """Store a node."""
+            if node.location.valid():
+                extract.add_node(node.id, node.location.lat, node.location.lon,
+                                 {tag.k: tag.v for tag in node.tags})
+
+        def way(self, way):  # pylint: disable=no-self-use
+            """Store a way."""
+            extract.add_way(way.id, [node.ref for node in way.nodes],
+                            {tag.k: tag.v for tag in way.tags})
+
+        def relation(self, relation):  # pylint: disable=no-self-use
+            """Store a relation."""
+            extract.add_relation(relation.id, [(_PBF_MEMBER_TYPES[member.type], member.ref, member.role)
+                                               for member in relation.members],
+                                 {tag.k: tag.v for tag in relation.tags})
+
+    Handler().apply_file(filename)
+
+
+def load_extract(filename: str) -> OSMExtract:
+    """Load and index an extract, extracts are kept in memory once loaded.
+
+    :param filename: path of an .osm or .osm.pbf file.
+
+    return extract: indexed extract
+    """
+    with _extracts_lock:
+        if filename not in _extracts:
+            logger.info(f"Loading local OSM extract {filename}. This can take a while.. ☕")
+            extract = OSMExtract()
+            if filename.endswith(".pbf"):
+                _read_osm_pbf(filename, extract)
+            else:
+                _read_osm_xml(filename, extract)
+            extract.build_index()
+            _extracts[filename] = extract
+        return _extracts[filename]
+
+
+__all__ = ["OSMExtract", "load_extract"]
@@ -0,0 +1,166 @@
+"""Compact projection of the Overpass responses kept in the cache.
+
+The lookups only read the ids, the coordinates, the node lists, the member
+geometries and the name tag of the elements, so a cached response keeps
+just these, in typed arrays with the strings interned. The tags the queries
+filter on (KEPT_TAGS) and the roles of the members are kept too, so that a
+cache can be replayed by the local backend. The other tags, the header of
+the response and the bounds are dropped. At rest, the arrays can also be
+compressed with zlib (compress_level).
+"""
+import pickle
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, List, Tuple
+
+from .. import config
+
+settings = config.data.get("Cache", {})
+enabled = settings.get("compact", True)
+compress_level = settings.get("compress_level", 0)
+
+MEMBER_TYPES = ("node", "way", "relation")
+# Tags read by the lookups or filtered on by the queries of API.queries.
+KEPT_TAGS = ("name", "place", "boundary", "admin_level")
+
+
+class CompactResponse:
+    """Elements of an Overpass response in typed arrays, see the module docstring.
+
+    The tags of an element are an index in tag_sets, a tuple of (key, value)
+    pairs, -1 for an element without kept tags; the role of a member is an
+    index in roles. The offsets arrays hold, for each element, the start of
+    its slice of the next array, plus its total length.
+    """
+
+    __slots__ = ("tag_sets", "roles", "node_ids", "node_coordinates", "node_tags",
+                 "way_ids", "way_tags", "way_node_offsets", "way_nodes", "way_vertex_offsets", "way_coordinates",
+                 "relation_ids", "relation_tags", "relation_member_offsets",
+                 "member_types", "member_refs", "member_roles", "member_vertex_offsets", "member_coordinates")
+
+    ARRAYS = (("node_ids", "q"), ("node_coordinates", "d"), ("node_tags", "i"),
+              ("way_ids", "q"), ("way_tags", "i"), ("way_node_offsets", "I"), ("way_nodes", "q"),
+              ("way_vertex_offsets", "I"), ("way_coordinates", "d"),
+              ("relation_ids", "q"), ("relation_tags", "i"), ("relation_member_offsets", "I"),
+              ("member_types", "b"), ("member_refs", "q"), ("member_roles", "i"), ("member_vertex_offsets", "I"),
+              ("member_coordinates", "d"))
+
+    def __init__(self):
+        """Create an empty response."""
+        self.tag_sets = ()
+        self.roles = ()
+        for field, typecode in self.ARRAYS:
+            setattr(self, field, array(typecode))
+
+    def __getstate__(self) -> Tuple:
+        arrays = tuple(getattr(self, field) for field, _ in self.ARRAYS)
+        if compress_level:
+            return self.tag_sets, self.roles, zlib.compress(
+                pickle.dumps(arrays, protocol=pickle.HIGHEST_PROTOCOL), compress_level)
+        return self.tag_sets, self.roles, arrays
+
+    def __setstate__(self, state: Tuple) -> None:
+        tag_sets, roles, arrays = state
+        if isinstance(arrays, bytes):
+            arrays = pickle.loads(zlib.decompress(arrays))
+        self.tag_sets = _interned_tag_sets(tag_sets)
+        self.roles = tuple(sys.intern(role) for role in roles)
+        for (field, _), values in zip(self.ARRAYS, arrays):
+            setattr(self, field, values)
+
+    def nbytes(self) -> int:
+        """Size of the arrays in bytes."""
+        return sum(len(values) * values.itemsize for values in (getattr(self, field) for field, _ in self.ARRAYS))
+
+
+def _vertices(coordinates: array, start: int, end: int) -> List[Dict]:
+    return [{'lat': lat, 'lon': lon}
+            for lat, lon in zip(coordinates[2 * start:2 * end:2], coordinates[2 * start + 1:2 * end:2])]
+
+
+def _interned_tag_sets(tag_sets) -> Tuple[Tuple[Tuple[str, str], ...], ...]:
+    return tuple(tuple((sys.intern(key), sys.intern(value)) for key, value in tag_set) for tag_set in tag_sets)
+
+
+def _tags(tag_sets: Tuple, index: int) -> Dict:
+    return {'tags': dict(tag_sets[index])} if index >= 0 else {}
+
+
+def compact(data: Dict) -> CompactResponse:
+    """Project an Overpass response, see the module docstring."""
+    tag_indices, role_indices = dict(), dict()
+
+    def tags_index(element: Dict) -> int:
+        tags = element.get('tags', {})
+        tag_set = tuple((key, str(tags[key])) for key in KEPT_TAGS if key in tags)
+        return tag_indices.setdefault(tag_set, len(tag_indices)) if tag_set else -1
+
+    response = CompactResponse()
+    response.way_node_offsets.append(0)
+    response.way_vertex_offsets.append(0)
+    response.relation_member_offsets.append(0)
+    response.member_vertex_offsets.append(0)
+    for element in data.get('elements', ()):
+        if element['type'] == 'node':
+            response.node_ids.append(element['id'])
+            response.node_coordinates.extend((element['lat'], element['lon']))
+            response.node_tags.append(tags_index(element))
+        elif element['type'] == 'way':
+            response.way_ids.append(element['id'])
+            response.way_tags.append(tags_index(element))
+            response.way_nodes.extend(element.get('nodes', ()))
+            response.way_node_offsets.append(len(response.way_nodes))
+            for vertex in element.get('geometry', ()):
+                response.way_coordinates.extend((vertex['lat'], vertex['lon']))
+            response.way_vertex_offsets.append(len(response.way_coordinates) // 2)
+        elif element['type'] == 'relation':
+            response.relation_ids.append(element['id'])
+            response.relation_tags.append(tags_index(element))
+            for member in element.get('members', ()):
+                response.member_types.append(MEMBER_TYPES.index(member['type']))
+                response.member_refs.append(member['ref'])
+                response.member_roles.append(role_indices.setdefault(member.get('role', ''), len(role_indices)))
+                for vertex in member.get('geometry', ()):
+                    response.member_coordinates.extend((vertex['lat'], vertex['lon']))
+                response.member_vertex_offsets.append(len(response.member_coordinates) // 2)
+            response.relation_member_offsets.append(len(response.member_refs))
+    response.tag_sets = _interned_tag_sets(tag_indices)
+    response.roles = tuple(sys.intern(role) for role in role_indices)
+    return response
+
+
+def expand(value: Any) -> Dict:
+    """Overpass response of a cache value, compact or not.
+
+    return data: response with the nodes, then the ways, then the relations
+    """
+    if not isinstance(value, CompactResponse):
+        return value
+    tag_sets = value.tag_sets
+    coordinates = value.node_coordinates
+    elements = [{'type': 'node', 'id': id_node, 'lat': lat, 'lon': lon, **_tags(tag_sets, tags)}
+                for id_node, lat, lon, tags in zip(value.node_ids, coordinates[::2], coordinates[1::2],
+                                                   value.node_tags)]
+    node_offsets, vertex_offsets = value.way_node_offsets, value.way_vertex_offsets
+    for index, (id_way, tags) in enumerate(zip(value.way_ids, value.way_tags)):
+        way = {'type': 'way', 'id': id_way,
+               'nodes': value.way_nodes[node_offsets[index]:node_offsets[index + 1]].tolist(),
+               **_tags(tag_sets, tags)}
+        start, end = vertex_offsets[index], vertex_offsets[index + 1]
+        if end > start:
+            way['geometry'] = _vertices(value.way_coordinates, start, end)
+        elements.append(way)
+    for index, id_relation in enumerate(value.relation_ids):
+        members = list()
+        for member in range(value.relation_member_offsets[index], value.relation_member_offsets[index + 1]):
+            start, end = value.member_vertex_offsets[member], value.member_vertex_offsets[member + 1]
+            members.append({'type': MEMBER_TYPES[value.member_types[member]], 'ref': value.member_refs[member],
+                            'role': value.roles[value.member_roles[member]],
+                            **({'geometry': _vertices(value.member_coordinates, start, end)} if end > start else {})})
+        elements.append({'type': 'relation', 'id': id_relation, 'members': members,
+                         **_tags(tag_sets, value.relation_tags[index])})
+    return {'elements': elements}
+
+
+__all__ = ["CompactResponse", "KEPT_TAGS", "compact", "expand", "enabled", "compress_level"]
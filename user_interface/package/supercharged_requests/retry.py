@@ -0,0 +1,227 @@
+"""Retry policy and circuit breaker shared by the sync and async requests."""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+from .. import config, metrics
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class OverpassError(Exception):
+    """Raised when a query could not be answered by the API."""
+
+
+class CircuitOpenError(OverpassError):
+    """Raised without any request while the circuit breaker is open."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter."""
+
+    def __init__(self, max_attempts: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        """Create a policy, max_attempts counts the first attempt."""
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait after the given failed attempt (0 based).
+
+        A Retry-After sent by the server is a lower bound of the delay.
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_delay))
+        return backoff
+
+
+class CircuitBreaker:
+    """Fail fast after too many consecutive failures.
+
+    Once open, requests are refused for reset_timeout seconds, then a single
+    trial request is let through (half open) to close it again.
+    """
+
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 60.0, max_dropped: int = 1000):
+        """Create a closed breaker."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.dropped_queries = deque(maxlen=max_dropped)
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """closed, open or half_open."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self, query: str) -> bool:
+        """Raise CircuitOpenError, and record the query as dropped, if open.
+
+        return trial: whether the request is the trial of the half open
+        breaker, to pass to release
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            self.dropped_queries.append(query)
+        logger.error(f"Circuit breaker open, dropped query {query}")
+        raise CircuitOpenError(f"Overpass API unavailable, dropped query {query}")
+
+    def record_success(self) -> None:
+        """Close the breaker."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release(self, trial: bool) -> None:
+        """End a request that says nothing about the API.
+
+        :param trial: returned by allow for the request, only the trial
+            request frees the next trial.
+        """
+        if not trial:
+            return
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        """Count a failure, open the breaker past the threshold."""
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    logger.error("DEAD API: opening the circuit breaker")
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+def _from_config():
+    settings = config.data.get("Retry", {})
+    return (RetryPolicy(max_attempts=settings.get("max_attempts", 6),
+                        base_delay=settings.get("base_delay", 1.0),
+                        max_delay=settings.get("max_delay", 60.0),
+                        retry_statuses=settings.get("retry_statuses", (429, 500, 502, 503, 504))),
+            CircuitBreaker(failure_threshold=settings.get("circuit_failure_threshold", 10),
+                           reset_timeout=settings.get("circuit_reset_timeout", 60.0)))
+
+
+policy, breaker = _from_config()
+metrics.registry.register(metrics.Gauge(
+    "overpass_circuit_open", "1 while the circuit breaker refuses the requests.",
+    lambda: int(breaker.state == "open")))
+
+
+def _outcome(response: Optional["httpx.Response"], error: Optional[Exception], query: str, attempt: int,
+             trial: bool):
+    """Return the response if it is a success, else the delay (a float) before the next attempt."""
+    metrics.overpass_requests.inc(status="error" if response is None else response.status_code)
+    if response is not None and response.status_code == 200:
+        breaker.record_success()
+        return response
+    if response is not None and response.status_code not in policy.retry_statuses:
+        # The API answered a query it refuses, e.g. a malformed one: it is up.
+        breaker.release(trial)
+        raise OverpassError(f"Error {response.status_code} from API for query {query}")
+    breaker.record_failure()
+    reason = error if response is None else f"Error {response.status_code}"
+    if attempt + 1 >= policy.max_attempts:
+        breaker.dropped_queries.append(query)
+        metrics.overpass_dropped.inc()
+        raise OverpassError(
+            f"{reason} from API after {policy.max_attempts} attempts, dropped query {query}")
+    retry_after = None if response is None else parse_retry_after(response.headers.get("Retry-After"))
+    delay = float(policy.delay(attempt, retry_after))
+    metrics.overpass_retries.inc()
+    logger.warning(f"{reason} from API. Requesting again in {delay:.1f}s...")
+    return delay
+
+
+def send_with_retry(send: Callable[[], "httpx.Response"], query: str) -> "httpx.Response":
+    """Send a request following the retry policy and the circuit breaker.
+
+    :param send: function sending the request.
+    :param query: query sent, used in errors and dropped queries.
+
+    return response: successful response
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+    for attempt in range(policy.max_attempts):
+        trial = breaker.allow(query)
+        response, error = None, None
+        try:
+            with metrics.overpass_request_seconds.time():
+                response = send()
+        except httpx.TransportError as err:
+            error = err
+        except BaseException:
+            # Cancelled or failed before any answer: neither a success nor a failure of the API.
+            breaker.release(trial)
+            raise
+        outcome = _outcome(response, error, query, attempt, trial)
+        if not isinstance(outcome, float):
+            return outcome
+        time.sleep(outcome)
+    raise OverpassError(f"No attempt allowed for query {query}")
+
+
+async def async_send_with_retry(send: Callable[[], Awaitable["httpx.Response"]], query: str) -> "httpx.Response":
+    """Async version of send_with_retry."""
+    import httpx  # pylint: disable=import-outside-toplevel
+    for attempt in range(policy.max_attempts):
+        trial = breaker.allow(query)
+        response, error = None, None
+        try:
+            with metrics.overpass_request_seconds.time():
+                response = await send()
+        except httpx.TransportError as err:
+            error = err
+        except BaseException:
+            # Cancelled or failed before any answer: neither a success nor a failure of the API.
+            breaker.release(trial)
+            raise
+        outcome = _outcome(response, error, query, attempt, trial)
+        if not isinstance(outcome, float):
+            return outcome
+        await asyncio.sleep(outcome)
+    raise OverpassError(f"No attempt allowed for query {query}")
+
+
+__all__ = ["OverpassError", "CircuitOpenError", "RetryPolicy", "CircuitBreaker",
+           "policy", "breaker", "send_with_retry", "async_send_with_retry"]
@@ -0,0 +1,77 @@
+"""Single-flight deduplication of identical in-flight requests."""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing a key into one call.
+
+    The first caller of a key runs the call, callers arriving while it is in
+    flight wait on the same future and get its result (or exception). The
+    future is a concurrent.futures.Future so threads and asyncio tasks of
+    any event loop share the in-flight calls.
+    """
+
+    def __init__(self):
+        """Create a group without calls in flight."""
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = dict()
+        self.calls = 0
+        self.coalesced = 0
+
+    def _join(self, key: str):
+        """Return the in-flight future of the key and whether the caller leads it."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            self.calls += 1
+            return future, True
+
+    def _land(self, key: str, future: Future, result: Any = None, error: BaseException = None) -> None:
+        with self._lock:
+            del self._flights[key]
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def do(self, key: str, function: Callable[[], Any]) -> Any:
+        """Run function, or wait for the call of the same key in flight."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = function()
+        except BaseException as err:
+            self._land(key, future, error=err)
+            raise
+        self._land(key, future, result)
+        return result
+
+    async def do_async(self, key: str, function: Callable[[], Awaitable[Any]]) -> Any:
+        """Async version of do, function returns the awaitable to run."""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await function()
+        except BaseException as err:
+            self._land(key, future, error=err)
+            raise
+        self._land(key, future, result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Number of calls run, of calls coalesced and of calls in flight."""
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced,
+                    "in_flight": len(self._flights)}
+
+
+__all__ = ["SingleFlight"]
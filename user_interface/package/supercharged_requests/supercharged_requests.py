@@ -1,36 +1,97 @@
 """Supercharged requests to handle errors from the API."""
 import asyncio
 import logging
+import threading
 from functools import wraps
 from os import path
-from typing import Any, List, Tuple
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
 
-import httpx
-import joblib
-import requests
-
-from .. import config
+from .. import config, metrics
 from ..API import queries
+from . import cache_store, projection, retry, tile_cache, transport
+from .local_backend import load_extract
+from .single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 overpass_url = config.data.get("API").get(
     "overpass_url", "http://overpass-api.de/api/interpreter")
-
-cache_dict = dict()
+backend = config.data.get("API").get("backend", "overpass")
+local_extract = config.data.get("API").get("local_extract")
+if local_extract:
+    local_extract = config.resolve(local_extract)
+
+# Namespace of the request functions, filled by add_method.
+requests = SimpleNamespace()
+
+cache_settings = config.data.get("Cache", {})
+# Opened by the first lookup, see cache().
+cache_dict = None
+_cache_lock = threading.Lock()
+# Identical queries in flight, from threads or tasks, are sent only once.
+flights = SingleFlight()
+
+metrics.registry.register(metrics.Gauge(
+    "cache_entries", "Entries of the query cache.", lambda: len(cache_dict or ())))
+metrics.registry.register(metrics.Gauge(
+    "cache_size_bytes", "Size of the query cache on disk.",
+    lambda: cache_dict.size() if isinstance(cache_dict, (cache_store.SqliteStore, cache_store.JournalStore)) else 0))
+metrics.registry.register(metrics.Gauge(
+    "single_flight_coalesced_total", "Cache misses answered by a request already in flight.",
+    lambda: flights.stats()["coalesced"], kind="counter"))
 
 
 def load():
-    """Load the cache dictionary cache_dict from repertory."""
+    """Load the cache dictionary cache_dict from repertory.
+
+    With the sqlite store, cache_dict is a SqliteStore written entry by
+    entry, its pages memory-mapped; the legacy joblib cache is imported
+    into it the first time. With the pickle store, cache_dict is a
+    JournalStore: the joblib snapshot at legacy_path plus its journal.
+    """
     global cache_dict
-    if path.exists("cached_requests/raw_cache"):
-        cache_dict = joblib.load("cached_requests/raw_cache")
+    legacy_path = config.resolve(cache_settings.get("legacy_path", "cached_requests/raw_cache"))
+    if cache_settings.get("store", "sqlite") == "sqlite":
+        store = cache_store.SqliteStore(
+            config.resolve(cache_settings.get("path", "cached_requests/cache.sqlite")),
+            ttl=cache_settings.get("ttl", 0),
+            max_size=int(cache_settings.get("max_size_mb", 0) * 1024 * 1024),
+            mmap_size=int(cache_settings.get("mmap_size_mb", 256) * 1024 * 1024))
+        if len(store) == 0 and path.exists(legacy_path):
+            entries = cache_store.load_entries(legacy_path)
+            if projection.enabled:
+                entries = {query: projection.compact(data) for query, data in entries.items()}
+            count = cache_store.import_entries(store, entries)
+            logger.info(f"Imported {count} entries from {legacy_path}")
+        cache_dict = store
     else:
-        logger.warning("cache not found")
+        if not path.exists(legacy_path):
+            logger.warning("cache not found")
+        cache_dict = cache_store.JournalStore(legacy_path, compact_ratio=cache_settings.get("compact_ratio", 0.5))
+
+
+def cache():
+    """The cache dictionary, loaded by the first call so that importing the package stays fast."""
+    if cache_dict is None:
+        with _cache_lock:
+            if cache_dict is None:
+                load()
+    return cache_dict
 
 
 def save():
-    """Save the cache dictionary cache_dict."""
-    joblib.dump(cache_dict, "cached_requests/raw_cache")
+    """Save the cache dictionary cache_dict.
+
+    The sqlite store is already up to date. The journal of the pickle store
+    is synced, and compacted in the background once large; a plain dict set
+    by the caller is dumped whole.
+    """
+    if isinstance(cache_dict, cache_store.JournalStore):
+        cache_dict.save()
+    elif isinstance(cache_dict, dict):
+        import joblib  # pylint: disable=import-outside-toplevel
+        joblib.dump(cache_dict, config.resolve(cache_settings.get(
+            "legacy_path", "cached_requests/raw_cache")))
 
 
 def add_method(cls):
@@ -44,29 +105,127 @@ def add_method(cls):
     return decorator
 
 
-@add_method(requests)
-def supercharged_requests(*args, **kwargs):
+def _cached(overpass_query: str) -> Dict:
+    """Cached response of a query, None if missing."""
+    value = cache().get(overpass_query)
+    return None if value is None else projection.expand(value)
+
+
+def _put(overpass_query: str, data: Dict) -> None:
+    """Cache a response, projected on what the lookups read unless Cache.compact is false."""
+    cache()[overpass_query] = projection.compact(data) if projection.enabled else data
 
-    asked_query = kwargs.get("params").get("data")
-    if asked_query in cache_dict.keys():
+
+def fetch(overpass_query: str) -> Dict:
+    """Answer a query from the local backend, the cache or the API.
+
+    :param overpass_query: query to send.
+
+    return data: Overpass JSON response
+    """
+    if backend == "local":
+        return load_extract(local_extract).execute(overpass_query)
+    data = _cached(overpass_query)
+    if data is not None:
+        metrics.cache_lookups.inc(result="hit")
         logger.info("Cache : hit non async !")
-        return cache_dict.get(asked_query)
-    logger.info(f"cache missed {asked_query}")
-    retrieved_data = requests.get(url=overpass_url, *args, **kwargs)
-    counter_requests = 0
-    while retrieved_data.status_code != 200:
-        logger.warning(
-            f"Error {retrieved_data.status_code} from API not async. Requesting again...")
-        retrieved_data = requests.get(url=overpass_url, *args, **kwargs)
-        counter_requests += 1
-        if counter_requests > 30:
-            logger.warning("DEAD API")
-    data = retrieved_data.json()
-    cache_dict[asked_query] = data
+        return data
+    metrics.cache_lookups.inc(result="miss")
+    logger.info(f"cache missed {overpass_query}")
+    return flights.do(overpass_query, lambda: _download(overpass_query))
+
+
+def download(overpass_query: str) -> Dict:
+    """Send a query to the API, bypassing the cache.
+
+    :param overpass_query: query to send.
+
+    return data: Overpass JSON response, not cached
+    """
+    retrieved_data = retry.send_with_retry(
+        lambda: transport.get(overpass_url, params={'data': overpass_query}), overpass_query)
+    return retrieved_data.json()
+
 
+def store(overpass_query: str, data: Dict) -> None:
+    """Cache the response of a query obtained by other means, e.g. cut from a bulk response."""
+    _put(overpass_query, data)
+
+
+def _download(overpass_query: str) -> Dict:
+    """Send a query to the API and cache the response."""
+    data = _cached(overpass_query)
+    if data is not None:
+        return data
+    data = download(overpass_query)
+    _put(overpass_query, data)
+    return data
+
+
+async def async_fetch(overpass_query: str, delay_async: float = 0) -> Dict:
+    """Async version of fetch, delay_async staggers the requests sent."""
+    if backend == "local":
+        return load_extract(local_extract).execute(overpass_query)
+    data = _cached(overpass_query)
+    if data is not None:
+        metrics.cache_lookups.inc(result="hit")
+        logger.info("Cacha : hit async")
+        return data
+    metrics.cache_lookups.inc(result="miss")
+    logger.info("cache missed")
+    return await flights.do_async(overpass_query, lambda: _async_download(overpass_query, delay_async))
+
+
+async def _async_download(overpass_query: str, delay_async: float) -> Dict:
+    """Async version of _download."""
+    data = _cached(overpass_query)
+    if data is not None:
+        return data
+    await asyncio.sleep(delay_async)
+    retrieved_data = await retry.async_send_with_retry(
+        lambda: transport.aget(overpass_url, params={'data': overpass_query}), overpass_query)
+    data = retrieved_data.json()
+    _put(overpass_query, data)
     return data
 
 
+@add_method(requests)
+def supercharged_requests(*args, **kwargs):
+    """Send the query in params['data'], see fetch."""
+    return fetch(kwargs.get("params").get("data"))
+
+
+def _tile_queries(latitude: float, longitude: float, rad: float) -> Optional[List[str]]:
+    """Queries of the tiles covering the circle, None to send a single around query."""
+    if backend == "local" or not tile_cache.enabled:
+        return None
+    tile_queries = tile_cache.tile_queries(latitude, longitude, rad)
+    return tile_queries if len(tile_queries) <= tile_cache.max_tiles else None
+
+
+@add_method(requests)
+def ways_around(latitude: float, longitude: float, rad: float) -> Dict:
+    """Named ways, with their nodes and geometry, around a point.
+
+    With the semantic cache, the ways are read from the cached tiles
+    covering the circle instead of a query keyed by the exact point, unless
+    the circle covers more than max_tiles tiles.
+    """
+    tile_queries = _tile_queries(latitude, longitude, rad)
+    if tile_queries is None:
+        return fetch(queries.query_street(rad=rad, latitude=latitude, longitude=longitude))
+    return tile_cache.ways_within([fetch(query) for query in tile_queries], latitude, longitude, rad)
+
+
+@add_method(requests)
+async def async_ways_around(latitude: float, longitude: float, rad: float) -> Dict:
+    """Async version of ways_around."""
+    tile_queries = _tile_queries(latitude, longitude, rad)
+    if tile_queries is None:
+        return await async_fetch(queries.query_street(rad=rad, latitude=latitude, longitude=longitude))
+    return tile_cache.ways_within([await async_fetch(query) for query in tile_queries], latitude, longitude, rad)
+
+
 @add_method(requests)
 async def async_request(
     sem: Any,
@@ -75,50 +234,15 @@ async def async_request(
     *args,
     **kwargs,
 ) -> Tuple[List, Tuple]:
-    async with sem, httpx.AsyncClient() as client:
-        timeout = httpx.Timeout(800.0)
-        overpass_query_get_node = queries.query_nodes(id_node)
-        if overpass_query_get_node in cache_dict.keys():
-            logger.info("Cacha : hit async")
-            node = cache_dict.get(overpass_query_get_node)
-        else:
-            logger.info("cache missed")
-            await asyncio.sleep(delay_async * 0.1)
-            retrieved_data = await client.get(
-                f"{overpass_url}?data={overpass_query_get_node}", timeout=timeout)
-            counter_requests = 0
-            while retrieved_data.status_code != 200:
-                logger.warning(
-                    f"Error {retrieved_data.status_code} from API. Requesting async {delay_async} again...")
-                retrieved_data = await client.get(
-                    f"{overpass_url}?data={overpass_query_get_node}", timeout=timeout)
-                counter_requests += 1
-            node = retrieved_data.json()
-            cache_dict[overpass_query_get_node] = node
-        logger.warning(node)
-        try:
-            latitude = node['elements'][0]['lat']
-            longitude = node['elements'][0]['lon']
-        except:
-            logger.warning(node)
-
-        overpass_query_get_ways = queries.query_ways(
-            latitude=latitude, longitude=longitude)
-        if overpass_query_get_ways in cache_dict.keys():
-            logger.info("Cacha : hit async")
-            data = cache_dict.get(overpass_query_get_ways)
-        else:
-            retrieved_data = await client.get(
-                f"{overpass_url}?data={overpass_query_get_ways}", timeout=timeout)
-            counter_requests = 0
-            while retrieved_data.status_code != 200:
-                logger.warning(
-                    f"Error {retrieved_data.status_code} from API. Requesting async {delay_async} again...")
-                retrieved_data = await client.get(
-                    f"{overpass_url}?data={overpass_query_get_ways}", timeout=timeout)
-                counter_requests += 1
-            data = retrieved_data.json()
-            cache_dict[overpass_query_get_ways] = data
+    async with sem:
+        node = await async_fetch(queries.query_nodes(id_node), delay_async * 0.1)
+        if not node['elements']:
+            logger.warning(f"Node {id_node} not found")
+            return [], None
+        latitude = node['elements'][0]['lat']
+        longitude = node['elements'][0]['lon']
+
+        data = await async_ways_around(latitude=latitude, longitude=longitude, rad=2)
         ways = [x for x in data['elements']
                 if x['type'] == 'way']
         names = [way['tags']['name'] for way in ways]
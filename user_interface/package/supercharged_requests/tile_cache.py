@@ -0,0 +1,78 @@
+"""Semantic cache layer keyed by map tiles instead of exact queries.
+
+Queries built around a point embed its coordinates and the radius as raw
+floats, so two points a metre apart never share a cache entry. Here the
+named ways are fetched (and cached) per tile of tile_size degrees, and
+around lookups are answered by filtering the ways of the covering tiles.
+Circles covering more than max_tiles tiles are fetched with a single around
+query instead.
+"""
+from math import cos, floor, radians
+from typing import Dict, List, Tuple
+
+from numpy import nonzero
+
+from .. import config
+from ..API.queries import query_tile_ways
+from ..utils.geometry import EARTH_RADIUS, polyline_distances
+
+settings = config.data.get("Cache", {})
+enabled = settings.get("semantic", True)
+tile_size = settings.get("tile_size", 0.005)
+max_tiles = settings.get("max_tiles", 16)
+
+
+def tile_of(latitude: float, longitude: float) -> Tuple[int, int]:
+    """Tile containing the point."""
+    return floor(latitude / tile_size), floor(longitude / tile_size)
+
+
+def tile_bbox(tile: Tuple[int, int]) -> Tuple[float, float, float, float]:
+    """South, west, north, east bounds of a tile, as written in its query."""
+    row, col = tile
+    return (round(row * tile_size, 7), round(col * tile_size, 7),
+            round((row + 1) * tile_size, 7), round((col + 1) * tile_size, 7))
+
+
+def tile_query(tile: Tuple[int, int]) -> str:
+    """Query of the named ways crossing a tile, used as its cache key."""
+    return query_tile_ways(*tile_bbox(tile))
+
+
+def tile_queries(latitude: float, longitude: float, rad: float) -> List[str]:
+    """Queries of the tiles covering the circle of radius rad meters."""
+    delta_lat = rad / (radians(1) * EARTH_RADIUS)
+    delta_lon = delta_lat / max(cos(radians(latitude)), 1e-6)
+    row_min, col_min = tile_of(latitude - delta_lat, longitude - delta_lon)
+    row_max, col_max = tile_of(latitude + delta_lat, longitude + delta_lon)
+    return [tile_query((row, col)) for row in range(row_min, row_max + 1)
+            for col in range(col_min, col_max + 1)]
+
+
+def ways_within(
+        responses: List[Dict],
+        latitude: float,
+        longitude: float,
+        rad: float,
+) -> Dict:
+    """Ways of the tile responses within rad meters of the point.
+
+    :param responses: responses of the tile_queries of the point.
+
+    return data: Overpass-like response with the matching ways
+    """
+    ways = dict()
+    for response in responses:
+        for element in response['elements']:
+            if element['type'] == 'way':
+                ways[element['id']] = element
+    ways = list(ways.values())
+    if not ways:
+        return {'elements': []}
+    distances = polyline_distances(
+        (latitude, longitude),
+        [[(vertex['lat'], vertex['lon']) for vertex in way['geometry']] for way in ways])
+    return {'elements': [ways[index] for index in nonzero(distances <= rad)[0]]}
+
+
+__all__ = ["enabled", "max_tiles", "tile_of", "tile_bbox", "tile_query", "tile_queries", "ways_within"]
@@ -0,0 +1,136 @@
+"""Shared, pooled HTTP transport used for every Overpass request."""
+import asyncio
+import atexit
+import importlib.util
+import logging
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+from .. import config
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class ConcurrencyLimiter:
+    """Limit on the requests in flight, shared by threads and event loops."""
+
+    def __init__(self, limit: int):
+        """Create a limiter allowing limit concurrent requests."""
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        # Wait for the thread semaphore in the default executor, not on the event loop.
+        acquired = asyncio.get_running_loop().run_in_executor(None, self._semaphore.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # The executor thread still takes the slot, give it back once it has.
+            acquired.add_done_callback(lambda _: self._semaphore.release())
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+
+# Every request sent to the API, sync or async, holds a slot of the limiter.
+limiter = ConcurrencyLimiter(
+    config.data.get("Transport", {}).get("max_concurrent_requests", 2))
+
+
+def _client_options() -> dict:
+    """Build the httpx client options from the Transport section of the config."""
+    # httpx is imported with the first client, importing the package stays fast.
+    import httpx  # pylint: disable=import-outside-toplevel
+    settings = config.data.get("Transport", {})
+    http2 = settings.get("http2", False)
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 needs the 'h2' package, falling back to HTTP/1.1")
+        http2 = False
+    return dict(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.get("max_connections", 10),
+            max_keepalive_connections=settings.get("max_keepalive_connections", 5),
+            keepalive_expiry=settings.get("keepalive_expiry", 30)),
+        timeout=httpx.Timeout(settings.get("read_timeout", 800),
+                              connect=settings.get("connect_timeout", 10)),
+        headers={"Accept-Encoding": "gzip, deflate"},
+    )
+
+
+def get_client() -> "httpx.Client":
+    """Long-lived client shared by every thread of the process."""
+    import httpx  # pylint: disable=import-outside-toplevel
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(**_client_options())
+        return _client
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """Long-lived async client of the running event loop.
+
+    Connections can't be shared between event loops, so there is one client
+    per loop, dropped with the loop.
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_options())
+        _async_clients[loop] = client
+    return client
+
+
+def get(url: str, **kwargs) -> "httpx.Response":
+    """GET with the shared client, within the concurrency limit."""
+    client = get_client()
+    with limiter:
+        return client.get(url, **kwargs)
+
+
+async def aget(url: str, **kwargs) -> "httpx.Response":
+    """GET with the async client of the running loop, within the concurrency limit."""
+    client = get_async_client()
+    async with limiter:
+        return await client.get(url, **kwargs)
+
+
+async def aclose_async_client() -> None:
+    """Close the async client of the running event loop, if any."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def close() -> None:
+    """Close the shared sync client, called at exit."""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close)
+
+__all__ = ["ConcurrencyLimiter", "limiter", "get", "aget", "get_client", "get_async_client",
+           "aclose_async_client", "close"]
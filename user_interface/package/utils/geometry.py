@@ -0,0 +1,236 @@
+"""Geometry helpers working in a local metric projection."""
+from math import cos, hypot, radians
+from typing import Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # meters
+
+
+def local_xy(
+        latitude: float,
+        longitude: float,
+        ref_latitude: float,
+        ref_longitude: float,
+) -> Tuple[float, float]:
+    """Project a point on the plane tangent to a reference point.
+
+    :param latitude: latitude of the point to project.
+    :param longitude: longitude of the point to project.
+    :param ref_latitude: latitude of the origin of the projection.
+    :param ref_longitude: longitude of the origin of the projection.
+
+    return x, y: east and north offsets in meters
+    """
+    x = radians(longitude - ref_longitude) * cos(radians(ref_latitude)) * EARTH_RADIUS
+    y = radians(latitude - ref_latitude) * EARTH_RADIUS
+    return x, y
+
+
+def point_distance(
+        point_1: Tuple[float, float],
+        point_2: Tuple[float, float],
+) -> float:
+    """Distance in meters between two (latitude, longitude) points.
+
+    return distance: equirectangular approximation, exact enough below a few km
+    """
+    x, y = local_xy(*point_2, *point_1)
+    return hypot(x, y)
+
+
+def point_polyline_distance(
+        point: Tuple[float, float],
+        polyline: Sequence[Tuple[float, float]],
+) -> float:
+    """Distance in meters between a point and a polyline.
+
+    :param point: (latitude, longitude) of the point.
+    :param polyline: (latitude, longitude) of the vertices of the polyline.
+
+    return distance: distance to the closest segment of the polyline
+    """
+    if not polyline:
+        return float("inf")
+    vertices = [local_xy(*vertex, *point) for vertex in polyline]
+    if len(vertices) == 1:
+        return hypot(*vertices[0])
+    best = float("inf")
+    for (x1, y1), (x2, y2) in zip(vertices, vertices[1:]):
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else max(0.0, min(1.0, -(x1 * dx + y1 * dy) / length))
+        best = min(best, hypot(x1 + t * dx, y1 + t * dy))
+    return best
+
+
+def to_local_xy(
+        coordinates: np.ndarray,
+        reference: Tuple[float, float],
+) -> np.ndarray:
+    """Vectorized local_xy.
+
+    :param coordinates: array of shape (..., 2) of (latitude, longitude).
+    :param reference: (latitude, longitude) of the origin of the projection.
+
+    return xy: array of shape (..., 2) of east and north offsets in meters
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    xy = np.empty_like(coordinates)
+    xy[..., 0] = np.radians(coordinates[..., 1] - reference[1]) * \
+        cos(radians(reference[0])) * EARTH_RADIUS
+    xy[..., 1] = np.radians(coordinates[..., 0] - reference[0]) * EARTH_RADIUS
+    return xy
+
+
+def segment_distances(
+        points: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+) -> np.ndarray:
+    """Distances between every point and every segment in one batched pass.
+
+    :param points: array of shape (N, 2) in a metric projection.
+    :param starts: array of shape (M, 2), first ends of the segments.
+    :param ends: array of shape (M, 2), second ends of the segments.
+
+    return distances: array of shape (N, M)
+    """
+    direction = ends - starts
+    length = np.einsum("ij,ij->i", direction, direction)
+    length[length == 0] = 1.0
+    relative = points[:, None, :] - starts[None, :, :]
+    t = np.clip(np.einsum("nmj,mj->nm", relative, direction) / length, 0.0, 1.0)
+    offset = relative - t[..., None] * direction[None, :, :]
+    return np.sqrt(np.einsum("nmj,nmj->nm", offset, offset))
+
+
+def polyline_distances(
+        point: Tuple[float, float],
+        polylines: Sequence[Sequence[Tuple[float, float]]],
+) -> np.ndarray:
+    """Distance in meters between a point and each polyline.
+
+    All segments of all polylines are flattened in contiguous arrays, so the
+    cost is a single segment_distances call whatever the number of polylines.
+
+    :param point: (latitude, longitude) of the point.
+    :param polylines: list of polylines given as (latitude, longitude) vertices.
+
+    return distances: array with one distance per polyline, inf if empty
+    """
+    starts, ends, owners = list(), list(), list()
+    for index, polyline in enumerate(polylines):
+        if len(polyline) == 1:
+            polyline = [polyline[0], polyline[0]]
+        starts.extend(polyline[:-1])
+        ends.extend(polyline[1:])
+        owners.extend([index] * (len(polyline) - 1))
+    distances = np.full(len(polylines), np.inf)
+    if owners:
+        segments = segment_distances(np.zeros((1, 2)), to_local_xy(starts, point),
+                                     to_local_xy(ends, point))[0]
+        np.minimum.at(distances, np.array(owners), segments)
+    return distances
+
+
+def nearest_segments(
+        points: Sequence[Tuple[float, float]],
+        starts: Sequence[Tuple[float, float]],
+        ends: Sequence[Tuple[float, float]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest segment of every point.
+
+    Points and segment ends are projected around the centroid of the points,
+    then every (point, segment) distance is computed in one batched pass.
+
+    :param points: N (latitude, longitude) points.
+    :param starts: M (latitude, longitude) first ends of the segments.
+    :param ends: M (latitude, longitude) second ends of the segments.
+
+    return indices, distances: index of the nearest segment of each point and
+    the distance to it in meters, -1 and inf without segments
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(starts) == 0:
+        return np.full(len(points), -1), np.full(len(points), np.inf)
+    reference = tuple(points.mean(axis=0))
+    xy = to_local_xy(points, reference)
+    starts = to_local_xy(np.asarray(starts, dtype=float).reshape(-1, 2), reference)
+    ends = to_local_xy(np.asarray(ends, dtype=float).reshape(-1, 2), reference)
+    indices = np.empty(len(points), dtype=int)
+    nearest = np.empty(len(points))
+    # Chunks of points keep the (N, M, 2) intermediate arrays around 16 MB.
+    chunk = max(1, 2 ** 20 // max(len(starts), 1))
+    for start in range(0, len(points), chunk):
+        distances = segment_distances(xy[start:start + chunk], starts, ends)
+        indices[start:start + chunk] = np.argmin(distances, axis=1)
+        nearest[start:start + chunk] = distances[np.arange(len(distances)),
+                                                 indices[start:start + chunk]]
+    return indices, nearest
+
+
+def points_in_polygon(
+        points: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+) -> np.ndarray:
+    """Even-odd point in polygon test of every point.
+
+    The polygon is given by the edges of all its rings, outer and inner, so
+    holes are excluded by the even-odd rule. Coordinates are used as planar
+    (latitude, longitude), exact enough for edges of a few km.
+
+    :param points: N×2 array of (latitude, longitude) points.
+    :param starts: M×2 array of first ends of the edges.
+    :param ends: M×2 array of second ends of the edges.
+
+    return inside: boolean array, True for the points inside the polygon
+    """
+    inside = np.zeros(len(points), dtype=bool)
+    if not len(starts):
+        return inside
+    lat_1, lon_1 = starts[:, 0], starts[:, 1]
+    lat_2, lon_2 = ends[:, 0], ends[:, 1]
+    spans = lat_1 != lat_2
+    slope = np.divide(lon_2 - lon_1, lat_2 - lat_1, out=np.zeros(len(starts)), where=spans)
+    # Chunks of points keep the (N, M) intermediate arrays around 8 MB.
+    chunk = max(1, 2 ** 20 // len(starts))
+    for start in range(0, len(points), chunk):
+        latitudes = points[start:start + chunk, 0:1]
+        longitudes = points[start:start + chunk, 1:2]
+        crosses = (lat_1 > latitudes) != (lat_2 > latitudes)
+        crosses &= longitudes < lon_1 + (latitudes - lat_1) * slope
+        inside[start:start + chunk] = np.count_nonzero(crosses, axis=1) % 2 == 1
+    return inside
+
+
+def polyline_hits_bbox(
+        coordinates: Sequence[Tuple[float, float]],
+        bbox: Tuple[float, float, float, float],
+) -> bool:
+    """Whether a polyline has a vertex in, or a segment crossing, the bbox.
+
+    :param coordinates: (latitude, longitude) of the vertices of the polyline.
+    :param bbox: south, west, north, east bounds of the box.
+    """
+    south, west, north, east = bbox
+    for (lat_1, lon_1), (lat_2, lon_2) in zip(coordinates, coordinates[1:] or coordinates):
+        # Liang-Barsky clipping of the segment by the box.
+        t_min, t_max = 0.0, 1.0
+        for delta, low, high, start in ((lat_2 - lat_1, south, north, lat_1),
+                                        (lon_2 - lon_1, west, east, lon_1)):
+            if delta == 0:
+                if not low <= start <= high:
+                    t_min, t_max = 1.0, 0.0
+                continue
+            t_low, t_high = sorted(((low - start) / delta, (high - start) / delta))
+            t_min, t_max = max(t_min, t_low), min(t_max, t_high)
+        if t_min <= t_max:
+            return True
+    return False
+
+
+__all__ = ["EARTH_RADIUS", "local_xy", "point_distance", "point_polyline_distance",
+           "to_local_xy", "segment_distances", "polyline_distances", "nearest_segments",
+           "points_in_polygon", "polyline_hits_bbox"]
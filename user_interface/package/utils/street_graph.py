@@ -0,0 +1,144 @@
+"""Street graph: intersections of a street keyed by OSM node id and the sections between them."""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .geometry import nearest_segments, segment_distances, to_local_xy
+
+
+class Section:
+    """Part of a street between two consecutive intersections.
+
+    Indexing gives the legacy [start_name, end_name, start, end] section of
+    get_road_sections, so a section can be passed where a list was.
+    """
+
+    __slots__ = ("index", "start_node", "end_node", "start_name", "end_name",
+                 "start", "end", "first", "last")
+
+    def __init__(self, index: int, start_node: int, end_node: int, start_name: str,
+                 end_name: str, start: Tuple[float, float], end: Tuple[float, float],
+                 first: int, last: int):
+        """Create a section.
+
+        :param index: position of the section along the street.
+        :param start_node: OSM id of the first intersection.
+        :param end_node: OSM id of the second intersection.
+        :param start_name: name of the streets crossing at the first intersection.
+        :param end_name: name of the streets crossing at the second intersection.
+        :param start: coordinates of the first intersection.
+        :param end: coordinates of the second intersection.
+        :param first: position of the first intersection in the nodes of the street.
+        :param last: position of the second intersection in the nodes of the street.
+        """
+        self.index = index
+        self.start_node = start_node
+        self.end_node = end_node
+        self.start_name = start_name
+        self.end_name = end_name
+        self.start = start
+        self.end = end
+        self.first = first
+        self.last = last
+
+    @property
+    def names(self) -> Tuple[str, str]:
+        """Names of the streets that bound the section."""
+        return self.start_name, self.end_name
+
+    def __getitem__(self, item):
+        return (self.start_name, self.end_name, self.start, self.end)[item]
+
+    def __len__(self) -> int:
+        return 4
+
+    def __repr__(self) -> str:
+        return f"Section({self.start_name!r}, {self.end_name!r}, {self.start}, {self.end})"
+
+
+class StreetGraph:
+    """Intersections and sections of one street, built once per way.
+
+    The nodes of the street are kept as parallel arrays of OSM ids and
+    coordinates. Intersections are the nodes shared with another named way,
+    keyed by node id, and the sections join consecutive intersections, with
+    the ends of all sections in two arrays for vectorized distances. A street
+    crossing fewer than two named ways is cut at its intersection, if any,
+    into dead-end sections bounded by its ends, named ''.
+    """
+
+    def __init__(self, road_name: str, list_node: Sequence[int], intersection_list: List[Tuple]):
+        """Build the graph of a street.
+
+        :param road_name: name of the street.
+        :param list_node: OSM ids of the nodes of the street, in order.
+        :param intersection_list: output of get_ways_from_node for list_node,
+        nodes without coordinates are left out.
+        """
+        known = [(id_node, item) for id_node, item in zip(list_node, intersection_list) if item[1] is not None]
+        list_node = [id_node for id_node, _ in known]
+        intersection_list = [item for _, item in known]
+        self.road_name = road_name
+        self.node_ids = np.array(list_node, dtype=np.int64)
+        self.coordinates = np.array([coordinates for _, coordinates in intersection_list],
+                                    dtype=float).reshape(-1, 2)
+        self.intersections: Dict[int, str] = dict()
+        positions = list()
+        for position, (id_node, (names, _)) in enumerate(zip(list_node, intersection_list)):
+            if len(names) > 1 and road_name in names:
+                self.intersections[id_node] = '/'.join(name for name in names if name != road_name)
+                positions.append(position)
+
+        if len(positions) < 2 and len(list_node):
+            positions = sorted({0, len(list_node) - 1, *positions})
+            if len(positions) == 1:
+                positions *= 2
+
+        self.sections: List[Section] = list()
+        for first, last in zip(positions, positions[1:]):
+            start_node, end_node = list_node[first], list_node[last]
+            section = Section(len(self.sections), start_node, end_node,
+                              self.intersections.get(start_node, ''), self.intersections.get(end_node, ''),
+                              intersection_list[first][1], intersection_list[last][1], first, last)
+            self.sections.append(section)
+        self.starts = np.array([section.start for section in self.sections], dtype=float).reshape(-1, 2)
+        self.ends = np.array([section.end for section in self.sections], dtype=float).reshape(-1, 2)
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def distances(self, reference: Tuple[float, float]) -> np.ndarray:
+        """Distance in meters between a point and every section."""
+        # The point is the origin of the local projection.
+        return segment_distances(np.zeros((1, 2)), to_local_xy(self.starts, reference),
+                                 to_local_xy(self.ends, reference))[0]
+
+    def nearest_sections(self, list_coordinates: Sequence[Tuple[float, float]]) -> List[Section]:
+        """Nearest section of every point, in one batched pass, None for a street without nodes."""
+        if not self.sections:
+            return [None] * len(list_coordinates)
+        indices, _ = nearest_segments(list_coordinates, self.starts, self.ends)
+        return [self.sections[index] for index in indices]
+
+    def section_coordinates(self, section: Section) -> List[Tuple[float, float]]:
+        """Coordinates of the nodes of the street along the section."""
+        return [tuple(coordinates) for coordinates in self.coordinates[section.first:section.last + 1]]
+
+    def order_in_section(self, section: Section,
+                         list_coordinates: Sequence[Tuple[float, float]]) -> Dict[Tuple, int]:
+        """Position of the points of a section, by distance in meters from its start.
+
+        return position: keys are the coordinates, values are their position from 1
+        """
+        distances = np.hypot(*to_local_xy(np.array(list_coordinates, dtype=float).reshape(-1, 2),
+                                          section.start).T)
+        return {tuple(list_coordinates[index]): position
+                for position, index in enumerate(np.argsort(distances, kind="stable"), 1)}
+
+    def merge(self, section_1: Section, section_2: Section) -> List:
+        """Legacy [start_name, end_name, start, end] of the street between two sections."""
+        first, last = sorted((section_1, section_2), key=lambda section: section.index)
+        return [first.start_name, last.end_name, first.start, last.end]
+
+
+__all__ = ["Section", "StreetGraph"]
@@ -1,19 +1,20 @@
 """Useful functions."""
 import logging
-from copy import deepcopy
+from functools import lru_cache
 from operator import itemgetter
-from typing import Dict, List, Tuple
-
-import folium
-import pandas as pd
-from branca.element import Figure
-from bs4 import BeautifulSoup
-import unicodedata
-from numpy import array, cross, dot
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from numpy import array, zeros
 from numpy.linalg import norm
 
+from .. import metrics
 from ..API.get_nearest_street import get_nearest_street
 from ..API.get_ways_from_node import get_ways_from_node
+from .geometry import nearest_segments, segment_distances, to_local_xy
+from .street_graph import StreetGraph
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
@@ -62,22 +63,29 @@ def get_road_sections(
 
     return sections_list : List[str,str, Tuple(float, float), Tuple(float, float)]
     """
-    new_intersection_list = deepcopy(intersection_list)
-    sections_list = list()
-    new_names_list = list()
-    new_coordinates_list = list()
-    for i in range(len(new_intersection_list)):
-        if len(new_intersection_list[i][0]) > 1:
-            if road_name in new_intersection_list[i][0]:
-                index_road_name = new_intersection_list[i][0].index(road_name)
-                new_intersection_list[i][0].pop(index_road_name)
-                new_node_name = '/'.join(new_intersection_list[i][0])
-                new_names_list.append(new_node_name)
-                new_coordinates_list.append(new_intersection_list[i][1])
-    for i in range(1, len(new_names_list)):
-        sections_list.append([new_names_list[i - 1], new_names_list[i],
-                              new_coordinates_list[i - 1], new_coordinates_list[i]])
-    return sections_list
+    intersections = [('/'.join(name for name in names if name != road_name), coordinates)
+                     for names, coordinates in intersection_list
+                     if len(names) > 1 and road_name in names and coordinates is not None]
+    return [[name_1, name_2, coordinates_1, coordinates_2]
+            for (name_1, coordinates_1), (name_2, coordinates_2) in zip(intersections, intersections[1:])]
+
+
+@metrics.timed("street_graph")
+def get_street_graph(
+        way: Dict,
+) -> StreetGraph:
+    """Build the street graph of a way, once per way.
+
+    :param way: way with its id, nodes and name tag, as given by get_nearest_street.
+
+    return graph: intersections and sections of the street
+    """
+    return _street_graph(way['id'], way['tags']['name'], tuple(way['nodes']))
+
+
+@lru_cache(maxsize=256)
+def _street_graph(id_way: int, road_name: str, list_node: Tuple[int]) -> StreetGraph:
+    return StreetGraph(road_name, list_node, get_ways_from_node(list_node=list(list_node)))
 
 
 def conversion_list_dict(
@@ -85,6 +93,9 @@ def conversion_list_dict(
 ) -> Dict[Tuple, List]:
     """Convert sections list to a dictionnary.
 
+    Sections bounded by the same street names collide, a StreetGraph keeps
+    them apart.
+
     :param sections_list: Output of get_road_sections.
 
     return sections_dict
@@ -104,29 +115,23 @@ def distance_from_segment(
     :param reference: point.
     :param coordinates_dict: keys are the name of the streets
     that bound the segment, values are list of tuples that
-    correspond to the coordinates of the crossings.
+    correspond to the coordinates of the crossings. Or a StreetGraph.
 
     return distance_dict: keys are the name of the streets
-    that bound a segment, values are the computed distance
-    between the point and the associated segment
+    that bound a segment (the sections of a StreetGraph), values are
+    the computed distance in meters between the point and the associated segment
     """
     logging.info("Computing shortest segment")
-    p3 = array(reference)
-    distances_dict = dict()
-    for key, (p1, p2) in coordinates_dict.items():
-        p1, p2 = array(p1), array(p2)
-        distance = norm(cross(p2 - p1, p3 - p1))
-        # check if the nearest point is in the segment (p1,p2)
-        if dot(p3 - p1, p3 - p2) < 0:
-            distances_dict[key] = distance
-    if not bool(distances_dict):  # if dict is empty
-        for key, (p1, p2) in coordinates_dict.items():
-            p1, p2 = array(p1), array(p2)
-            distance_p1, distance_p2 = norm(
-                reference - p1), norm(reference - p2)
-            distance = min(distance_p1, distance_p2)
-            distances_dict[key] = distance
-    return distances_dict
+    if isinstance(coordinates_dict, StreetGraph):
+        return dict(zip(coordinates_dict.sections, coordinates_dict.distances(reference).tolist()))
+    if not coordinates_dict:
+        return dict()
+    starts, ends = zip(*((p1, p2) for p1, p2 in coordinates_dict.values()))
+    # The point is the origin of the local projection.
+    distances = segment_distances(zeros((1, 2)),
+                                  to_local_xy(array(starts), reference),
+                                  to_local_xy(array(ends), reference))[0]
+    return dict(zip(coordinates_dict.keys(), distances.tolist()))
 
 
 def find_optimal(
@@ -142,148 +147,188 @@ def find_optimal(
     return key_min
 
 
-def visualisation_sections(
-    list_data: List[Tuple],
+def find_optimal_batch(
+        list_coordinates: List[Tuple[float, float]],
+        coordinates_dict: Dict[Tuple, List],
+) -> List[Tuple[str]]:
+    """Find the optimal segment of many points at once.
+
+    Same result as find_optimal(distance_from_segment(point, coordinates_dict))
+    for every point, computed for all (point, segment) pairs in one pass.
+
+    :param list_coordinates: points to assign.
+    :param coordinates_dict: output of conversion_list_dict, or a StreetGraph.
+
+    return keys: name of the streets that bound the optimal segment of each
+    point (the sections of a StreetGraph), None without segments
+    """
+    if isinstance(coordinates_dict, StreetGraph):
+        return coordinates_dict.nearest_sections(list_coordinates)
+    if not coordinates_dict:
+        return [None] * len(list_coordinates)
+    keys = list(coordinates_dict.keys())
+    starts, ends = zip(*((p1, p2) for p1, p2 in coordinates_dict.values()))
+    indices, _ = nearest_segments(list_coordinates, starts, ends)
+    return [keys[index] for index in indices]
+
+
+SECTION_COLORS = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'darkblue', 'darkgreen',
+                  'cadetblue', 'deeppink', 'steelblue', 'olive', 'gray', 'black']
+
+# Points are drawn client side by the cluster layer from a compact array.
+POINT_CALLBACK = """function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {color: row[2], fillColor: row[2], fillOpacity: 0.8, radius: 7});
+    marker.bindTooltip(row[3]);
+    return marker;
+};"""
+
+
+@metrics.timed("map")
+def render_sections(
+    sections: List[Tuple],
+    points: List[Tuple],
     map_filename: str,
 ) -> None:
-    """Save the HTML code of the map visualisation. Every tuple correspond to a different point.
-    :param list_data: list of tuples which contains
-            in position 0: coordinates of the point as a tuple (latitude,longitude),
-            in position 1: section of the road related with the point (outpput of find_optimal) with the type List['str','str',tuple,tuple] as the output of get_road_section,
-            in position 2: list of all the node of a street (output of get_ways_from_node).
+    """Save the HTML code of a map of sections and points.
+
+    All the sections are drawn by one GeoJSON layer and all the points by
+    one clustered layer, both on a canvas, so the size of the map and the
+    time to draw it grow slowly with the number of points.
+
+    :param sections: list of (section, graph) tuples, each section is drawn once.
+    :param points: list of ((latitude, longitude), section, graph) tuples,
+    a point takes the color of its section.
     :param map_filename: name of the map HTML code file.
     return None: the function just save the code with the correct path.
     """
+    # folium and branca take a fraction of a second to import, only maps need them.
+    import folium  # pylint: disable=import-outside-toplevel
+    from branca.element import Figure  # pylint: disable=import-outside-toplevel
+    from folium.plugins import FastMarkerCluster  # pylint: disable=import-outside-toplevel
+
+    colors = dict()
+    features = list()
+    for section, graph in sections:
+        key = (id(graph), section.index)
+        if key in colors:
+            continue
+        colors[key] = SECTION_COLORS[len(colors) % len(SECTION_COLORS)]
+        features.append({
+            "type": "Feature",
+            "properties": {"name": f"{graph.road_name} : {section.start_name} - {section.end_name}",
+                           "color": colors[key]},
+            "geometry": {"type": "LineString",
+                         "coordinates": [[longitude, latitude] for latitude, longitude
+                                         in graph.section_coordinates(section)]}})
+    rows = [[latitude, longitude, colors[(id(graph), section.index)],
+             f"Point d'interet ({latitude}, {longitude})"]
+            for (latitude, longitude), section, graph in points]
 
     figure = Figure(height=550, width=750)
     map_display = folium.Map(
-        location=[48.896205, 2.260466], tiles='cartodbpositron', zoom_start=14)
+        location=[48.896205, 2.260466], tiles='cartodbpositron', zoom_start=14, prefer_canvas=True)
     figure.add_child(map_display)
-    colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred', 'beige', 'darkblue', 'darkgreen',
-              'cadetblue', 'darkpurple', 'white', 'pink', 'lightblue', 'lightgreen', 'gray', 'black', 'lightgray']
-    color_index = 0
-    for data in list_data:
-        latitude, longitude = data[0]
-        section = data[1]
-        list_node_street = data[2]
-        begin_coordinates = section[2]
-        end_coordinates = section[3]
-        coordinates = [node[1] for node in list_node_street]
-        coordinates = coordinates[coordinates.index(
-            begin_coordinates):coordinates.index(end_coordinates) + 1]
-        feature_group = folium.FeatureGroup(
-            f"Tronçon Point ({latitude}, {longitude})")
-        folium.vector_layers.PolyLine(coordinates, popup=f'<b>Tronçon Point ({latitude}, {longitude})</b>',
-                                      tooltip=f'Tronçon Point ({latitude}, {longitude})', color=colors[color_index % len(colors)], weight=10).add_to(feature_group)
-        folium.Marker(location=[latitude, longitude], popup='Custom Marker 1', tooltip=f'<strong>Point d\'interet ({latitude}, {longitude}) </strong>', icon=folium.Icon(
-            color=colors[color_index % len(colors)], icon='none')).add_to(map_display)
-        color_index += 1
-        feature_group.add_to(map_display)
+    folium.GeoJson({"type": "FeatureCollection", "features": features}, name='Tronçons',
+                   style_function=lambda feature: {'color': feature['properties']['color'], 'weight': 10},
+                   tooltip=folium.GeoJsonTooltip(fields=['name'], labels=False)).add_to(map_display)
+    FastMarkerCluster(rows, callback=POINT_CALLBACK, name='Points',
+                      options={'disableClusteringAtZoom': 17}).add_to(map_display)
+    if rows:
+        latitudes = [row[0] for row in rows]
+        longitudes = [row[1] for row in rows]
+        map_display.fit_bounds([[min(latitudes), min(longitudes)], [max(latitudes), max(longitudes)]],
+                               max_zoom=17)
     folium.LayerControl().add_to(map_display)
     map_display.save(map_filename)
     return None
 
-def visualisation_sections_multi(
+
+def visualisation_sections(
     list_data: List[Tuple],
     map_filename: str,
 ) -> None:
     """Save the HTML code of the map visualisation. Every tuple correspond to a different point.
     :param list_data: list of tuples which contains
             in position 0: coordinates of the point as a tuple (latitude,longitude),
-            in position 1: section of the road related with the point (outpput of find_optimal) with the type List['str','str',tuple,tuple] as the output of get_road_section,
-            in position 2: list of all the node of a street (output of get_ways_from_node).
+            in position 1: section of the road related with the point (output of find_optimal),
+            in position 2: street graph of the section.
     :param map_filename: name of the map HTML code file.
     return None: the function just save the code with the correct path.
     """
+    render_sections([(section, graph) for _, section, graph in list_data],
+                    [(point, section, graph) for point, section, graph in list_data],
+                    map_filename)
+    return None
 
-    figure = Figure(height=550, width=750)
-    map_display = folium.Map(
-        location=[48.896205, 2.260466], tiles='cartodbpositron', zoom_start=14)
-    figure.add_child(map_display)
-    colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred', 'beige', 'darkblue', 'darkgreen',
-              'cadetblue', 'darkpurple', 'white', 'pink', 'lightblue', 'lightgreen', 'gray', 'black', 'lightgray']
-    color_index = 0
-    for data in list_data:
-        latitude1, longitude1 = data[0]
-        latitude2, longitude2 = data[1]
-        section = data[2]
-        list_node_street = data[3]
-        begin_coordinates = section[2]
-        end_coordinates = section[3]
-        coordinates = [node[1] for node in list_node_street]
-        coordinates = coordinates[coordinates.index(
-            begin_coordinates):coordinates.index(end_coordinates) + 1]
-        feature_group = folium.FeatureGroup(
-            f"Tronçon Point ({latitude1}, {longitude1})")
-        folium.vector_layers.PolyLine(coordinates, popup=f'<b>Tronçon Point ({latitude1}, {longitude1})</b>',
-                                      tooltip=f'Tronçon Point ({latitude1}, {longitude1})', color=colors[color_index % len(colors)], weight=10).add_to(feature_group)
-        folium.Marker(location=[latitude1, longitude1], popup='Custom Marker 1', tooltip=f'<strong>Point d\'interet ({latitude1}, {longitude1}) </strong>', icon=folium.Icon(
-            color=colors[color_index % len(colors)], icon='none')).add_to(map_display)
-        folium.Marker(location=[latitude2, longitude2], popup='Custom Marker 1', tooltip=f'<strong>Point d\'interet ({latitude2}, {longitude2}) </strong>', icon=folium.Icon(
-            color=colors[color_index % len(colors)], icon='none')).add_to(map_display)
-        color_index += 1
-        feature_group.add_to(map_display)
-    folium.LayerControl().add_to(map_display)
-    map_display.save(map_filename)
+def visualisation_sections_multi(
+    list_data: List[Tuple],
+    map_filename: str,
+) -> None:
+    """Save the HTML code of the map visualisation. Every tuple correspond to a different point.
+    :param list_data: list of tuples which contains
+            in position 0: coordinates of the first point as a tuple (latitude,longitude),
+            in position 1: coordinates of the second point as a tuple (latitude,longitude),
+            in position 2: section of the road related with one of the points (output of find_optimal),
+            in position 3: street graph of the section.
+    :param map_filename: name of the map HTML code file.
+    return None: the function just save the code with the correct path.
+    """
+    # A pair spanning two sections has one tuple per section, draw its points once.
+    points = dict()
+    for point_1, point_2, section, graph in list_data:
+        for point in (point_1, point_2):
+            points.setdefault(point, (point, section, graph))
+    render_sections([(section, graph) for _, _, section, graph in list_data],
+                    list(points.values()), map_filename)
     return None
 
 
-def generate_results(
-    results_dataframe: pd.core.frame.DataFrame,
-    layout_filename: str,
+def map_fragments(
     map_filename: str,
-    results_filename: str,
-) -> None:
-    """ Save the HTML file to display the results with the website theme.
+) -> Dict[str, str]:
+    """Split a map HTML file saved by folium into the fragments of a page.
+
+    :param map_filename: Path to get the map HTML code file.
+
+    return fragments: map_head (inside <head>), map_body (inside <body>) and
+    map_script (the script after <body>)
+    """
+    with open(map_filename, 'r') as map_file:
+        html_map = map_file.read()
+    head, _, rest = html_map.partition('</head>')
+    body, _, script = rest.partition('</body>')
+    return {'map_head': head.partition('<head>')[2],
+            'map_body': body.partition('<body>')[2],
+            'map_script': script.rpartition('</html>')[0]}
+
+
+@metrics.timed("results_page")
+def results_fragments(
+    results_dataframe: "pd.DataFrame",
+    map_filename: str,
+) -> Dict[str, str]:
+    """Precompute the fragments of the results page, inserted by the results.html template.
 
     :param results_dataframe: Output of the pipeline as a pandas DataFrame.
-    :param layout_filename: Path to get the layout HTML code file.
     :param map_filename: Path to get the map HTML code file.
-    :param results_filename: Path to save the results HTML code file.
 
-    return None: the function just save the HTML code in a file.
+    return fragments: map fragments (see map_fragments), table and help_message
     """
-    layout = open(layout_filename, 'r')
-    html_layout = layout.read()
-    soup_layout = BeautifulSoup(html_layout)
-    head_layout = soup_layout.find('head')
-    footer_layout = soup_layout.find('footer')
-    navigation = soup_layout.find('nav')
-    scripts_layout = soup_layout.findAll('script')
-    map_display = open(map_filename, 'r')
-    html_map = map_display.read()
-    soup_map = BeautifulSoup(html_map)
-    head_map = soup_map.find('head')
-    body_map = soup_map.find('body')
-    scripts_map = soup_map.findAll('script')
-    dataframe_html = results_dataframe.to_html(index=False, classes='striped')
-    help_message = ''
+    fragments = map_fragments(map_filename)
+    fragments['table'] = results_dataframe.to_html(index=False, classes='striped')
     if 'latitude' in results_dataframe.keys():# uni
-        for row in range(len(results_dataframe)):
-            help_message += f"""<li>votre point {row+1} aux coordonnées ({results_dataframe['latitude'][row]},{results_dataframe['longitude'][row]}) est le point {results_dataframe['num_arbre'][row]} dans {results_dataframe['rue'][row]} entre {results_dataframe['debut_troncon'][row]} et {results_dataframe['fin_troncon'][row]}</li>"""
-        help_message = '<div><ul id="help_message">' + help_message + '</ul></div>'
+        items = [f"""<li>votre point {row+1} aux coordonnées ({results_dataframe['latitude'][row]},{results_dataframe['longitude'][row]}) est le point {results_dataframe['num_arbre'][row]} dans {results_dataframe['rue'][row]} entre {results_dataframe['debut_troncon'][row]} et {results_dataframe['fin_troncon'][row]}</li>"""
+                 for row in range(len(results_dataframe))]
+        help_message = '<div><ul id="help_message">' + ''.join(items) + '</ul></div>'
     elif 'latitude1'in results_dataframe.keys(): # multi
-        for row in range(len(results_dataframe)):
-            help_message += f"""<li>Vos points aux coordonnées ({results_dataframe['latitude1'][row]},{results_dataframe['longitude1'][row]}) et {results_dataframe['latitude2'][row]},{results_dataframe['longitude2'][row]} se trouve entre {results_dataframe['debut_troncon'][row]} et {results_dataframe['fin_troncon'][row]}</li>"""
-        help_message = '<div><ul id="help_message">' + help_message + '</ul></div>'
+        items = [f"""<li>Vos points aux coordonnées ({results_dataframe['latitude1'][row]},{results_dataframe['longitude1'][row]}) et {results_dataframe['latitude2'][row]},{results_dataframe['longitude2'][row]} se trouve entre {results_dataframe['debut_troncon'][row]} et {results_dataframe['fin_troncon'][row]}</li>"""
+                 for row in range(len(results_dataframe))]
+        help_message = '<div><ul id="help_message">' + ''.join(items) + '</ul></div>'
     else:
         help_message = '<div><p> Impossible afficher le texte</p></div>'
-    head = str(head_layout)[:-7] + str(head_map)[6:]
-    body = '<body>' + str(navigation) + '<div class="row" id = "div_map">' + str(body_map)[
-        6:-7]+ '</div>' + '<div>' + dataframe_html + '</div>' + help_message + str(footer_layout) + '</body>'
-
-    message = '<html>' + head + body
-    f = open(results_filename, 'w')
-    f.write(message)
-    for script in scripts_layout:
-        f.write(str(script))
-        message = message + str(script)
-    for script in scripts_map:
-        f.write(str(script))
-        message =  message + str(script)
-    f.close()
-    message_html = ''.join((c for c in unicodedata.normalize('NFD', message) if unicodedata.category(c) != 'Mn')) # Remove accent
-    return message_html
+    fragments['help_message'] = help_message
+    return fragments
 
 
 def get_order_in_segment(
@@ -323,31 +368,14 @@ def merge_sections(
 
     :param section_1:first section to merge.
     :param section_2:second section to merge.
-    :param list_sections: output of get_road_sections.
+    :param list_sections: output of get_road_sections, or the sections of a StreetGraph.
     return merge_sections: names of the street that bound the segment, coordinates of the node
     of the bounds of the segment
     """
     if (section_1 in list_sections) and (section_2 in list_sections):
-        is_seen = False
-        merge_sections = [0,0,0,0]
         if section_1 == section_2:
             return section_1
-        for x in list_sections:
-            if x == section_1:
-                if is_seen:
-                    merge_sections[1] = section_1[1]
-                    merge_sections[3] = section_1[3]
-                else:
-                    merge_sections[0] = section_1[0]
-                    merge_sections[2] = section_1[2]
-                is_seen = not is_seen
-            elif x == section_2:
-                if is_seen:
-                    merge_sections[1] = section_2[1]
-                    merge_sections[3] = section_2[3]
-                else:
-                    merge_sections[0] = section_2[0]
-                    merge_sections[2] = section_2[2]
-                is_seen = not is_seen
-        return merge_sections
+        first, last = sorted((list_sections.index(section_1), list_sections.index(section_2)))
+        return [list_sections[first][0], list_sections[last][1],
+                list_sections[first][2], list_sections[last][3]]
     return 'merge impossible'
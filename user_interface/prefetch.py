@@ -0,0 +1,11 @@
+"""Warm the cache for a survey area before processing its points.
+
+    python user_interface/prefetch.py --commune Courbevoie
+    python user_interface/prefetch.py --bbox 48.88 2.23 48.91 2.27
+"""
+import sys
+
+from package.prefetch import main
+
+if __name__ == "__main__":
+    sys.exit(main())